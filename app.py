@@ -1,14 +1,56 @@
-from flask import Flask, request, jsonify, render_template
-from flask_socketio import SocketIO
+import os
+from flask import Flask, request, jsonify, render_template, redirect, send_file, Response
+from flask_socketio import SocketIO, join_room
 from flask_cors import CORS
-from app.controller.agent import create_agent
+from app.controller.startup import Deferred, LAZY_START, WARMUP, wait_for_port, warm_up
+from app.controller.preview import LiveReload, PREVIEW_LIVE_RELOAD, PREVIEW_ROOM, RELOAD_EVENT, etag_matches, preview_cache
+from app.tools.command_runner import start_command_workers
 
 app = Flask(__name__)
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', async_handlers=True)
 
-# Create agent with socketio instance
-agent = create_agent(socketio)
+# `python app.py` runs with debug=True, whose reloader imports this module in a
+# watcher process that never serves; only the serving process starts workers
+SERVING = __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+
+def build_session_manager():
+    # Imported here so AGENT_LAZY_START can defer LangChain and the model client
+    from app.controller.sessions import SessionManager
+
+    manager = SessionManager(socketio)
+    manager.start()
+    return manager
+
+# Each Socket.IO session gets its own executor and memory on top of the shared agent
+session_manager = Deferred(build_session_manager)
+if SERVING:
+    if not LAZY_START:
+        session_manager.get()
+    start_command_workers()
+
+def build_job_queue():
+    from app.controller.jobs import JobQueue, JobWorkerPool, JOB_WORKERS
+
+    queue = JobQueue()
+    # Workers resume jobs left running by a previous server once their lease runs out
+    JobWorkerPool(queue.url, JOB_WORKERS).start()
+    return queue
+
+# Durable queue behind the batch job API, drained by AGENT_JOB_WORKERS worker processes
+job_queue = Deferred(build_job_queue)
+if SERVING and LAZY_START:
+    socketio.start_background_task(job_queue.get)
+elif SERVING:
+    job_queue.get()
+
+# Tell open preview pages to reload when the agent changes a project file
+if SERVING and PREVIEW_LIVE_RELOAD:
+    LiveReload(lambda payload: socketio.emit(RELOAD_EVENT, payload, to=PREVIEW_ROOM)).start()
+
+def warm_up_when_listening(host, port):
+    if wait_for_port(host, port):
+        print(f"Warm-up: {warm_up(session_manager.get())}")
 
 @app.route('/')
 def index():
@@ -18,32 +60,146 @@ def index():
 def test():
     return jsonify({'message': 'Hello World!'})
 
-def stream_agent_response(input_text):
-    try:
-        # The agent will now handle streaming through callbacks
-        response = agent.invoke(
-            {"input": input_text}
-        )
-    except Exception as e:
-        socketio.emit('agent_update', {
-            'type': 'error',
-            'data': {
-                'error': str(e)
-            }
-        })
+@app.route('/api/llm-cache', methods=['GET'])
+def llm_cache_stats():
+    from app.controller.llm_cache import get_response_cache
+
+    cache = get_response_cache()
+    if cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **cache.stats()})
+
+@app.route('/api/parse-stats', methods=['GET'])
+def parse_stats_view():
+    from app.controller.parsing import parse_stats
+
+    return jsonify(parse_stats.snapshot())
+
+@app.route('/api/router-stats', methods=['GET'])
+def router_stats_view():
+    from app.controller.router import router_stats
+
+    return jsonify(router_stats.snapshot())
+
+@app.route('/api/llm-backends', methods=['GET'])
+def llm_backends_view():
+    from app.controller.agent import backend_stats
+
+    return jsonify(backend_stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics_view():
+    from app.controller.metrics import registry as metrics_registry
+
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_jobs():
+    """Queue a batch: {"inputs": ["build landing page for X", ...]} or {"input": "..."}."""
+    from app.controller.jobs import MAX_BATCH_SIZE
+
+    data = request.get_json(silent=True) or {}
+    inputs = data.get('inputs') or ([data['input']] if data.get('input') else [])
+    if not inputs or not all(isinstance(text, str) and text.strip() for text in inputs):
+        return jsonify({'error': 'Expected "inputs", a list of task descriptions'}), 400
+    if len(inputs) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} jobs per request'}), 400
+    batch_id, job_ids = job_queue.get().submit(inputs, data.get('batch'))
+    return jsonify({'batch': batch_id, 'jobs': job_ids}), 202
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    jobs = job_queue.get().list(request.args.get('batch'), request.args.get('status'),
+                                min(max(request.args.get('limit', 100, type=int), 1), 1000))
+    return jsonify({'jobs': [job.to_dict() for job in jobs]})
+
+@app.route('/api/jobs/stats', methods=['GET'])
+def job_stats():
+    return jsonify(job_queue.get().stats())
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get().get(job_id)
+    if job is None:
+        return jsonify({'error': 'No such job'}), 404
+    return jsonify(job.to_dict(details=True))
+
+@app.route('/preview', defaults={'path': ''})
+@app.route('/preview/', defaults={'path': ''})
+@app.route('/preview/<path:path>')
+def preview(path):
+    """Serve PROJECTS_DIR; unchanged files cost a 304, compressible ones come from the variant cache."""
+    if request.path == '/preview' or preview_cache.needs_slash(path):
+        return redirect(request.path + '/')
+    result = preview_cache.lookup(path, request.headers.get('Accept-Encoding', ''))
+    if result is None:
+        return jsonify({'error': 'Not found'}), 404
+    if etag_matches(request.headers.get('If-None-Match'), result.etag):
+        return Response(status=304, headers=result.headers())
+    if result.body is not None:
+        return Response(result.body, headers=result.headers(), content_type=result.content_type)
+    # Uses the server's wsgi.file_wrapper, i.e. sendfile where the server supports it
+    response = send_file(result.path, mimetype=result.content_type, conditional=False, etag=False, max_age=None)
+    response.headers.update(result.headers())
+    return response
+
+@app.route('/api/preview-stats', methods=['GET'])
+def preview_stats_view():
+    return jsonify(preview_cache.stats())
+
+@app.route('/api/conversations/stats', methods=['GET'])
+def conversation_stats():
+    from app.controller.conversations import get_conversation_store
+
+    store = get_conversation_store()
+    if store is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **store.stats()})
+
+@app.route('/api/conversations/<conversation>', methods=['GET'])
+def conversation_history(conversation):
+    """A page of stored messages, newest first, with each agent turn's steps; ?before=<seq> for older ones."""
+    from app.controller.conversations import get_conversation_store, HISTORY_PAGE_SIZE
+
+    store = get_conversation_store()
+    history = store.history(conversation, request.args.get('before', type=int),
+                            min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), 500)) if store else None
+    if history is None:
+        return jsonify({'error': 'No such conversation'}), 404
+    return jsonify(history)
+
+@socketio.on('preview_subscribe')
+def handle_preview_subscribe():
+    join_room(PREVIEW_ROOM)
+
+def conversation_id(data):
+    """The stored conversation a client asks to continue, if it names a sensible one."""
+    conversation = data.get('conversation')
+    if isinstance(conversation, str) and 0 < len(conversation) <= 64:
+        return conversation
+    return None
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    if session_manager.loaded:
+        session_manager.get().end_session(request.sid)
 
 @socketio.on('user_input')
 def handle_user_input(data):
     """Handle incoming WebSocket messages"""
     if isinstance(data, dict) and 'input' in data:
-        stream_agent_response(data['input'])
+        manager = session_manager.get()
+        if not manager.submit(request.sid, data['input'], conversation_id(data)):
+            manager.emit_error(request.sid, 'Too many pending requests, please wait for the current one to finish')
     else:
         socketio.emit('agent_update', {
             'type': 'error',
             'data': {
                 'error': 'Invalid input format'
             }
-        })
+        }, to=request.sid)
 
 if __name__ == '__main__':
+    if WARMUP and SERVING:
+        socketio.start_background_task(warm_up_when_listening, '0.0.0.0', 9000)
     socketio.run(app, debug=True, host='0.0.0.0', port=9000)
\ No newline at end of file
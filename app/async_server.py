@@ -0,0 +1,241 @@
+"""
+asyncio serving mode: the same Socket.IO protocol and routes as app.py, on
+aiohttp with python-socketio's AsyncServer.
+
+Agent runs are coroutines (AgentExecutor.ainvoke) instead of threads, so the
+number of concurrent sessions is bounded by the model server rather than by
+a thread pool. Run with:
+
+    python -m app.async_server
+
+The threaded Flask server (python app.py) is still the default.
+"""
+import os
+import asyncio
+
+import socketio
+from aiohttp import web
+
+from app.controller.async_sessions import AsyncSessionManager
+from app.controller.llm_cache import get_response_cache
+from app.controller.parsing import parse_stats
+from app.controller.router import router_stats
+from app.controller.agent import backend_stats
+from app.controller.metrics import registry as metrics_registry
+from app.controller.startup import WARMUP, wait_for_port, warm_up
+from app.controller.conversations import get_conversation_store, HISTORY_PAGE_SIZE
+from app.controller.jobs import JobQueue, JobWorkerPool, JOB_WORKERS, MAX_BATCH_SIZE
+from app.controller.preview import LiveReload, PREVIEW_LIVE_RELOAD, PREVIEW_ROOM, RELOAD_EVENT, etag_matches, preview_cache
+from app.tools.command_runner import start_command_workers
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*')
+app = web.Application()
+sio.attach(app)
+
+session_manager = AsyncSessionManager(sio)
+job_queue = JobQueue()
+
+
+async def index(request):
+    return web.FileResponse(os.path.join(TEMPLATES_DIR, 'index.html'))
+
+
+async def test(request):
+    return web.json_response({'message': 'Hello World!'})
+
+
+async def llm_cache_stats(request):
+    cache = get_response_cache()
+    if cache is None:
+        return web.json_response({'enabled': False})
+    return web.json_response({'enabled': True, **cache.stats()})
+
+
+async def parse_stats_view(request):
+    return web.json_response(parse_stats.snapshot())
+
+
+async def router_stats_view(request):
+    return web.json_response(router_stats.snapshot())
+
+
+async def llm_backends_view(request):
+    return web.json_response(backend_stats())
+
+
+async def metrics_view(request):
+    return web.Response(text=metrics_registry.render(), content_type='text/plain', charset='utf-8')
+
+
+async def submit_jobs(request):
+    """Queue a batch: {"inputs": ["build landing page for X", ...]} or {"input": "..."}."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    inputs = data.get('inputs') or ([data['input']] if data.get('input') else [])
+    if not inputs or not all(isinstance(text, str) and text.strip() for text in inputs):
+        return web.json_response({'error': 'Expected "inputs", a list of task descriptions'}, status=400)
+    if len(inputs) > MAX_BATCH_SIZE:
+        return web.json_response({'error': f'At most {MAX_BATCH_SIZE} jobs per request'}, status=400)
+    batch_id, job_ids = await asyncio.to_thread(job_queue.submit, inputs, data.get('batch'))
+    return web.json_response({'batch': batch_id, 'jobs': job_ids}, status=202)
+
+
+async def list_jobs(request):
+    try:
+        limit = min(max(int(request.query.get('limit', 100)), 1), 1000)
+    except ValueError:
+        return web.json_response({'error': 'limit must be an integer'}, status=400)
+    jobs = await asyncio.to_thread(job_queue.list, request.query.get('batch'), request.query.get('status'), limit)
+    return web.json_response({'jobs': [job.to_dict() for job in jobs]})
+
+
+async def job_stats(request):
+    return web.json_response(await asyncio.to_thread(job_queue.stats))
+
+
+async def get_job(request):
+    job = await asyncio.to_thread(job_queue.get, request.match_info['job_id'])
+    if job is None:
+        return web.json_response({'error': 'No such job'}, status=404)
+    return web.json_response(job.to_dict(details=True))
+
+
+class PreviewFileResponse(web.FileResponse):
+    """FileResponse (sendfile) that keeps the preview's content-hash ETag instead of its mtime-based one."""
+
+    def __init__(self, path, etag, **kwargs):
+        super().__init__(path, **kwargs)
+        self.headers['ETag'] = etag
+
+    @web.FileResponse.etag.setter
+    def etag(self, value):
+        pass
+
+
+async def preview(request):
+    """Serve PROJECTS_DIR; unchanged files cost a 304, compressible ones come from the variant cache."""
+    path = request.match_info.get('path', '')
+    if request.path == '/preview' or await asyncio.to_thread(preview_cache.needs_slash, path):
+        raise web.HTTPFound(request.path + '/')
+    result = await asyncio.to_thread(preview_cache.lookup, path, request.headers.get('Accept-Encoding', ''))
+    if result is None:
+        return web.json_response({'error': 'Not found'}, status=404)
+    if etag_matches(request.headers.get('If-None-Match'), result.etag):
+        return web.Response(status=304, headers=result.headers())
+    if result.body is not None:
+        return web.Response(body=result.body, headers={**result.headers(), 'Content-Type': result.content_type})
+    headers = result.headers()
+    return PreviewFileResponse(result.path, headers.pop('ETag'),
+                               headers={**headers, 'Content-Type': result.content_type})
+
+
+async def conversation_stats(request):
+    store = get_conversation_store()
+    if store is None:
+        return web.json_response({'enabled': False})
+    return web.json_response({'enabled': True, **await asyncio.to_thread(store.stats)})
+
+
+async def conversation_history(request):
+    """A page of stored messages, newest first, with each agent turn's steps; ?before=<seq> for older ones."""
+    store = get_conversation_store()
+    try:
+        before = int(request.query['before']) if 'before' in request.query else None
+        limit = min(max(int(request.query.get('limit', HISTORY_PAGE_SIZE)), 1), 500)
+    except ValueError:
+        return web.json_response({'error': 'before and limit must be integers'}, status=400)
+    history = await asyncio.to_thread(store.history, request.match_info['conversation'], before, limit) \
+        if store else None
+    if history is None:
+        return web.json_response({'error': 'No such conversation'}, status=404)
+    return web.json_response(history)
+
+
+async def preview_stats_view(request):
+    return web.json_response(preview_cache.stats())
+
+
+app.router.add_get('/', index)
+app.router.add_route('*', '/api', test)
+app.router.add_get('/api/llm-cache', llm_cache_stats)
+app.router.add_get('/api/parse-stats', parse_stats_view)
+app.router.add_get('/api/router-stats', router_stats_view)
+app.router.add_get('/api/llm-backends', llm_backends_view)
+app.router.add_get('/metrics', metrics_view)
+app.router.add_post('/api/jobs', submit_jobs)
+app.router.add_get('/api/jobs', list_jobs)
+app.router.add_get('/api/jobs/stats', job_stats)
+app.router.add_get('/api/jobs/{job_id}', get_job)
+app.router.add_get('/api/conversations/stats', conversation_stats)
+app.router.add_get('/api/conversations/{conversation}', conversation_history)
+app.router.add_get('/preview', preview)
+app.router.add_get('/preview/{path:.*}', preview)
+app.router.add_get('/api/preview-stats', preview_stats_view)
+
+
+HOST, PORT = '0.0.0.0', 9000
+
+
+def warm_up_when_listening():
+    if wait_for_port(HOST, PORT):
+        print(f"Warm-up: {warm_up(session_manager)}")
+
+
+async def on_startup(app):
+    session_manager.start()
+    start_command_workers()
+    JobWorkerPool(job_queue.url, JOB_WORKERS).start()
+    if PREVIEW_LIVE_RELOAD:
+        loop = asyncio.get_running_loop()
+        LiveReload(lambda payload: asyncio.run_coroutine_threadsafe(
+            sio.emit(RELOAD_EVENT, payload, room=PREVIEW_ROOM), loop)).start()
+    if WARMUP:
+        # on_startup runs before the site binds; the thread waits for it
+        app['warmup'] = asyncio.create_task(asyncio.to_thread(warm_up_when_listening))
+
+app.on_startup.append(on_startup)
+
+
+@sio.on('disconnect')
+async def handle_disconnect(sid):
+    session_manager.end_session(sid)
+
+
+@sio.on('preview_subscribe')
+async def handle_preview_subscribe(sid):
+    await sio.enter_room(sid, PREVIEW_ROOM)
+
+
+def conversation_id(data):
+    """The stored conversation a client asks to continue, if it names a sensible one."""
+    conversation = data.get('conversation')
+    if isinstance(conversation, str) and 0 < len(conversation) <= 64:
+        return conversation
+    return None
+
+
+@sio.on('user_input')
+async def handle_user_input(sid, data):
+    """Handle incoming WebSocket messages"""
+    if isinstance(data, dict) and 'input' in data:
+        if not session_manager.submit(sid, data['input'], conversation_id(data)):
+            await session_manager.emit_error(sid, 'Too many pending requests, please wait for the current one to finish')
+    else:
+        await sio.emit('agent_update', {
+            'type': 'error',
+            'data': {
+                'error': 'Invalid input format'
+            }
+        }, to=sid)
+
+
+def main():
+    web.run_app(app, host=HOST, port=PORT)
+
+
+if __name__ == '__main__':
+    main()
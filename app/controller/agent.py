@@ -1,31 +1,103 @@
 import os
 import sys
 import warnings
-from langchain_openai import ChatOpenAI
-from langchain.agents import initialize_agent, AgentType
+import weakref
+import threading
+import httpx
+from langchain.agents import ZeroShotAgent, StructuredChatAgent, create_tool_calling_agent
 from langchain.tools import Tool
 from langchain.schema import SystemMessage, HumanMessage
-from langchain.prompts import MessagesPlaceholder
+from langchain.prompts import MessagesPlaceholder, ChatPromptTemplate
 from langchain_core.memory import BaseMemory
-from langchain.memory import ConversationBufferMemory
 from langchain.callbacks.base import BaseCallbackHandler
-from app.tools.kernel import tools
+from app.tools.kernel import tools, structured_tools
+from app.controller.parsing import StructuredActionOutputParser, MultiActionOutputParser
+from app.controller.parallel import ParallelAgentExecutor
+from app.controller.early_dispatch import EarlyDispatchChatModel, EARLY_DISPATCH
+from app.controller.router import Router
+from app.controller.memory import TokenBudgetMemory, MEMORY_TOKEN_LIMIT
+from app.controller.llm_cache import CachingChatOpenAI, get_response_cache
+from app.controller.backends import (
+    BackendPool, PooledChatModel, LLM_BACKENDS, BACKEND_MAX_CONCURRENCY
+)
 
 # Instead of suppressing specific warnings, we'll use a simpler approach
 warnings.filterwarnings('ignore', category=DeprecationWarning)
 
 # Step 1: Connect to LM Studio and configure the agent
-llm = ChatOpenAI(
-    openai_api_base="http://localhost:1234/v1",
-    openai_api_key="lm-studio",
-    model_name="gemma-2-2b-it",
-    temperature=0,
-    streaming=True  # Enable streaming
-)
+def create_chat_model(base_url="http://localhost:1234/v1", **kwargs):
+    return CachingChatOpenAI(
+        openai_api_base=base_url,
+        openai_api_key="lm-studio",
+        model_name="gemma-2-2b-it",
+        temperature=0,
+        streaming=True,  # Enable streaming
+        response_cache=get_response_cache(),  # None unless LLM_CACHE=1
+        **kwargs
+    )
+
+def create_pooled_client(base_url):
+    """
+    Client for one pooled backend. It doesn't retry on its own, the pool
+    fails over instead, and keeps a keep-alive connection pool sized to the
+    backend's concurrency cap.
+    """
+    limits = httpx.Limits(max_connections=BACKEND_MAX_CONCURRENCY, max_keepalive_connections=BACKEND_MAX_CONCURRENCY)
+    return create_chat_model(
+        base_url,
+        max_retries=0,
+        http_client=httpx.Client(limits=limits),
+        http_async_client=httpx.AsyncClient(limits=limits),
+    )
+
+def create_llm():
+    """A single LM Studio client, or a load-balanced pool when LLM_BACKENDS lists several servers."""
+    if LLM_BACKENDS:
+        return PooledChatModel(pool=BackendPool(LLM_BACKENDS, create_pooled_client))
+    return create_chat_model()
+
+_llm_lock = threading.Lock()
+
+def get_llm():
+    """
+    The shared chat model, built on first use rather than at import time.
+
+    Assigning agent.llm (e.g. a fake model in a benchmark) takes precedence.
+    """
+    with _llm_lock:
+        if "llm" not in globals():
+            globals()["llm"] = create_llm()
+        return globals()["llm"]
+
+def __getattr__(name):
+    # Keeps `agent.llm` working for callers while construction is deferred
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def backend_stats():
+    llm = get_llm()
+    if isinstance(llm, PooledChatModel):
+        return llm.pool.stats()
+    return {'enabled': False}
+
+# How the model invokes tools:
+#   react     - ReAct text with key=value Action Input (the original format)
+#   json      - one strict JSON action blob per step, with typed arguments
+#   functions - OpenAI-compatible function calling, for servers that support it
+TOOL_MODE = os.environ.get("AGENT_TOOL_MODE", "react")
+# Let the model request several independent tool calls in one step (react and
+# json modes; function calling can always return several tool calls)
+MULTI_ACTION = os.environ.get("AGENT_MULTI_ACTION", "0") == "1"
+# Print every agent step to the console (LangChain verbose mode). Off by
+# default; the metrics handler and /metrics cover what it was used for.
+VERBOSE = os.environ.get("AGENT_VERBOSE", "0") == "1"
 
 # Step 3: Initialize the Agent with Proper Argument Passing
-SYSTEM_PROMPT = '''You are an AI assistant specialized in building webpages and handling various tasks using the tools available to you.
-You can create, read, write, and delete files, execute terminal commands, and even search online when needed.
+ASSISTANT_INTRO = '''You are an AI assistant specialized in building webpages and handling various tasks using the tools available to you.
+You can create, read, write, and delete files, execute terminal commands, and even search online when needed.'''
+
+SYSTEM_PROMPT = ASSISTANT_INTRO + '''
 
 When responding to queries that don't require tools, provide a direct answer.
 When tools are needed, ALWAYS use this exact format:
@@ -58,21 +130,64 @@ Remember to:
 The goal is to provide helpful responses while avoiding unnecessary file operations.
 """
 
-# Update memory implementation
-memory = ConversationBufferMemory(
-    return_messages=True,
-    memory_key="chat_history",
-    output_key=None,
-)
+FORMAT_INSTRUCTIONS = "When you need to use a tool, use the following format:\n\nThought: [Your reasoning]\nAction: [Tool name]\nAction Input: [Tool input]\nObservation: [Tool output]\n... (repeat until done)\nFinal Answer: [Your response]"
+
+MULTI_ACTION_INSTRUCTIONS = "\n\nWhen several steps don't depend on each other (for example reading three files), write their Action/Action Input pairs one after another before the Observation. They run together and their observations come back in the same order."
+
+MULTI_ACTION_JSON_INSTRUCTIONS = "\nTo run independent steps together (for example reading three files), reply with a JSON list of action objects; their observations come back in the same order."
+
+# Stored conversations with a live memory in this process, so two sessions on
+# one conversation (two tabs, a quick reconnect) share it instead of both
+# numbering new messages from the same seq
+_live_memories = weakref.WeakValueDictionary()
+_memories_lock = threading.Lock()
+
+def create_memory(conversation_id=None):
+    """
+    Create a conversation memory for a session.
+
+    Recent turns are kept verbatim up to MEMORY_TOKEN_LIMIT tokens, older ones
+    are summarized in the background. With a conversation_id the memory is
+    backed by the conversation store (unless AGENT_PERSIST_CONVERSATIONS=0)
+    and continues that conversation where it was left; sessions still open
+    on the same conversation get the same instance.
+    """
+    from app.controller.conversations import get_conversation_store
+
+    store = get_conversation_store() if conversation_id else None
+    with _memories_lock:
+        memory = _live_memories.get(conversation_id) if store else None
+        if memory is None:
+            memory = TokenBudgetMemory(
+                llm=get_llm(),
+                return_messages=True,
+                memory_key="chat_history",
+                output_key="output",
+                max_token_limit=MEMORY_TOKEN_LIMIT,
+                store=store,
+                conversation_id=conversation_id,
+            )
+            if store:
+                _live_memories[conversation_id] = memory
+        return memory
 
 class StreamingCallbackHandler(BaseCallbackHandler):
-    def __init__(self, socketio):
+    def __init__(self, socketio, sid=None, stream=None):
         super().__init__()
         self.socketio = socketio
+        self.sid = sid
+        # Optional TokenStream that batches tokens into frames for this session
+        self.stream = stream
         self.tool_used = False
 
+    def emit(self, payload):
+        if self.stream:
+            self.stream.send(payload)
+        else:
+            self.socketio.emit('agent_update', payload, to=self.sid)
+
     def on_llm_start(self, serialized, prompts, **kwargs):
-        self.socketio.emit('agent_update', {
+        self.emit({
             'type': 'step',
             'data': {
                 'thought': 'Evaluating whether this question needs tools or can be answered directly...',
@@ -86,17 +201,20 @@ class StreamingCallbackHandler(BaseCallbackHandler):
         # Only stream tokens if we haven't used any tools
         # This helps distinguish between direct responses and tool-based responses
         if not self.tool_used:
-            self.socketio.emit('agent_update', {
-                'type': 'token',
-                'data': {
-                    'token': token
-                }
-            })
+            if self.stream:
+                self.stream.push(token)
+            else:
+                self.emit({
+                    'type': 'token',
+                    'data': {
+                        'token': token
+                    }
+                })
 
     def on_tool_start(self, serialized, input_str, **kwargs):
         self.tool_used = True
         tool_name = serialized.get('name', 'Unknown tool')
-        self.socketio.emit('agent_update', {
+        self.emit({
             'type': 'step',
             'data': {
                 'thought': f'This task requires using a tool: {tool_name}',
@@ -107,7 +225,7 @@ class StreamingCallbackHandler(BaseCallbackHandler):
         })
 
     def on_tool_end(self, output, **kwargs):
-        self.socketio.emit('agent_update', {
+        self.emit({
             'type': 'step',
             'data': {
                 'thought': 'Tool operation completed',
@@ -118,7 +236,7 @@ class StreamingCallbackHandler(BaseCallbackHandler):
         })
 
     def on_agent_action(self, action, **kwargs):
-        self.socketio.emit('agent_update', {
+        self.emit({
             'type': 'step',
             'data': {
                 'thought': action.log,
@@ -130,7 +248,7 @@ class StreamingCallbackHandler(BaseCallbackHandler):
 
     def on_agent_finish(self, finish, **kwargs):
         response_type = 'direct' if not self.tool_used else 'tool-based'
-        self.socketio.emit('agent_update', {
+        self.emit({
             'type': 'final',
             'data': {
                 'output': finish.return_values['output'] if isinstance(finish.return_values, dict) else str(finish.return_values),
@@ -140,26 +258,79 @@ class StreamingCallbackHandler(BaseCallbackHandler):
         # Reset tool usage flag for next interaction
         self.tool_used = False
 
-def create_agent(socketio=None):
-    callback_handler = StreamingCallbackHandler(socketio) if socketio else None
-    
-    return initialize_agent(
-        tools=tools,
+def get_tools():
+    """Return the tools matching TOOL_MODE: key=value Tools or StructuredTools with schemas."""
+    return tools if TOOL_MODE == "react" else structured_tools
+
+def build_agent():
+    """
+    Build the agent (LLM, tools and prompt) for the configured TOOL_MODE.
+
+    The agent holds no per-conversation state, so a single instance is shared
+    by every session executor.
+    """
+    if TOOL_MODE == "functions":
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", ASSISTANT_INTRO + "\nCall a tool only when the task needs one; otherwise answer directly."),
+            MessagesPlaceholder(variable_name="chat_history", optional=True),
+            ("human", "{input}"),
+            MessagesPlaceholder(variable_name="agent_scratchpad"),
+        ])
+        return create_tool_calling_agent(get_llm(), structured_tools, prompt)
+
+    if TOOL_MODE == "json":
+        return StructuredChatAgent.from_llm_and_tools(
+            llm=get_llm(),
+            tools=structured_tools,
+            prefix=ASSISTANT_INTRO + (MULTI_ACTION_JSON_INSTRUCTIONS if MULTI_ACTION else "")
+            + "\nUse a tool only when the task needs one. You have access to the following tools:",
+            output_parser=StructuredActionOutputParser(tool_names=[tool.name for tool in structured_tools]),
+            input_variables=["input", "agent_scratchpad", "chat_history"],
+            memory_prompts=[MessagesPlaceholder(variable_name="chat_history")]
+        )
+
+    llm = get_llm()
+    if EARLY_DISPATCH:
+        # Stop reading the reply once its action is complete and start read-only tools early
+        llm = EarlyDispatchChatModel(llm=llm, multi_action=MULTI_ACTION)
+    return ZeroShotAgent.from_llm_and_tools(
         llm=llm,
-        agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-        verbose=True,
+        tools=tools,
+        prefix=SYSTEM_PROMPT,
+        format_instructions=FORMAT_INSTRUCTIONS + (MULTI_ACTION_INSTRUCTIONS if MULTI_ACTION else ""),
+        output_parser=MultiActionOutputParser() if MULTI_ACTION else None,
+        input_variables=["input", "agent_scratchpad", "chat_history"]
+    )
+
+def build_router():
+    """Build the router that answers conversational requests without the agent."""
+    return Router(get_llm())
+
+def create_executor(agent, memory, callbacks=None, tools=None):
+    """
+    Wrap a shared agent in a lightweight executor bound to one session's memory.
+
+    Independent actions of a multi-action step run concurrently.
+    """
+    return ParallelAgentExecutor.from_agent_and_tools(
+        agent=agent,
+        tools=tools if tools is not None else get_tools(),
+        verbose=VERBOSE,
         handle_parsing_errors=True,
         memory=memory,
         max_iterations=5,
         return_intermediate_steps=True,
-        callbacks=[callback_handler] if callback_handler else None,
-        agent_kwargs={
-            "prefix": SYSTEM_PROMPT,
-            "format_instructions": "When you need to use a tool, use the following format:\n\nThought: [Your reasoning]\nAction: [Tool name]\nAction Input: [Tool input]\nObservation: [Tool output]\n... (repeat until done)\nFinal Answer: [Your response]",
-            "input_variables": ["input", "agent_scratchpad", "chat_history"]
-        }
+        callbacks=callbacks
+    )
+
+def create_agent(socketio=None):
+    callback_handler = StreamingCallbackHandler(socketio) if socketio else None
+
+    return create_executor(
+        build_agent(),
+        create_memory(),
+        callbacks=[callback_handler] if callback_handler else None
     )
 
 # Don't create the agent immediately, let it be created with the socket
 agent = None
-
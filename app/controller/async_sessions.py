@@ -0,0 +1,176 @@
+import os
+import time
+import asyncio
+
+from app.controller.agent import (
+    StreamingCallbackHandler, build_agent, create_executor, create_memory, get_tools, build_router
+)
+from app.controller.router import router_stats, DIRECT, AGENT
+from app.controller.metrics import MetricsCallbackHandler
+from app.controller.sessions import SESSION_IDLE_TIMEOUT, MAX_QUEUED_PER_SESSION
+from app.controller.streaming import AsyncStreamHub
+from app.controller.parsing import parse_stats
+from app.tools.async_tools import with_async_implementations
+from app.tools.command_runner import output_sink
+
+# Agent runs in flight at once. Runs spend nearly all their time awaiting the
+# model server, so this is bounded by what that server can take, not by cores.
+ASYNC_MAX_CONCURRENCY = int(os.environ.get("AGENT_ASYNC_MAX_CONCURRENCY", 256))
+
+
+class AsyncAgentSession:
+    """Per-connection state for the asyncio server: executor, memory and an input queue."""
+
+    def __init__(self, sid, agent, tools, sio, stream=None, conversation_id=None):
+        self.sid = sid
+        self.conversation_id = conversation_id or sid
+        self.memory = create_memory(self.conversation_id)
+        self.stream = stream
+        self.callback_handler = StreamingCallbackHandler(sio, sid, stream) if sio else None
+        if self.callback_handler:
+            # Buffering a token is cheap, so run the handler on the event loop
+            # instead of handing every callback to a thread
+            self.callback_handler.run_inline = True
+        self.metrics = MetricsCallbackHandler(sid)
+        self.metrics.run_inline = True
+        self.executor = create_executor(agent, self.memory, tools=tools)
+        self.queue = asyncio.Queue(maxsize=MAX_QUEUED_PER_SESSION)
+        self.worker = None
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+
+class AsyncSessionManager:
+    """
+    asyncio counterpart of SessionManager.
+
+    Each session gets a worker task that runs its inputs in order with
+    AgentExecutor.ainvoke; a semaphore bounds how many runs are in flight
+    across all sessions. A worker that sits idle for idle_timeout drops its
+    session, so no separate reaper is needed.
+    """
+
+    def __init__(self, sio=None, max_concurrency=ASYNC_MAX_CONCURRENCY,
+                 idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.sio = sio
+        self.idle_timeout = idle_timeout
+        self.agent = build_agent()
+        self.router = build_router()
+        self.tools = with_async_implementations(get_tools())
+        self.streams = AsyncStreamHub(sio) if sio else None
+        self.max_concurrency = max_concurrency
+        self.semaphore = None
+        self.sessions = {}
+
+    def start(self):
+        """Start the stream flusher; call from the running event loop."""
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.streams:
+            self.streams.start()
+
+    def get_session(self, sid, conversation_id=None):
+        session = self.sessions.get(sid)
+        if session is None:
+            stream = self.streams.open(sid) if self.streams else None
+            session = AsyncAgentSession(sid, self.agent, self.tools, self.sio, stream, conversation_id)
+            self.sessions[sid] = session
+        return session
+
+    def submit(self, sid, input_text, conversation_id=None):
+        """
+        Queue an input for a session, starting its worker task if needed.
+
+        conversation_id works as in SessionManager.submit.
+
+        Returns:
+            bool: False if the session already has too many pending inputs.
+        """
+        if self.semaphore is None:
+            self.start()
+        session = self.get_session(sid, conversation_id)
+        try:
+            session.queue.put_nowait(input_text)
+        except asyncio.QueueFull:
+            return False
+        session.touch()
+        if session.worker is None or session.worker.done():
+            session.worker = asyncio.get_running_loop().create_task(self._drain(session))
+        return True
+
+    async def _drain(self, session):
+        while True:
+            try:
+                input_text = await asyncio.wait_for(session.queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                if session.queue.empty():
+                    self._drop(session.sid)
+                    return
+                continue
+            async with self.semaphore:
+                await self._run(session, input_text)
+
+    async def _run(self, session, input_text):
+        callbacks = [handler for handler in (session.callback_handler, session.metrics) if handler]
+        config = {"callbacks": callbacks}
+        # Tools without a native coroutine run in the default executor, which
+        # copies this context, so command output still reaches this session
+        sink_token = output_sink.set(
+            lambda stream, text: session.stream.send({
+                'type': 'command_output',
+                'data': {
+                    'stream': stream,
+                    'text': text
+                }
+            })
+        ) if session.stream else None
+        path, status = AGENT, "error"
+        session.metrics.start_request(input_text)
+        try:
+            start = time.perf_counter()
+            decision = await self.router.adecide(input_text)
+            path = decision.path
+            if decision.path == DIRECT:
+                result = await self.router.aanswer(
+                    input_text, session.memory, session.callback_handler, [session.metrics]
+                )
+            else:
+                result = await session.executor.ainvoke({"input": input_text}, config=config)
+            router_stats.record(input_text, decision, time.perf_counter() - start)
+            parse_stats.record(result.get("intermediate_steps"))
+            status = "ok"
+        except Exception as e:
+            await self.emit_error(session.sid, str(e))
+        finally:
+            session.metrics.end_request(path, status)
+            if sink_token is not None:
+                output_sink.reset(sink_token)
+            session.touch()
+
+    async def emit_error(self, sid, error):
+        payload = {
+            'type': 'error',
+            'data': {
+                'error': error
+            }
+        }
+        session = self.sessions.get(sid)
+        if session and session.stream:
+            session.stream.send(payload)
+        elif self.sio:
+            await self.sio.emit('agent_update', payload, to=sid)
+
+    def _drop(self, sid):
+        self.sessions.pop(sid, None)
+        if self.streams:
+            self.streams.close(sid)
+
+    def end_session(self, sid):
+        """Drop a session and cancel whatever it is running."""
+        session = self.sessions.get(sid)
+        if session is None:
+            return
+        if session.worker is not None:
+            session.worker.cancel()
+        self._drop(sid)
@@ -0,0 +1,340 @@
+import os
+import time
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Iterator
+
+import openai
+from langchain_core.language_models.chat_models import (
+    BaseChatModel, agenerate_from_stream, generate_from_stream
+)
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# Comma-separated base URLs of OpenAI-compatible servers. Empty means the
+# single LM Studio server in agent.py, without a pool.
+LLM_BACKENDS = [url.strip() for url in os.environ.get("LLM_BACKENDS", "").split(",") if url.strip()]
+# How a backend is chosen: "least-outstanding" or "latency" (EWMA latency weighted by load)
+LLM_BALANCE = os.environ.get("LLM_BALANCE", "least-outstanding")
+# Requests one backend may have in flight; further requests wait for a slot
+BACKEND_MAX_CONCURRENCY = int(os.environ.get("LLM_BACKEND_MAX_CONCURRENCY", 4))
+# Seconds between health probes (GET /models) of every backend
+HEALTH_INTERVAL = float(os.environ.get("LLM_HEALTH_INTERVAL", 10))
+HEALTH_TIMEOUT = 2.0
+# Seconds a request waits for a free slot before giving up
+ACQUIRE_TIMEOUT = float(os.environ.get("LLM_ACQUIRE_TIMEOUT", 120))
+# Consecutive server errors before a backend is taken out until a probe passes
+FAILURE_THRESHOLD = 3
+LATENCY_ALPHA = 0.2
+
+# Errors after which the request is retried on another backend
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError, openai.RateLimitError
+)
+
+
+class Backend:
+    """One model server: its client, its load and what we know about its health."""
+
+    def __init__(self, url, client, max_concurrency):
+        self.url = url
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.outstanding = 0
+        self.latency = None  # EWMA of seconds to first token
+        self.healthy = True
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+
+    def score(self, policy):
+        latency = self.latency or 0.0
+        if policy == "latency":
+            return latency * (self.outstanding + 1)
+        return (self.outstanding / self.max_concurrency, latency)
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class BackendPool:
+    """
+    Spreads requests over several model servers.
+
+    Every backend has a cap on requests in flight. A request takes a slot on
+    the best healthy backend (see Backend.score), or waits for one. Backends
+    are taken out after a connection error or FAILURE_THRESHOLD server
+    errors in a row, and put back by the periodic health probe. If every
+    backend is out, requests still try them rather than fail outright.
+
+    Args:
+        urls (list): Base URLs, e.g. http://localhost:1234/v1.
+        make_client (callable): Builds the chat model for a URL.
+    """
+
+    def __init__(self, urls, make_client, max_concurrency=BACKEND_MAX_CONCURRENCY, policy=LLM_BALANCE,
+                 health_interval=HEALTH_INTERVAL):
+        self.backends = [Backend(url, make_client(url), max_concurrency) for url in urls]
+        self.policy = policy
+        self.health_interval = health_interval
+        self.cond = threading.Condition()
+        self.failovers = 0
+        self._prober = None
+
+    def start(self):
+        """Start the health probe thread."""
+        with self.cond:
+            if self._prober is not None or not self.health_interval:
+                return
+            self._prober = threading.Thread(target=self._probe_loop, daemon=True)
+        self._prober.start()
+
+    def _pick(self, exclude):
+        # Caller holds self.cond
+        remaining = [backend for backend in self.backends if backend not in exclude]
+        if not remaining:
+            return None, True
+        healthy = [backend for backend in remaining if backend.healthy]
+        candidates = [backend for backend in (healthy or remaining)
+                      if backend.outstanding < backend.max_concurrency]
+        if not candidates:
+            return None, False
+        return min(candidates, key=lambda backend: backend.score(self.policy)), False
+
+    def try_acquire(self, exclude=()):
+        """
+        Take a slot without waiting.
+
+        Returns:
+            tuple: (backend or None, exhausted), where exhausted means every
+            backend is in exclude.
+        """
+        with self.cond:
+            backend, exhausted = self._pick(exclude)
+            if backend is not None:
+                backend.outstanding += 1
+            return backend, exhausted
+
+    def acquire(self, exclude=(), timeout=ACQUIRE_TIMEOUT):
+        """Take a slot, waiting up to timeout. Returns None once every backend is in exclude."""
+        self.start()
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while True:
+                backend, exhausted = self._pick(exclude)
+                if exhausted:
+                    return None
+                if backend is not None:
+                    backend.outstanding += 1
+                    return backend
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("No model server had a free slot")
+                self.cond.wait(remaining)
+
+    async def aacquire(self, exclude=(), timeout=ACQUIRE_TIMEOUT):
+        self.start()
+        backend, exhausted = self.try_acquire(exclude)
+        if backend is not None or exhausted:
+            return backend
+        # Every slot is taken; wait on a thread so the event loop keeps running
+        return await asyncio.to_thread(self.acquire, exclude, timeout)
+
+    def release(self, backend, latency=None, error=None):
+        with self.cond:
+            backend.outstanding -= 1
+            backend.requests += 1
+            if error is not None:
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                if isinstance(error, openai.APIConnectionError) or backend.consecutive_failures >= FAILURE_THRESHOLD:
+                    backend.healthy = False
+            else:
+                backend.consecutive_failures = 0
+                if latency is not None:
+                    backend.latency = latency if backend.latency is None else (
+                        LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * backend.latency
+                    )
+            self.cond.notify_all()
+
+    def record_failover(self):
+        with self.cond:
+            self.failovers += 1
+
+    def probe(self, client=None):
+        """Probe every backend once and update its health."""
+        import httpx
+
+        own_client = client is None
+        client = client or httpx.Client(timeout=HEALTH_TIMEOUT)
+        try:
+            for backend in self.backends:
+                try:
+                    healthy = client.get(backend.url.rstrip("/") + "/models").status_code == 200
+                except httpx.HTTPError:
+                    healthy = False
+                with self.cond:
+                    backend.healthy = healthy
+                    if healthy:
+                        backend.consecutive_failures = 0
+                    self.cond.notify_all()
+        finally:
+            if own_client:
+                client.close()
+
+    def _probe_loop(self):
+        import httpx
+
+        with httpx.Client(timeout=HEALTH_TIMEOUT) as client:
+            while True:
+                time.sleep(self.health_interval)
+                self.probe(client)
+
+    def stats(self):
+        with self.cond:
+            return {
+                "enabled": True,
+                "policy": self.policy,
+                "failovers": self.failovers,
+                "backends": [backend.stats() for backend in self.backends],
+            }
+
+
+class PooledChatModel(BaseChatModel):
+    """
+    Chat model that sends each call to a backend from a BackendPool.
+
+    A call that fails with a connection error, timeout, rate limit or server
+    error before any token was produced is retried on the next backend, so a
+    conversation carries on when its server dies. Once tokens have been
+    streamed to the user, the error is raised instead, as a retry would
+    repeat them.
+    """
+
+    pool: Any
+    streaming: bool = True
+
+    @property
+    def _llm_type(self):
+        return "backend-pool"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        tried = []
+        error = None
+        while True:
+            backend = self.pool.acquire(exclude=tried)
+            if backend is None:
+                raise error
+            if tried:
+                self.pool.record_failover()
+            start = time.monotonic()
+            first_token = None
+            released = False
+            try:
+                for chunk in backend.client._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    if first_token is None:
+                        first_token = time.monotonic() - start
+                    yield chunk
+            except RETRYABLE_ERRORS as e:
+                self.pool.release(backend, error=e)
+                released = True
+                if first_token is not None:
+                    raise
+                tried.append(backend)
+                error = e
+                continue
+            finally:
+                if not released:
+                    self.pool.release(backend, latency=first_token)
+            return
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.streaming:
+            return generate_from_stream(self._stream(messages, stop=stop, run_manager=run_manager, **kwargs))
+        tried = []
+        error = None
+        while True:
+            backend = self.pool.acquire(exclude=tried)
+            if backend is None:
+                raise error
+            if tried:
+                self.pool.record_failover()
+            start = time.monotonic()
+            try:
+                result = backend.client._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                self.pool.release(backend, error=e)
+                tried.append(backend)
+                error = e
+                continue
+            except BaseException:
+                self.pool.release(backend)
+                raise
+            self.pool.release(backend, latency=time.monotonic() - start)
+            return result
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        tried = []
+        error = None
+        while True:
+            backend = await self.pool.aacquire(exclude=tried)
+            if backend is None:
+                raise error
+            if tried:
+                self.pool.record_failover()
+            start = time.monotonic()
+            first_token = None
+            released = False
+            try:
+                async for chunk in backend.client._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    if first_token is None:
+                        first_token = time.monotonic() - start
+                    yield chunk
+            except RETRYABLE_ERRORS as e:
+                self.pool.release(backend, error=e)
+                released = True
+                if first_token is not None:
+                    raise
+                tried.append(backend)
+                error = e
+                continue
+            finally:
+                if not released:
+                    self.pool.release(backend, latency=first_token)
+            return
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.streaming:
+            return await agenerate_from_stream(self._astream(messages, stop=stop, run_manager=run_manager, **kwargs))
+        tried = []
+        error = None
+        while True:
+            backend = await self.pool.aacquire(exclude=tried)
+            if backend is None:
+                raise error
+            if tried:
+                self.pool.record_failover()
+            start = time.monotonic()
+            try:
+                result = await backend.client._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                self.pool.release(backend, error=e)
+                tried.append(backend)
+                error = e
+                continue
+            except BaseException:
+                self.pool.release(backend)
+                raise
+            self.pool.release(backend, latency=time.monotonic() - start)
+            return result
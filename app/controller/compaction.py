@@ -0,0 +1,139 @@
+import os
+import re
+
+from langchain_core.agents import AgentStep
+
+from app.controller.tokens import count_tokens
+from app.tools.observation_store import observation_store
+
+# Tokens a single tool output may take in the scratchpad; longer ones are compacted
+OBSERVATION_TOKEN_LIMIT = int(os.environ.get("OBSERVATION_TOKEN_LIMIT", 800))
+# Tokens all steps of a run may take in the scratchpad; beyond that the
+# oldest observations are replaced by a pointer to their stored output
+SCRATCHPAD_TOKEN_LIMIT = int(os.environ.get("SCRATCHPAD_TOKEN_LIMIT", 3000))
+MAX_OUTLINE_LINE_CHARS = 120
+
+# Recalling an output must return it as asked, not compact it again
+UNCOMPACTED_TOOLS = {"Recall Observation", "recall_observation"}
+
+_HTML = re.compile(r"<(!doctype|html|head|body|div|section)\b", re.IGNORECASE)
+# Lines that give away an HTML page's structure
+_OUTLINE = re.compile(
+    r"<(!doctype|html|head|title|body|header|nav|main|section|article|aside|footer|form|h[1-6]|script|link|style|table)\b"
+    r"|\bid=|</(head|body)>",
+    re.IGNORECASE
+)
+
+
+def _head_tail(lines, budget):
+    """Pick as many leading and trailing lines as fit in the budget, half each."""
+    head, tail = [], []
+    used = 0
+    for line in lines:
+        cost = count_tokens(line) + 1
+        if used + cost > budget // 2:
+            break
+        head.append(line)
+        used += cost
+    used = 0
+    for line in reversed(lines[len(head):]):
+        cost = count_tokens(line) + 1
+        if used + cost > budget // 2:
+            break
+        tail.append(line)
+        used += cost
+    tail.reverse()
+    return head, tail
+
+
+def _outline(lines, budget):
+    """Numbered structural lines of an HTML page, as many as fit in the budget."""
+    outline = []
+    used = 0
+    for lineno, line in enumerate(lines, 1):
+        if not _OUTLINE.search(line):
+            continue
+        entry = f"L{lineno}: {line.strip()[:MAX_OUTLINE_LINE_CHARS]}"
+        cost = count_tokens(entry) + 1
+        if used + cost > budget:
+            outline.append(f"... [outline continues after L{lineno - 1}]")
+            break
+        outline.append(entry)
+        used += cost
+    return outline
+
+
+def compact_observation(observation, tool=None, limit=OBSERVATION_TOKEN_LIMIT):
+    """
+    Shrink a tool output to about `limit` tokens.
+
+    The full output goes to the observation store. HTML is reduced to an
+    outline of its structural lines, anything else (logs, command output,
+    search results) to its first and last lines. Either way the result says
+    how to recall the rest.
+    """
+    if limit is None or tool in UNCOMPACTED_TOOLS or not isinstance(observation, str):
+        return observation
+    tokens = count_tokens(observation)
+    if tokens <= limit:
+        return observation
+    handle = observation_store.put(observation)
+    lines = observation.splitlines()
+    recall = f"Recall Observation handle={handle}, start_line=N, end_line=M"
+
+    if _HTML.search(observation[:4096]):
+        outline = _outline(lines, limit)
+        if outline:
+            return (
+                f"[HTML outline of a {tokens}-token output, {len(lines)} lines. "
+                f"For the full text use {recall}]\n" + "\n".join(outline)
+            )
+
+    head, tail = _head_tail(lines, limit)
+    omitted = len(lines) - len(head) - len(tail)
+    if not head and not tail:
+        # A single huge line; fall back to characters
+        return (
+            f"[Showing the start of a {tokens}-token output. For the full text use {recall}]\n"
+            + observation[:limit * 4]
+        )
+    return (
+        f"[Compacted a {tokens}-token output, {len(lines)} lines. For the full text use {recall}]\n"
+        + "\n".join(head)
+        + (f"\n... [{omitted} lines omitted] ...\n" if omitted else "\n")
+        + "\n".join(tail)
+    )
+
+
+def compact_step(step, limit=OBSERVATION_TOKEN_LIMIT):
+    observation = compact_observation(step.observation, step.action.tool, limit)
+    if observation is step.observation:
+        return step
+    return AgentStep(action=step.action, observation=observation)
+
+
+_HANDLE = re.compile(r"handle=(obs-[0-9a-f]+)")
+
+
+def fit_scratchpad(intermediate_steps, limit=SCRATCHPAD_TOKEN_LIMIT):
+    """
+    Keep the scratchpad of a run under `limit` tokens.
+
+    Steps are counted from the newest back; once the budget is spent, older
+    observations are replaced by a one-line pointer to their stored output.
+    The newest step is always kept whole.
+    """
+    if limit is None:
+        return intermediate_steps
+    fitted = []
+    used = 0
+    for i, (action, observation) in enumerate(reversed(intermediate_steps)):
+        text = str(observation)
+        used += count_tokens(str(action.log)) + count_tokens(text)
+        if used > limit and i > 0:
+            match = _HANDLE.search(text)
+            handle = match.group(1) if match else observation_store.put(text)
+            observation = f"[Earlier output omitted to save space. Recall Observation handle={handle}]"
+        fitted.append((action, observation))
+    fitted.reverse()
+    return fitted
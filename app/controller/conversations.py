@@ -0,0 +1,382 @@
+"""
+Persistent store for conversations: sessions, their messages and the
+intermediate steps (tool calls) of every agent turn.
+
+Writes are queued and committed in batches by a background thread, so a
+turn never waits on the database. Reads are windowed: a session that is
+opened (again, or in another process) loads only its summary and the most
+recent messages that fit the memory's token budget, and the HTTP API
+pages through older history on request.
+"""
+import os
+import json
+import atexit
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import String, Text, Integer, Index, insert, select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, Session
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from app.controller.db import default_url, make_engine
+
+# Keep every session's messages and tool steps in a database; 0 keeps them in memory only
+PERSIST_CONVERSATIONS = os.environ.get("AGENT_PERSIST_CONVERSATIONS", "1") == "1"
+# SQLAlchemy URL of the conversation database
+CONVERSATIONS_DB = os.environ.get("AGENT_CONVERSATIONS_DB", default_url("conversations.sqlite3"))
+# Seconds queued writes may wait before the writer commits them
+STORE_FLUSH_INTERVAL = float(os.environ.get("AGENT_STORE_FLUSH_INTERVAL", 0.5))
+# Queued writes that wake the writer before the interval is up
+FLUSH_BATCH_SIZE = 1000
+# Queued writes kept while the database is unavailable; the oldest are dropped beyond this
+MAX_PENDING_WRITES = 10000
+# Observation characters kept per stored step
+MAX_STORED_OBSERVATION = 4000
+# Unsummarized messages older than the loaded window read back per summarizing round
+MAX_CATCH_UP_MESSAGES = 200
+# Messages per page of the history API
+HISTORY_PAGE_SIZE = 50
+
+ROLES = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Conversation(Base):
+    __tablename__ = "conversations"
+
+    id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    summary: Mapped[str] = mapped_column(Text, default="")
+    # The summary covers every message with a lower seq
+    summarized_seq: Mapped[int] = mapped_column(Integer, default=0)
+    message_count: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column()
+    updated_at: Mapped[datetime] = mapped_column(index=True)
+
+
+class Message(Base):
+    __tablename__ = "messages"
+    # One message per seq, so two writers can never interleave a conversation
+    __table_args__ = (Index("ux_messages_conversation_seq", "conversation_id", "seq", unique=True),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    conversation_id: Mapped[str] = mapped_column(String(64))
+    seq: Mapped[int] = mapped_column(Integer)
+    role: Mapped[str] = mapped_column(String(16))
+    content: Mapped[str] = mapped_column(Text)
+    tokens: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column()
+
+
+class Step(Base):
+    __tablename__ = "steps"
+    __table_args__ = (Index("ix_steps_conversation_turn", "conversation_id", "turn"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    conversation_id: Mapped[str] = mapped_column(String(64))
+    # seq of the human message that started the turn
+    turn: Mapped[int] = mapped_column(Integer)
+    position: Mapped[int] = mapped_column(Integer)
+    tool: Mapped[str] = mapped_column(String(128))
+    tool_input: Mapped[str] = mapped_column(Text)
+    log: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    observation: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column()
+
+
+def to_message(role, content):
+    return ROLES.get(role, HumanMessage)(content=content)
+
+
+class ConversationStore:
+    """
+    The conversation tables with a write-behind queue in front of them.
+
+    append_* and set_summary only queue; a writer thread commits everything
+    queued in one transaction every STORE_FLUSH_INTERVAL seconds (or on
+    flush(), and at exit). Loads see only committed rows, so a session
+    opened in another process sees up to the last flush.
+    """
+
+    def __init__(self, url=CONVERSATIONS_DB, flush_interval=STORE_FLUSH_INTERVAL):
+        self.url = url
+        self.flush_interval = flush_interval
+        self.engine = make_engine(url)
+        Base.metadata.create_all(self.engine)
+        try:
+            # create_all leaves tables that already exist alone
+            for index in Message.__table__.indexes:
+                index.create(self.engine, checkfirst=True)
+        except Exception as e:
+            print(f"Error adding the unique message index (duplicate seqs stored?): {e}")
+        self.pending = []
+        self.lock = threading.Lock()
+        # Held while a batch is written, so flush() returns only once it is committed
+        self.write_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.errors = 0
+        # Messages refused because their seq was already taken
+        self.conflicts = 0
+        self.thread = threading.Thread(target=self._writer, name="conversation-store", daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    # Writes (queued)
+
+    def _queue(self, op):
+        with self.lock:
+            self.pending.append(op)
+            if len(self.pending) > MAX_PENDING_WRITES:
+                del self.pending[0]
+                self.dropped += 1
+            if len(self.pending) >= FLUSH_BATCH_SIZE:
+                self.wakeup.set()
+
+    def append_messages(self, conversation_id, messages):
+        """Queue (seq, role, content, tokens) tuples."""
+        now = _now()
+        for seq, role, content, tokens in messages:
+            self._queue(("message", conversation_id, {
+                "conversation_id": conversation_id, "seq": seq, "role": role, "content": content,
+                "tokens": tokens, "created_at": now,
+            }))
+
+    def append_steps(self, conversation_id, turn, intermediate_steps):
+        """Queue the (action, observation) pairs of one agent turn."""
+        now = _now()
+        for position, (action, observation) in enumerate(intermediate_steps):
+            tool_input = action.tool_input
+            self._queue(("step", conversation_id, {
+                "conversation_id": conversation_id, "turn": turn, "position": position,
+                "tool": str(action.tool)[:128],
+                "tool_input": tool_input if isinstance(tool_input, str) else json.dumps(tool_input, default=str),
+                "log": action.log,
+                "observation": str(observation)[:MAX_STORED_OBSERVATION],
+                "created_at": now,
+            }))
+
+    def set_summary(self, conversation_id, summary, summarized_seq):
+        self._queue(("summary", conversation_id, {"summary": summary, "summarized_seq": summarized_seq}))
+
+    def _writer(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing conversations: {e}")
+
+    def flush(self):
+        """Commit everything queued so far."""
+        with self.write_lock:
+            with self.lock:
+                ops, self.pending = self.pending, []
+            if not ops:
+                return 0
+            try:
+                self._write(ops)
+            except Exception:
+                self.errors += 1
+                # Keep them for the next round, still within MAX_PENDING_WRITES
+                with self.lock:
+                    self.pending[:0] = ops
+                    excess = len(self.pending) - MAX_PENDING_WRITES
+                    if excess > 0:
+                        del self.pending[:excess]
+                        self.dropped += excess
+                raise
+            self.written += len(ops)
+            self.batches += 1
+            return len(ops)
+
+    def _write(self, ops):
+        messages = [row for kind, _, row in ops if kind == "message"]
+        steps = [row for kind, _, row in ops if kind == "step"]
+        counts, summaries = {}, {}
+        for kind, conversation_id, row in ops:
+            counts.setdefault(conversation_id, 0)
+            if kind == "message":
+                counts[conversation_id] += 1
+            elif kind == "summary":
+                summaries[conversation_id] = row
+        now = _now()
+        with Session(self.engine) as session, session.begin():
+            existing = {
+                conversation.id: conversation for conversation in
+                session.scalars(select(Conversation).where(Conversation.id.in_(list(counts))))
+            }
+            for conversation_id, added in counts.items():
+                conversation = existing.get(conversation_id)
+                if conversation is None:
+                    conversation = Conversation(id=conversation_id, summary="", summarized_seq=0,
+                                                message_count=0, created_at=now)
+                    session.add(conversation)
+                conversation.message_count += added
+                conversation.updated_at = now
+                if conversation_id in summaries:
+                    conversation.summary = summaries[conversation_id]["summary"]
+                    conversation.summarized_seq = summaries[conversation_id]["summarized_seq"]
+            if messages:
+                self._insert_messages(session, messages)
+            if steps:
+                session.execute(insert(Step), steps)
+
+    def _insert_messages(self, session, messages):
+        try:
+            with session.begin_nested():
+                session.execute(insert(Message), messages)
+            return
+        except IntegrityError:
+            pass
+        # Some seq is taken, e.g. by another process on the same conversation;
+        # keep the rows that fit rather than retrying the whole batch forever
+        for row in messages:
+            try:
+                with session.begin_nested():
+                    session.execute(insert(Message), [row])
+            except IntegrityError:
+                self.conflicts += 1
+
+    # Reads
+
+    def load_window(self, conversation_id, max_tokens):
+        """
+        Load what a memory needs to continue a conversation.
+
+        Returns:
+            dict: summary, summarized_seq, next_seq, window (the newest
+            (seq, message, tokens) that fit max_tokens, oldest first) and
+            window_start; messages from summarized_seq up to window_start
+            are in neither the summary nor the window (see load_backlog).
+        """
+        with Session(self.engine) as session:
+            conversation = session.get(Conversation, conversation_id)
+            if conversation is None:
+                return {"summary": "", "summarized_seq": 0, "next_seq": 0, "window": [], "window_start": 0}
+            last_seq = session.scalar(
+                select(func.max(Message.seq)).where(Message.conversation_id == conversation_id)
+            )
+            next_seq = max(conversation.summarized_seq, 0 if last_seq is None else last_seq + 1)
+            window, total = [], 0
+            rows = session.execute(
+                select(Message.seq, Message.role, Message.content, Message.tokens)
+                .where(Message.conversation_id == conversation_id, Message.seq >= conversation.summarized_seq)
+                .order_by(Message.seq.desc())
+                .execution_options(yield_per=HISTORY_PAGE_SIZE)
+            )
+            for seq, role, content, tokens in rows:
+                if window and total + tokens > max_tokens:
+                    break
+                window.append((seq, to_message(role, content), tokens))
+                total += tokens
+            rows.close()
+            return {
+                "summary": conversation.summary,
+                "summarized_seq": conversation.summarized_seq,
+                "next_seq": next_seq,
+                "window": window[::-1],
+                "window_start": window[-1][0] if window else next_seq,
+            }
+
+    def load_backlog(self, conversation_id, start, end, limit=MAX_CATCH_UP_MESSAGES):
+        """The oldest `limit` messages with start <= seq < end, as (seq, message, tokens), oldest first."""
+        with Session(self.engine) as session:
+            rows = session.execute(
+                select(Message.seq, Message.role, Message.content, Message.tokens)
+                .where(Message.conversation_id == conversation_id, Message.seq >= start, Message.seq < end)
+                .order_by(Message.seq)
+                .limit(limit)
+            )
+            return [(seq, to_message(role, content), tokens) for seq, role, content, tokens in rows]
+
+    def history(self, conversation_id, before=None, limit=HISTORY_PAGE_SIZE):
+        """
+        A page of a conversation's messages, newest first, with each turn's steps.
+
+        Returns:
+            dict or None: None if there is no such conversation.
+        """
+        with Session(self.engine) as session:
+            conversation = session.get(Conversation, conversation_id)
+            if conversation is None:
+                return None
+            query = select(Message).where(Message.conversation_id == conversation_id)
+            if before is not None:
+                query = query.where(Message.seq < before)
+            messages = list(session.scalars(query.order_by(Message.seq.desc()).limit(limit)))
+            steps = {}
+            if messages:
+                for step in session.scalars(
+                    select(Step).where(
+                        Step.conversation_id == conversation_id,
+                        Step.turn.between(messages[-1].seq, messages[0].seq),
+                    ).order_by(Step.turn, Step.position)
+                ):
+                    steps.setdefault(step.turn, []).append({
+                        "tool": step.tool, "tool_input": step.tool_input, "log": step.log,
+                        "observation": step.observation,
+                    })
+            return {
+                "id": conversation.id,
+                "summary": conversation.summary,
+                "message_count": conversation.message_count,
+                "created_at": conversation.created_at.isoformat() + "Z",
+                "updated_at": conversation.updated_at.isoformat() + "Z",
+                "messages": [
+                    {
+                        "seq": message.seq,
+                        "role": message.role,
+                        "content": message.content,
+                        "created_at": message.created_at.isoformat() + "Z",
+                        **({"steps": steps[message.seq]} if message.seq in steps else {}),
+                    }
+                    for message in messages
+                ],
+                "next_before": messages[-1].seq if len(messages) == limit else None,
+            }
+
+    def stats(self):
+        with self.lock:
+            pending = len(self.pending)
+        with Session(self.engine) as session:
+            conversations = session.scalar(select(func.count()).select_from(Conversation))
+            messages = session.scalar(select(func.count()).select_from(Message))
+            steps = session.scalar(select(func.count()).select_from(Step))
+        return {
+            "conversations": conversations,
+            "messages": messages,
+            "steps": steps,
+            "pending_writes": pending,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "conflicts": self.conflicts,
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store():
+    """Return the process-wide conversation store, or None if persistence is disabled."""
+    global _store
+    if not PERSIST_CONVERSATIONS:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = ConversationStore()
+    return _store
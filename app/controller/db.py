@@ -0,0 +1,29 @@
+import os
+
+from sqlalchemy import create_engine, event
+
+from app.tools import file_tools
+
+
+def default_url(filename):
+    """SQLite database next to the projects directory."""
+    return "sqlite:///" + os.path.join(os.path.dirname(file_tools.PROJECTS_DIR), filename)
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers (the web server, other processes) work while one connection writes
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=10000")
+    cursor.close()
+
+
+def make_engine(url):
+    """Create an engine for url, with the directory and pragmas a shared SQLite file needs."""
+    if url.startswith("sqlite:///"):
+        os.makedirs(os.path.dirname(os.path.abspath(url[len("sqlite:///"):])), exist_ok=True)
+    engine = create_engine(url)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _sqlite_pragmas)
+    return engine
@@ -0,0 +1,260 @@
+import os
+import re
+import asyncio
+import contextvars
+from typing import Any, AsyncIterator, Iterator
+
+from langchain_core.language_models.chat_models import (
+    BaseChatModel, agenerate_from_stream, generate_from_stream
+)
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from app.controller.metrics import registry
+
+# Off by default: set AGENT_EARLY_DISPATCH=1 to stop reading the model's reply
+# once it holds a complete action (react mode). Tokens past the cut may already
+# have been streamed to the client.
+EARLY_DISPATCH = os.environ.get("AGENT_EARLY_DISPATCH", "0") == "1"
+# Off by default: set AGENT_SPECULATIVE_TOOLS=1 to start read-only tools as soon
+# as their action is complete, while the model may still be writing further
+# actions. Their on_tool_start then fires before on_agent_action.
+SPECULATIVE_TOOLS = os.environ.get("AGENT_SPECULATIVE_TOOLS", "0") == "1"
+
+# Tools whose Action Input may run over several lines (file contents); for
+# every other tool the end of the Action Input line ends the action
+MULTILINE_INPUT_TOOLS = {"Write File", "Write Files", "write_file", "write_files"}
+
+_ACTION = re.compile(r"\s*Action\s*\d*\s*:[ \t]*(.*?)\s*$")
+_ACTION_INPUT = re.compile(r"\s*Action\s*\d*\s*Input\s*\d*\s*:[ \t]*(.*)$")
+# The colon is required: file contents may well have lines starting "Thoughtful" or "Observations"
+_OTHER_KEYWORD = re.compile(r"\s*(Observation|Thought|Final Answer)\s*\d*\s*:")
+
+EARLY_STOPS = registry.counter(
+    "agent_llm_early_stops_total", "Model replies cut off after a complete action", ["reason"]
+)
+SPECULATIVE_RUNS = registry.counter(
+    "agent_speculative_tool_runs_total", "Read-only tools started before the reply was parsed", ["result"]
+)
+
+
+def action_key(tool, tool_input):
+    """How an action is matched against its speculative run; follows the ReAct parsers' normalization."""
+    return str(tool).strip(), str(tool_input).strip().strip('"')
+
+
+class ActionStreamParser:
+    """
+    Finds complete ReAct actions in a reply while it is being streamed.
+
+    feed() returns the offset at which the reply should be cut, or None to
+    keep reading. A single-action reply is cut at the end of its Action
+    Input; a multi-action reply at the first Observation or Final Answer
+    after an action, which is where a model that ignores the stop sequence
+    starts to make up results.
+    """
+
+    def __init__(self, multi_action=False):
+        self.multi_action = multi_action
+        self.text = ""
+        self.scanned = 0  # offset of the first line not yet looked at
+        self.tool = None
+        self.input_lines = None
+        self.actions = []
+        self.new_actions = []
+        self.reason = None
+
+    def _complete(self, end):
+        self.actions.append(action_key(self.tool, "\n".join(self.input_lines)))
+        self.new_actions.append(self.actions[-1])
+        self.tool = None
+        self.input_lines = None
+        if not self.multi_action:
+            self.reason = "action"
+            return end
+        return None
+
+    def _line(self, line, start, end):
+        """Handle one complete line spanning text[start:end]; returns a cut offset or None."""
+        match = _ACTION_INPUT.match(line)
+        if match and self.tool is not None and self.input_lines is None:
+            self.input_lines = [match.group(1)]
+            if self.tool not in MULTILINE_INPUT_TOOLS:
+                return self._complete(end)
+            return None
+        match = _ACTION.match(line)
+        if match and not _ACTION_INPUT.match(line):
+            cut = self._complete(start - 1) if self.input_lines is not None else None
+            if cut is not None:
+                return cut
+            self.tool = match.group(1)
+            return None
+        if _OTHER_KEYWORD.match(line):
+            cut = self._complete(start - 1) if self.input_lines is not None else None
+            if cut is not None:
+                return cut
+            # A thought may come between the actions of a multi-action reply;
+            # an Observation or Final Answer after an action is never the model's to write
+            if self.actions and not line.lstrip().startswith("Thought"):
+                self.reason = "observation" if line.lstrip().startswith("Observation") else "final_answer"
+                return max(start - 1, 0)
+            return None
+        if self.input_lines is not None:
+            self.input_lines.append(line)
+        return None
+
+    def feed(self, token):
+        self.text += token
+        while True:
+            newline = self.text.find("\n", self.scanned)
+            if newline == -1:
+                return None
+            start, self.scanned = self.scanned, newline + 1
+            cut = self._line(self.text[start:newline], start, newline)
+            if cut is not None:
+                return cut
+
+    def take_new_actions(self):
+        actions, self.new_actions = self.new_actions, []
+        return actions
+
+
+class Speculation:
+    """
+    Read-only tool runs started during one agent step, keyed by action.
+
+    The executor installs one per step in `current_speculation`; the model
+    wrapper starts tools on it as actions complete, and the executor takes
+    the result instead of running an action whose run was already started.
+    """
+
+    def __init__(self, executor, name_to_tool_map, color_mapping, run_manager, submit):
+        self.executor = executor
+        self.name_to_tool_map = name_to_tool_map
+        self.color_mapping = color_mapping
+        self.run_manager = run_manager
+        self.submit = submit
+        self.runs = {}
+        self.blocked = False
+
+    def _run_kwargs(self, tool):
+        return dict(
+            verbose=self.executor.verbose,
+            color=self.color_mapping.get(tool),
+            callbacks=self.run_manager.get_child() if self.run_manager else None,
+            **self.executor._action_agent.tool_run_logging_kwargs(),
+        )
+
+    def start(self, tool, tool_input):
+        from app.controller.parallel import READ_ONLY_TOOLS
+
+        key = action_key(tool, tool_input)
+        if key[0] not in READ_ONLY_TOOLS:
+            # Whatever follows may read what this action changes
+            self.blocked = True
+        if self.blocked or key in self.runs:
+            return
+        tool = self.name_to_tool_map.get(key[0])
+        if tool is None or tool.return_direct:
+            return
+        self.runs[key] = self.submit(tool, key[1], self._run_kwargs(key[0]))
+
+    def take(self, action):
+        run = self.runs.pop(action_key(action.tool, action.tool_input), None)
+        if run is not None:
+            SPECULATIVE_RUNS.inc(result="used")
+        return run
+
+    def discard(self):
+        """Count the runs the parsed reply didn't ask for; read-only, so nothing to undo."""
+        for run in self.runs.values():
+            run.cancel()
+            SPECULATIVE_RUNS.inc(result="unused")
+        self.runs = {}
+
+
+current_speculation = contextvars.ContextVar("current_speculation", default=None)
+
+
+class EarlyDispatchChatModel(BaseChatModel):
+    """
+    Wraps the agent's chat model and stops reading its reply as soon as
+    ActionStreamParser has the complete action(s).
+
+    Closing the stream closes the HTTP response, so the server stops
+    generating instead of spending tokens on a made-up Observation and the
+    steps after it. Each action that completes mid-stream is handed to the
+    step's Speculation, if any.
+    """
+
+    llm: Any
+    multi_action: bool = False
+
+    @property
+    def _llm_type(self):
+        return "early-dispatch"
+
+    def _chunk(self, text):
+        return ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+    def _speculate(self, parser):
+        speculation = current_speculation.get()
+        for tool, tool_input in parser.take_new_actions():
+            if speculation is not None:
+                speculation.start(tool, tool_input)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        parser = ActionStreamParser(self.multi_action)
+        emitted = 0
+        chunks = self.llm._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+        try:
+            for chunk in chunks:
+                cut = parser.feed(chunk.text)
+                self._speculate(parser)
+                if cut is None:
+                    emitted += len(chunk.text)
+                    yield chunk
+                    continue
+                if cut > emitted:
+                    yield self._chunk(chunk.text[:cut - emitted])
+                EARLY_STOPS.inc(reason=parser.reason)
+                return
+        finally:
+            chunks.close()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return generate_from_stream(self._stream(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        parser = ActionStreamParser(self.multi_action)
+        emitted = 0
+        chunks = self.llm._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+        try:
+            async for chunk in chunks:
+                cut = parser.feed(chunk.text)
+                self._speculate(parser)
+                if cut is None:
+                    emitted += len(chunk.text)
+                    yield chunk
+                    continue
+                if cut > emitted:
+                    yield self._chunk(chunk.text[:cut - emitted])
+                EARLY_STOPS.inc(reason=parser.reason)
+                return
+        finally:
+            await chunks.aclose()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+
+def thread_submit(pool):
+    """Speculation submit function for the threaded executor."""
+    def submit(tool, tool_input, run_kwargs):
+        return pool.submit(contextvars.copy_context().run, tool.run, tool_input, **run_kwargs)
+    return submit
+
+
+def task_submit(tool, tool_input, run_kwargs):
+    """Speculation submit function for the asyncio executor."""
+    return asyncio.ensure_future(tool.arun(tool_input, **run_kwargs))
@@ -0,0 +1,346 @@
+"""
+Durable batch job queue for agent tasks.
+
+Jobs are rows in a SQLite database. Worker processes claim them one at a
+time under a lease that they renew while the job runs; a job whose worker
+died (or whose server was restarted) is picked up again once its lease
+runs out, up to MAX_ATTEMPTS times. A resumed job starts its agent run
+over, in the same folder, so files written by the first attempt are still
+there.
+
+Every job runs in its own folder with its own memory, so one worker
+process runs one job at a time. The job folders live beside PROJECTS_DIR,
+not in it, so interactive sessions can't list, search or delete them. Run a pool on its own with:
+
+    python -m app.controller.jobs --workers 4
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import argparse
+import threading
+import subprocess
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import String, Text, Integer, Float, select, update, func
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, Session
+
+from app.controller.db import default_url, make_engine
+from app.tools import file_tools
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# SQLAlchemy URL of the job database
+JOBS_DB = os.environ.get("AGENT_JOBS_DB", default_url("jobs.sqlite3"))
+# Worker processes started by the web server; 0 leaves the queue to a separate pool
+JOB_WORKERS = int(os.environ.get("AGENT_JOB_WORKERS", 1))
+# Folder holding one subfolder per job; defaults to Jobs beside PROJECTS_DIR
+JOBS_ROOT = os.environ.get("AGENT_JOBS_ROOT")
+# Seconds a claimed job is reserved for its worker without a heartbeat
+JOB_LEASE_SECONDS = float(os.environ.get("AGENT_JOB_LEASE_SECONDS", 60))
+# How often an idle worker looks for new jobs
+JOB_POLL_INTERVAL = float(os.environ.get("AGENT_JOB_POLL_INTERVAL", 1.0))
+# Attempts (including resumes after a crash) before a job is marked failed
+MAX_ATTEMPTS = 3
+# Observation characters kept per step in a job's stored trace
+MAX_STORED_OBSERVATION = 4000
+# Jobs accepted in one request
+MAX_BATCH_SIZE = 1000
+THROUGHPUT_WINDOW = 300
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+def default_jobs_root():
+    return JOBS_ROOT or os.path.join(os.path.dirname(file_tools.PROJECTS_DIR), "Jobs")
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    batch_id: Mapped[str] = mapped_column(String(32), index=True)
+    status: Mapped[str] = mapped_column(String(16), index=True, default=QUEUED)
+    input: Mapped[str] = mapped_column(Text)
+    output: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    steps: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # JSON list of tool steps
+    trace: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # JSON request trace (see metrics.py)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    worker: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(index=True)
+    started_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+    lease_expires: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+    duration: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+    def to_dict(self, details=False):
+        data = {
+            "id": self.id,
+            "batch": self.batch_id,
+            "status": self.status,
+            "input": self.input,
+            "output": self.output,
+            "error": self.error,
+            "attempts": self.attempts,
+            "created_at": self.created_at.isoformat() + "Z",
+            "started_at": self.started_at.isoformat() + "Z" if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() + "Z" if self.finished_at else None,
+            "duration": self.duration,
+        }
+        if details:
+            data["steps"] = json.loads(self.steps) if self.steps else []
+            data["trace"] = json.loads(self.trace) if self.trace else None
+        return data
+
+
+class JobQueue:
+    """The job table and the operations the API and the workers need."""
+
+    def __init__(self, url=JOBS_DB):
+        self.url = url
+        self.engine = make_engine(url)
+        Base.metadata.create_all(self.engine)
+
+    def submit(self, inputs, batch_id=None):
+        """Queue one job per input. Returns (batch_id, job ids)."""
+        batch_id = batch_id or uuid.uuid4().hex
+        now = _now()
+        job_ids = [uuid.uuid4().hex for _ in inputs]
+        with Session(self.engine) as session, session.begin():
+            session.add_all([
+                Job(id=job_id, batch_id=batch_id, status=QUEUED, input=text, attempts=0, created_at=now)
+                for job_id, text in zip(job_ids, inputs)
+            ])
+        return batch_id, job_ids
+
+    def claim(self, worker):
+        """
+        Take the oldest queued job, or a running one whose lease has expired.
+
+        The update is a single statement, so two workers can't claim the same
+        job. Returns the Job or None.
+        """
+        now = _now()
+        claimable = (
+            select(Job.id)
+            .where((Job.status == QUEUED) | ((Job.status == RUNNING) & (Job.lease_expires < now)))
+            .order_by(Job.created_at)
+            .limit(1)
+            .scalar_subquery()
+        )
+        with Session(self.engine, expire_on_commit=False) as session, session.begin():
+            job_id = session.execute(
+                update(Job)
+                .where(Job.id == claimable)
+                .values(status=RUNNING, worker=worker, attempts=Job.attempts + 1, started_at=now,
+                        lease_expires=now + timedelta(seconds=JOB_LEASE_SECONDS))
+                .returning(Job.id)
+            ).scalar()
+            if job_id is None:
+                return None
+            job = session.get(Job, job_id)
+            if job.attempts > MAX_ATTEMPTS:
+                job.status = FAILED
+                job.error = f"Gave up after {MAX_ATTEMPTS} attempts"
+                job.finished_at = now
+                return None
+            return job
+
+    def heartbeat(self, job_id, worker):
+        with Session(self.engine) as session, session.begin():
+            session.execute(
+                update(Job).where(Job.id == job_id, Job.worker == worker, Job.status == RUNNING)
+                .values(lease_expires=_now() + timedelta(seconds=JOB_LEASE_SECONDS))
+            )
+
+    def finish(self, job_id, worker, output=None, error=None, steps=None, trace=None):
+        now = _now()
+        with Session(self.engine) as session, session.begin():
+            job = session.get(Job, job_id)
+            if job is None or job.worker != worker or job.status != RUNNING:
+                # The lease ran out and another worker took the job over
+                return False
+            job.status = FAILED if error is not None else DONE
+            job.output = output
+            job.error = error
+            job.steps = json.dumps(steps or [])
+            job.trace = json.dumps(trace, default=str) if trace else None
+            job.finished_at = now
+            job.lease_expires = None
+            job.duration = (now - job.started_at).total_seconds()
+            return True
+
+    def get(self, job_id):
+        with Session(self.engine) as session:
+            return session.get(Job, job_id)
+
+    def list(self, batch_id=None, status=None, limit=100):
+        query = select(Job).order_by(Job.created_at).limit(limit)
+        if batch_id:
+            query = query.where(Job.batch_id == batch_id)
+        if status:
+            query = query.where(Job.status == status)
+        with Session(self.engine) as session:
+            return list(session.scalars(query))
+
+    def stats(self):
+        since = _now() - timedelta(seconds=THROUGHPUT_WINDOW)
+        with Session(self.engine) as session:
+            depth = dict(session.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+            recent, avg_duration = session.execute(
+                select(func.count(), func.avg(Job.duration)).where(Job.status == DONE, Job.finished_at >= since)
+            ).one()
+        return {
+            "depth": {status: depth.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)},
+            "completed_last_window": recent,
+            "window_seconds": THROUGHPUT_WINDOW,
+            "jobs_per_minute": round(recent * 60 / THROUGHPUT_WINDOW, 2),
+            "avg_duration_s": round(avg_duration, 2) if avg_duration is not None else None,
+        }
+
+
+def _steps(intermediate_steps):
+    return [
+        {
+            "tool": action.tool,
+            "tool_input": action.tool_input,
+            "log": action.log,
+            "observation": str(observation)[:MAX_STORED_OBSERVATION],
+        }
+        for action, observation in intermediate_steps or []
+    ]
+
+
+def run_job(job, agent, jobs_root):
+    """Run one job in its own folder with fresh memory; returns (output, steps, trace)."""
+    from app.controller.agent import create_executor, create_memory
+    from app.controller.metrics import MetricsCallbackHandler
+    from app.tools import web_tool
+
+    workdir = os.path.abspath(os.path.join(jobs_root, job.id))
+    os.makedirs(workdir, exist_ok=True)
+    # This process runs one job at a time, so the tools can simply be pointed at its folder
+    file_tools.PROJECTS_DIR = workdir
+    web_tool.PROJECTS_DIR = workdir
+    metrics = MetricsCallbackHandler(f"job-{job.id}")
+    executor = create_executor(agent, create_memory())
+    metrics.start_request(job.input)
+    status = "error"
+    try:
+        result = executor.invoke({"input": job.input}, config={"callbacks": [metrics]})
+        status = "ok"
+    finally:
+        trace = metrics.end_request("job", status)
+    return result["output"], _steps(result.get("intermediate_steps")), trace
+
+
+def worker_main(url, jobs_root, name, poll_interval=JOB_POLL_INTERVAL):
+    """Claim, run and record jobs until the parent process goes away."""
+    from app.controller.agent import build_agent
+
+    queue = JobQueue(url)
+    agent = build_agent()
+    worker = f"{name}:{os.getpid()}"
+    parent = os.getppid()
+    while os.getppid() == parent:
+        job = queue.claim(worker)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        stop = threading.Event()
+
+        def renew(job_id=job.id):
+            while not stop.wait(JOB_LEASE_SECONDS / 3):
+                queue.heartbeat(job_id, worker)
+
+        threading.Thread(target=renew, daemon=True).start()
+        try:
+            output, steps, trace = run_job(job, agent, jobs_root)
+            queue.finish(job.id, worker, output=output, steps=steps, trace=trace)
+        except Exception as e:
+            queue.finish(job.id, worker, error=f"{type(e).__name__}: {e}")
+        finally:
+            stop.set()
+
+
+class JobWorkerPool:
+    """
+    Keeps `workers` worker processes running against the job database.
+
+    Workers are separate interpreters (python -m app.controller.jobs --worker)
+    rather than multiprocessing children, which would re-run the server's
+    main module on start.
+    """
+
+    def __init__(self, url=JOBS_DB, workers=JOB_WORKERS, jobs_root=None, poll_interval=JOB_POLL_INTERVAL):
+        self.url = url
+        self.workers = workers
+        self.jobs_root = jobs_root or default_jobs_root()
+        self.poll_interval = poll_interval
+        self.processes = []
+        self._monitor = None
+
+    def _spawn(self, index):
+        return subprocess.Popen([
+            sys.executable, "-m", "app.controller.jobs", "--worker", f"worker-{index}",
+            "--db", self.url, "--jobs-root", self.jobs_root, "--poll-interval", str(self.poll_interval),
+        ], cwd=ROOT)
+
+    def start(self):
+        if self._monitor is not None or not self.workers:
+            return self
+        self.processes = [self._spawn(i) for i in range(self.workers)]
+        atexit.register(self.stop)
+        self._monitor = threading.Thread(target=self._watch, daemon=True)
+        self._monitor.start()
+        return self
+
+    def _watch(self):
+        # A worker that crashed is replaced; its job is taken over when its lease runs out
+        while True:
+            time.sleep(5)
+            for i, process in enumerate(self.processes):
+                if process.poll() is not None:
+                    self.processes[i] = self._spawn(i)
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run agent job workers against the job database.")
+    parser.add_argument("--workers", type=int, default=max(JOB_WORKERS, 1))
+    parser.add_argument("--db", default=JOBS_DB)
+    parser.add_argument("--jobs-root", default=None, help="folder for the jobs' project folders")
+    parser.add_argument("--poll-interval", type=float, default=JOB_POLL_INTERVAL)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker_main(args.db, args.jobs_root or default_jobs_root(),
+                    args.worker, args.poll_interval)
+        return
+    pool = JobWorkerPool(args.db, args.workers, args.jobs_root, args.poll_interval).start()
+    print(f"{args.workers} job workers on {args.db}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from typing import Any, AsyncIterator, Iterator, List
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_openai import ChatOpenAI
+
+# Off by default: set LLM_CACHE=1 to replay identical agent steps from disk
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE", "0") == "1"
+LLM_CACHE_DIR = os.environ.get(
+    "LLM_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "agentic-system", "llm")
+)
+LLM_CACHE_SIZE_LIMIT = int(os.environ.get("LLM_CACHE_SIZE_LIMIT", 256 * 1024 * 1024))
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 60 * 60))
+
+# Cached completions are replayed in word-sized pieces so the UI still streams
+_REPLAY_CHUNK = re.compile(r"\s*\S+|\s+")
+
+
+def normalize_text(text):
+    """Normalize line endings and trailing whitespace, which don't change the model's answer."""
+    text = text.replace("\r\n", "\n").strip()
+    return "\n".join(line.rstrip() for line in text.split("\n"))
+
+
+class ResponseCache:
+    """
+    Disk-backed cache of LLM completions keyed on prompt, model and sampling params.
+
+    Entries expire after ttl seconds and the least recently used ones are
+    evicted once the cache grows past size_limit bytes.
+    """
+
+    def __init__(self, directory=LLM_CACHE_DIR, size_limit=LLM_CACHE_SIZE_LIMIT, ttl=LLM_CACHE_TTL):
+        import diskcache
+
+        self.cache = diskcache.Cache(
+            directory,
+            size_limit=size_limit,
+            eviction_policy="least-recently-used",
+        )
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _message_key(message):
+        # In function-calling mode an AI message's content is often empty and the
+        # step lives in its tool calls, answered by tool messages
+        return [
+            message.type,
+            normalize_text(str(message.content)),
+            getattr(message, "tool_calls", None) or [],
+            getattr(message, "tool_call_id", None),
+            message.additional_kwargs,
+        ]
+
+    @staticmethod
+    def make_key(messages, params):
+        payload = {
+            "messages": [ResponseCache._message_key(message) for message in messages],
+            "params": params,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        value = self.cache.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, text):
+        self.cache.set(key, text, expire=self.ttl)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self.cache),
+                "size_bytes": self.cache.volume(),
+            }
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache, or None if caching is disabled."""
+    global _response_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+    return _response_cache
+
+
+class CachingChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI that serves repeated prompts from a ResponseCache.
+
+    Only deterministic (temperature=0) calls are cached. Hits are replayed as a
+    stream of chunks, so streaming callbacks fire just as they do for a live
+    completion.
+    """
+
+    response_cache: Any = None
+
+    def _cache_key(self, messages, stop, kwargs):
+        if self.response_cache is None or self.temperature not in (0, 0.0):
+            return None
+        params = {
+            "model": self.model_name,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "max_tokens": self.max_tokens,
+            "stop": stop,
+            "seed": self.seed,
+            "frequency_penalty": self.frequency_penalty,
+            "presence_penalty": self.presence_penalty,
+            # Includes bound tool schemas in function-calling mode
+            "extra": json.dumps(kwargs, sort_keys=True, default=str),
+        }
+        return self.response_cache.make_key(messages, params)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        key = self._cache_key(messages, stop, kwargs)
+        cached = self.response_cache.get(key) if key else None
+        if cached is not None:
+            for piece in _REPLAY_CHUNK.findall(cached):
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+                if run_manager:
+                    run_manager.on_llm_new_token(piece, chunk=chunk)
+                yield chunk
+            return
+
+        parts: List[str] = []
+        cacheable = True
+        for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            if getattr(chunk.message, "tool_call_chunks", None):
+                cacheable = False
+            parts.append(str(chunk.message.content))
+            yield chunk
+        if key and cacheable:
+            self.response_cache.set(key, "".join(parts))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.streaming:
+            # ChatOpenAI routes this through _stream, which already handles the cache
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        key = self._cache_key(messages, stop, kwargs)
+        cached = self.response_cache.get(key) if key else None
+        if cached is not None:
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=cached))])
+
+        result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        message = result.generations[0].message if result.generations else None
+        if key and message is not None and not getattr(message, "tool_calls", None):
+            self.response_cache.set(key, str(message.content))
+        return result
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        key = self._cache_key(messages, stop, kwargs)
+        cached = self.response_cache.get(key) if key else None
+        if cached is not None:
+            for piece in _REPLAY_CHUNK.findall(cached):
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+                if run_manager:
+                    await run_manager.on_llm_new_token(piece, chunk=chunk)
+                yield chunk
+            return
+
+        parts: List[str] = []
+        cacheable = True
+        async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            if getattr(chunk.message, "tool_call_chunks", None):
+                cacheable = False
+            parts.append(str(chunk.message.content))
+            yield chunk
+        if key and cacheable:
+            self.response_cache.set(key, "".join(parts))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.streaming:
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        key = self._cache_key(messages, stop, kwargs)
+        cached = self.response_cache.get(key) if key else None
+        if cached is not None:
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=cached))])
+
+        result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        message = result.generations[0].message if result.generations else None
+        if key and message is not None and not getattr(message, "tool_calls", None):
+            self.response_cache.set(key, str(message.content))
+        return result
@@ -0,0 +1,196 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain.schema import SystemMessage, get_buffer_string
+from pydantic import PrivateAttr
+
+from app.controller.tokens import count_tokens
+
+# Tokens of recent conversation kept verbatim; older turns are summarized
+MEMORY_TOKEN_LIMIT = int(os.environ.get("MEMORY_TOKEN_LIMIT", 1024))
+
+# Summaries are produced off the request path. One thread is enough, the
+# model server would serialize them anyway.
+_summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+
+
+class TokenBudgetMemory(BaseChatMemory):
+    """
+    Conversation memory that keeps recent messages under a token budget.
+
+    When the window goes over max_token_limit, the oldest messages are moved
+    out of it and folded into a running summary by a background thread. The
+    summary is returned ahead of the window as a system message. Messages
+    waiting to be summarized are briefly absent from the context, which is
+    preferable to blocking the user's turn on an extra model call.
+
+    With a `store` (see conversations.py) every message, the steps of every
+    agent turn and the summary are also queued for the database under
+    `conversation_id`, and the first use of the memory loads the summary
+    and the newest messages that fit the budget, so a conversation can be
+    picked up after a restart or in another process.
+    """
+
+    llm: Any = None
+    memory_key: str = "chat_history"
+    max_token_limit: int = MEMORY_TOKEN_LIMIT
+    summary: str = ""
+    store: Any = None
+    conversation_id: Optional[str] = None
+
+    # Token count and store sequence number of each message in chat_memory.messages
+    _token_counts: List[int] = PrivateAttr(default_factory=list)
+    _seqs: List[int] = PrivateAttr(default_factory=list)
+    _window_tokens: int = PrivateAttr(default=0)
+    _pending: List[Any] = PrivateAttr(default_factory=list)
+    # Sequence number just after the last message moved out of the window
+    _pending_end: int = PrivateAttr(default=0)
+    # (from seq, to seq) of older messages still in the store, unsummarized; summarized first
+    _catch_up: Any = PrivateAttr(default=None)
+    _next_seq: int = PrivateAttr(default=0)
+    _loaded: bool = PrivateAttr(default=False)
+    _summarizing: bool = PrivateAttr(default=False)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def persistent(self):
+        return self.store is not None and bool(self.conversation_id)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def _load(self):
+        """Pull the conversation's summary and recent window from the store, once. Caller holds self._lock."""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.persistent:
+            return
+        # Our own queued writes first, or next_seq would reuse their seqs
+        self.store.flush()
+        data = self.store.load_window(self.conversation_id, self.max_token_limit)
+        window = data["window"]
+        self.chat_memory.messages[:0] = [message for _, message, _ in window]
+        self._seqs[:0] = [seq for seq, _, _ in window]
+        self._token_counts[:0] = [tokens for _, _, tokens in window]
+        self._window_tokens += sum(tokens for _, _, tokens in window)
+        self.summary = self.summary or data["summary"]
+        self._next_seq = max(self._next_seq, data["next_seq"])
+        if data["summarized_seq"] < data["window_start"]:
+            # Older turns the summary doesn't cover yet, e.g. the process stopped mid-summary
+            if self.llm is None:
+                self.store.set_summary(self.conversation_id, self.summary, data["window_start"])
+            else:
+                self._catch_up = (data["summarized_seq"], data["window_start"])
+        self._trim()
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._load()
+            messages = list(self.chat_memory.messages)
+            summary = self.summary
+        if summary:
+            messages = [SystemMessage(content=f"Summary of the earlier conversation: {summary}")] + messages
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        with self._lock:
+            self._load()
+            before = len(self.chat_memory.messages)
+            super().save_context(inputs, outputs)
+            rows = []
+            for message in self.chat_memory.messages[before:]:
+                tokens = count_tokens(get_buffer_string([message]))
+                self._token_counts.append(tokens)
+                self._seqs.append(self._next_seq)
+                self._window_tokens += tokens
+                rows.append((self._next_seq, message.type, message.content, tokens))
+                self._next_seq += 1
+            if self.persistent and rows:
+                self.store.append_messages(self.conversation_id, rows)
+                if outputs.get("intermediate_steps"):
+                    # The turn is identified by its input message
+                    self.store.append_steps(self.conversation_id, rows[0][0], outputs["intermediate_steps"])
+            self._trim()
+
+    def _trim(self):
+        # Caller holds self._lock
+        messages = self.chat_memory.messages
+        while self._window_tokens > self.max_token_limit and len(messages) > 1:
+            self._pending.append(messages.pop(0))
+            self._window_tokens -= self._token_counts.pop(0)
+            self._pending_end = self._seqs.pop(0) + 1
+        if (self._pending or self._catch_up) and not self._summarizing and self.llm is not None:
+            self._summarizing = True
+            _summarizer.submit(self._summarize)
+        elif self.llm is None and self._pending:
+            # Nothing to summarize with, just forget the old turns
+            self._pending.clear()
+            if self.persistent:
+                self.store.set_summary(self.conversation_id, self.summary, self._pending_end)
+
+    def _next_batch(self):
+        """
+        Messages to fold into the summary next, the seq just after them and,
+        for a batch read from the store, the _catch_up to restore if it fails.
+        Caller holds self._lock.
+        """
+        if self._catch_up:
+            # Stored messages older than anything in _pending go first, in seq order
+            start, end = self._catch_up
+            rows = self.store.load_backlog(self.conversation_id, start, end)
+            if rows:
+                batch_end = rows[-1][0] + 1
+                self._catch_up = (batch_end, end) if batch_end < end else None
+                return [message for _, message, _ in rows], batch_end, (start, end)
+            self._catch_up = None
+        pending, self._pending = self._pending, []
+        return pending, self._pending_end, None
+
+    def _summarize(self):
+        while True:
+            with self._lock:
+                pending, pending_end, catch_up = self._next_batch()
+                if not pending:
+                    self._summarizing = False
+                    return
+                summary = self.summary
+            try:
+                prompt = SUMMARY_PROMPT.format(summary=summary, new_lines=get_buffer_string(pending))
+                new_summary = self.llm.invoke(prompt).content
+            except Exception as e:
+                print(f"Error summarizing conversation: {e}")
+                with self._lock:
+                    # Put them back for the next turn's attempt instead of losing them
+                    if catch_up:
+                        self._catch_up = catch_up
+                    else:
+                        self._pending[:0] = pending
+                        self._pending_end = max(self._pending_end, pending_end)
+                    self._summarizing = False
+                return
+            with self._lock:
+                self.summary = new_summary
+                if self.persistent:
+                    self.store.set_summary(self.conversation_id, new_summary, pending_end)
+
+    def clear(self) -> None:
+        with self._lock:
+            super().clear()
+            self.summary = ""
+            self._token_counts = []
+            self._seqs = []
+            self._window_tokens = 0
+            self._pending = []
+            self._catch_up = None
+            self._loaded = True
+            if self.persistent:
+                # Everything so far is forgotten, also for later loads
+                self.store.set_summary(self.conversation_id, "", self._next_seq)
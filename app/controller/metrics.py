@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import bisect
+import threading
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+from app.controller.tokens import count_tokens
+
+# Optional JSONL file that gets one trace (every LLM and tool span) per request
+TRACE_EXPORT = os.environ.get("AGENT_TRACE_EXPORT")
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+TOKEN_BUCKETS = (64, 256, 1024, 2048, 4096, 8192, 16384)
+BYTE_BUCKETS = (100, 1000, 10000, 100000, 1000000)
+ITERATION_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = ('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label key -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, entry in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, entry):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {entry[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {entry[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {entry[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Counters and histograms rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+LLM_CALLS = registry.counter("agent_llm_calls_total", "Model calls", ["status"])
+LLM_TTFT = registry.histogram("agent_llm_time_to_first_token_seconds", "Time from request to the first streamed token")
+LLM_DURATION = registry.histogram("agent_llm_duration_seconds", "Duration of a model call")
+LLM_TOKEN_RATE = registry.histogram(
+    "agent_llm_tokens_per_second", "Completion tokens per second after the first token", buckets=TOKEN_RATE_BUCKETS
+)
+LLM_PROMPT_TOKENS = registry.histogram("agent_llm_prompt_tokens", "Prompt tokens per model call", buckets=TOKEN_BUCKETS)
+LLM_PROMPT_TOKENS_TOTAL = registry.counter("agent_llm_prompt_tokens_total", "Prompt tokens sent")
+LLM_COMPLETION_TOKENS_TOTAL = registry.counter("agent_llm_completion_tokens_total", "Completion tokens received")
+TOOL_CALLS = registry.counter("agent_tool_calls_total", "Tool calls", ["tool", "status"])
+TOOL_DURATION = registry.histogram("agent_tool_duration_seconds", "Duration of a tool call", ["tool"])
+TOOL_OUTPUT_BYTES = registry.histogram("agent_tool_output_bytes", "Size of a tool's output", ["tool"], BYTE_BUCKETS)
+REQUESTS = registry.counter("agent_requests_total", "Requests handled", ["path", "status"])
+REQUEST_DURATION = registry.histogram("agent_request_duration_seconds", "End-to-end latency of a request", ["path"])
+REQUEST_ITERATIONS = registry.histogram(
+    "agent_request_iterations", "Model calls per request", ["path"], ITERATION_BUCKETS
+)
+
+
+class TraceExporter:
+    """Appends finished request traces to a JSONL file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, trace):
+        line = json.dumps(trace, default=str) + "\n"
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+trace_exporter = TraceExporter(TRACE_EXPORT) if TRACE_EXPORT else None
+
+
+def _message_text(messages):
+    return "\n".join(str(message.content) for batch in messages for message in batch)
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Records spans for every model and tool call of a session's requests.
+
+    Each span feeds the registry's histograms and counters as it ends. The
+    session wraps every request in start_request/end_request, which adds the
+    end-to-end latency and iteration count and, when AGENT_TRACE_EXPORT is
+    set, writes the request's spans as one JSONL trace.
+    """
+
+    def __init__(self, sid=None):
+        super().__init__()
+        self.sid = sid
+        self.lock = threading.Lock()
+        self.open_spans = {}  # run_id -> span
+        self.trace = None
+
+    # Requests
+
+    def start_request(self, input_text):
+        with self.lock:
+            self.open_spans.clear()
+            self.trace = {
+                "sid": self.sid,
+                "input": input_text[:200],
+                "start": time.time(),
+                "started": time.perf_counter(),
+                "spans": [],
+            }
+
+    def end_request(self, path, status):
+        with self.lock:
+            trace, self.trace = self.trace, None
+        if trace is None:
+            return None
+        duration = time.perf_counter() - trace.pop("started")
+        iterations = sum(1 for span in trace["spans"] if span["kind"] == "llm")
+        REQUESTS.inc(path=path, status=status)
+        REQUEST_DURATION.observe(duration, path=path)
+        REQUEST_ITERATIONS.observe(iterations, path=path)
+        trace.update({"path": path, "status": status, "duration": duration, "iterations": iterations})
+        if trace_exporter:
+            trace_exporter.export(trace)
+        return trace
+
+    def _open(self, run_id, kind, name, **attrs):
+        with self.lock:
+            self.open_spans[run_id] = {
+                "kind": kind,
+                "name": name,
+                "offset": time.perf_counter() - self.trace["started"] if self.trace else 0.0,
+                "started": time.perf_counter(),
+                **attrs,
+            }
+
+    def _close(self, run_id, **attrs):
+        now = time.perf_counter()
+        with self.lock:
+            span = self.open_spans.pop(run_id, None)
+            if span is None:
+                return None
+            span["duration"] = now - span.pop("started")
+            span.update(attrs)
+            if self.trace is not None:
+                self.trace["spans"].append(span)
+        return span
+
+    # Model calls
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._open(run_id, "llm", (serialized or {}).get("name", "llm"),
+                   prompt_tokens=count_tokens(_message_text(messages)), completion_tokens=0, ttft=None)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._open(run_id, "llm", (serialized or {}).get("name", "llm"),
+                   prompt_tokens=count_tokens("\n".join(prompts)), completion_tokens=0, ttft=None)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self.lock:
+            span = self.open_spans.get(run_id)
+            if span is None:
+                return
+            if span["ttft"] is None:
+                span["ttft"] = time.perf_counter() - span["started"]
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        text = "".join(generation.text for generations in response.generations for generation in generations)
+        completion_tokens = usage.get("completion_tokens") or count_tokens(text)
+        span = self._close(run_id, completion_tokens=completion_tokens)
+        if span is None:
+            return
+        if usage.get("prompt_tokens"):
+            span["prompt_tokens"] = usage["prompt_tokens"]
+        LLM_CALLS.inc(status="ok")
+        LLM_DURATION.observe(span["duration"])
+        LLM_PROMPT_TOKENS.observe(span["prompt_tokens"])
+        LLM_PROMPT_TOKENS_TOTAL.inc(span["prompt_tokens"])
+        LLM_COMPLETION_TOKENS_TOTAL.inc(completion_tokens)
+        if span["ttft"] is not None:
+            LLM_TTFT.observe(span["ttft"])
+            generating = span["duration"] - span["ttft"]
+            if generating > 0 and completion_tokens > 1:
+                span["tokens_per_sec"] = (completion_tokens - 1) / generating
+                LLM_TOKEN_RATE.observe(span["tokens_per_sec"])
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        span = self._close(run_id, error=str(error))
+        if span is not None:
+            LLM_CALLS.inc(status="error")
+            LLM_DURATION.observe(span["duration"])
+
+    # Tool calls
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._open(run_id, "tool", (serialized or {}).get("name", "tool"), input_bytes=len(str(input_str)))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        size = len(str(output).encode("utf-8", errors="replace"))
+        span = self._close(run_id, output_bytes=size)
+        if span is None:
+            return
+        # Tools report most failures as an "Error: ..." observation rather than raising
+        status = "error" if str(output).startswith("Error") else "ok"
+        TOOL_CALLS.inc(tool=span["name"], status=status)
+        TOOL_DURATION.observe(span["duration"], tool=span["name"])
+        TOOL_OUTPUT_BYTES.observe(size, tool=span["name"])
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        span = self._close(run_id, error=str(error))
+        if span is not None:
+            TOOL_CALLS.inc(tool=span["name"], status="error")
+            TOOL_DURATION.observe(span["duration"], tool=span["name"])
@@ -0,0 +1,237 @@
+import os
+import asyncio
+import posixpath
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentStep
+
+from app.controller.early_dispatch import (
+    Speculation, current_speculation, thread_submit, task_submit, SPECULATIVE_TOOLS
+)
+from app.controller.compaction import (
+    compact_step, fit_scratchpad, OBSERVATION_TOKEN_LIMIT, SCRATCHPAD_TOKEN_LIMIT
+)
+from app.tools.file_tools import parse_input_string, parse_manifest
+
+# Threads shared by every session for running the actions of a multi-action step
+TOOL_WORKERS = int(os.environ.get("AGENT_TOOL_WORKERS", 8))
+
+# Tools that only look at the projects directory (or the web), under both
+# the key=value and the structured names
+READ_ONLY_TOOLS = {
+    "Read File", "File Exists", "List Files", "Search Files", "Search Online", "Show Current Directory",
+    "read_file", "file_exists", "list_files", "search_files", "search_online", "show_current_directory",
+    "Recall Observation", "recall_observation", "Query Documents", "query_documents",
+}
+# Read-only tools that touch no files at all
+NO_FILE_TOOLS = {
+    "Search Online", "search_online", "Show Current Directory", "show_current_directory",
+    "Recall Observation", "recall_observation",
+}
+# Read-only tools that look at the whole tree unless given a path
+TREE_TOOLS = {"List Files", "Search Files", "Query Documents", "list_files", "search_files", "query_documents"}
+WRITE_FILES_TOOLS = {"Write Files", "write_files"}
+# Mutating tools whose targets can land anywhere in the tree
+BULK_TOOLS = {"Bulk Files", "bulk_files", "Rename Files", "rename_files"}
+PATH_ARGS = ("filepath", "filename", "path", "old_name", "new_name")
+# Stands for "the whole projects directory"; overlaps every path
+ALL_PATHS = ""
+
+_pool = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+
+
+def _normalize(path):
+    path = posixpath.normpath(str(path).replace("\\", "/")).lstrip("/")
+    return "" if path == "." else path
+
+
+def _overlaps(a, b):
+    return a == ALL_PATHS or b == ALL_PATHS or a == b or a.startswith(b + "/") or b.startswith(a + "/")
+
+
+def action_footprint(action):
+    """
+    Return (read_only, paths) for an action.
+
+    Mutating tools whose paths can't be determined (terminal commands, bulk
+    renames, unknown tools) claim the whole projects directory.
+    """
+    tool = action.tool
+    tool_input = action.tool_input
+    read_only = tool in READ_ONLY_TOOLS
+    if tool in NO_FILE_TOOLS:
+        return True, set()
+    if tool in BULK_TOOLS:
+        return False, {ALL_PATHS}
+    if tool in WRITE_FILES_TOOLS:
+        try:
+            return False, {_normalize(path) for path, _ in parse_manifest(tool_input)}
+        except (ValueError, TypeError):
+            return False, {ALL_PATHS}
+    args = tool_input if isinstance(tool_input, dict) else parse_input_string(str(tool_input))
+    paths = {_normalize(args[name]) for name in PATH_ARGS if args.get(name)}
+    if not paths and (tool in TREE_TOOLS or not read_only):
+        paths = {ALL_PATHS}
+    return read_only, paths
+
+
+def plan_waves(actions):
+    """
+    Split a step's actions into waves that can each run concurrently.
+
+    Two actions conflict when at least one of them mutates a path the other
+    touches; an action goes in the wave after the last earlier action it
+    conflicts with, so writes to a path stay in the order the model gave
+    them and reads see the writes listed before them.
+
+    Returns:
+        list: Lists of indexes into actions, in execution order.
+    """
+    footprints = [action_footprint(action) for action in actions]
+    levels = []
+    for i, (read_only, paths) in enumerate(footprints):
+        level = 0
+        for j in range(i):
+            other_read_only, other_paths = footprints[j]
+            if read_only and other_read_only:
+                continue
+            if any(_overlaps(a, b) for a in paths for b in other_paths):
+                level = max(level, levels[j] + 1)
+        levels.append(level)
+    waves = [[] for _ in range(max(levels, default=-1) + 1)]
+    for i, level in enumerate(levels):
+        waves[level].append(i)
+    return waves
+
+
+class _PendingAction:
+    """An action whose execution was deferred so the whole step can be scheduled at once."""
+
+    def __init__(self, action, args):
+        self.action = action
+        self.args = args
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor that runs the independent actions of a multi-action step
+    concurrently.
+
+    Actions are planned into waves with plan_waves: read-only tools on
+    different (or the same) paths run side by side on a shared thread pool,
+    while mutating tools stay ordered with everything they touch. The
+    observations are returned in the order the model listed the actions,
+    as one scratchpad update. Single-action steps run inline as before.
+
+    Observations are compacted to observation_token_limit tokens before
+    they reach the scratchpad, and the scratchpad as a whole is kept under
+    scratchpad_token_limit. None disables either limit.
+    """
+
+    observation_token_limit: Optional[int] = OBSERVATION_TOKEN_LIMIT
+    scratchpad_token_limit: Optional[int] = SCRATCHPAD_TOKEN_LIMIT
+
+    def _prepare_intermediate_steps(self, intermediate_steps):
+        steps = super()._prepare_intermediate_steps(intermediate_steps)
+        return fit_scratchpad(steps, self.scratchpad_token_limit)
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        return _PendingAction(agent_action, (name_to_tool_map, color_mapping, agent_action, run_manager))
+
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        return _PendingAction(agent_action, (name_to_tool_map, color_mapping, agent_action, run_manager))
+
+    def _speculation(self, name_to_tool_map, color_mapping, run_manager, submit):
+        if not SPECULATIVE_TOOLS:
+            return None
+        return Speculation(self, name_to_tool_map, color_mapping, run_manager, submit)
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        pending = []
+        speculation = self._speculation(name_to_tool_map, color_mapping, run_manager, thread_submit(_pool))
+        # The model wrapper (EarlyDispatchChatModel) starts read-only actions on it while streaming
+        token = current_speculation.set(speculation)
+        try:
+            for item in super()._iter_next_step(
+                name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+            ):
+                if isinstance(item, _PendingAction):
+                    pending.append(item)
+                else:
+                    yield item
+        finally:
+            current_speculation.reset(token)
+        yield from self._run_pending(pending, speculation)
+
+    def _run_pending(self, pending, speculation=None):
+        def perform(name_to_tool_map, color_mapping, agent_action, run_manager=None):
+            run = speculation.take(agent_action) if speculation else None
+            if run is None:
+                return super(ParallelAgentExecutor, self)._perform_agent_action(
+                    name_to_tool_map, color_mapping, agent_action, run_manager
+                )
+            if run_manager:
+                run_manager.on_agent_action(agent_action, color="green")
+            return AgentStep(action=agent_action, observation=run.result())
+
+        try:
+            return self._run_waves(pending, perform)
+        finally:
+            if speculation:
+                speculation.discard()
+
+    def _run_waves(self, pending, perform):
+        if len(pending) == 1:
+            return [compact_step(perform(*pending[0].args), self.observation_token_limit)]
+        results = [None] * len(pending)
+        for wave in plan_waves([item.action for item in pending]):
+            futures = {
+                # Copy the context so per-session state such as the command output sink follows the tool
+                i: _pool.submit(contextvars.copy_context().run, perform, *pending[i].args)
+                for i in wave[1:]
+            }
+            # The calling thread takes the first action of each wave itself
+            results[wave[0]] = perform(*pending[wave[0]].args)
+            for i, future in futures.items():
+                results[i] = future.result()
+        return [compact_step(step, self.observation_token_limit) for step in results]
+
+    async def _aiter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        pending = []
+        speculation = self._speculation(name_to_tool_map, color_mapping, run_manager, task_submit)
+        token = current_speculation.set(speculation)
+        try:
+            async for item in super()._aiter_next_step(
+                name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager
+            ):
+                if isinstance(item, _PendingAction):
+                    pending.append(item)
+                else:
+                    yield item
+        finally:
+            current_speculation.reset(token)
+
+        async def perform(name_to_tool_map, color_mapping, agent_action, run_manager=None):
+            run = speculation.take(agent_action) if speculation else None
+            if run is None:
+                return await super(ParallelAgentExecutor, self)._aperform_agent_action(
+                    name_to_tool_map, color_mapping, agent_action, run_manager
+                )
+            if run_manager:
+                await run_manager.on_agent_action(agent_action, color="green")
+            return AgentStep(action=agent_action, observation=await run)
+
+        results = [None] * len(pending)
+        try:
+            for wave in plan_waves([item.action for item in pending]):
+                steps = await asyncio.gather(*[perform(*pending[i].args) for i in wave])
+                for i, step in zip(wave, steps):
+                    results[i] = step
+        finally:
+            if speculation:
+                speculation.discard()
+        for step in results:
+            yield compact_step(step, self.observation_token_limit)
@@ -0,0 +1,207 @@
+import re
+import json
+import threading
+
+from langchain.agents import AgentOutputParser
+from langchain.agents.mrkl.output_parser import MRKLOutputParser
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.exceptions import OutputParserException
+
+from app.tools.file_tools import parse_input_string
+
+# The action AgentExecutor records when the output parser failed and the
+# error was sent back to the model (handle_parsing_errors=True)
+PARSE_ERROR_ACTION = "_Exception"
+VALIDATION_ERROR_OBSERVATION = "Tool input validation error"
+
+_FENCED_JSON = re.compile(r"```(?:json)?\s*([\[{].*?[\]}])\s*```", re.DOTALL)
+_LEGACY_ACTION = re.compile(r"Action\s*:\s*(.*?)\s*\n+\s*Action\s*Input\s*:\s*(.*)", re.DOTALL)
+# One Action/Action Input pair, ending where the next pair (or anything else the
+# model might write after it) begins
+_ACTION_BLOCK = re.compile(
+    r"Action\s*\d*\s*:[ \t]*(.*?)\s*\n\s*Action\s*\d*\s*Input\s*\d*\s*:[ \t]*(.*?)"
+    r"(?=\n\s*(?:Action\s*\d*\s*:|Thought\s*:|Observation|Final Answer:)|\Z)",
+    re.DOTALL
+)
+
+JSON_FORMAT_ERROR = (
+    "Invalid format. Reply with exactly one JSON object like "
+    '{"action": "<tool name>", "action_input": {...}} '
+    'or {"action": "Final Answer", "action_input": "<answer>"}.'
+)
+
+
+def _tool_input(action_input):
+    """
+    key=value strings become argument dicts; a bare string is kept as it is,
+    so the tool fills its single schema field with it.
+    """
+    if isinstance(action_input, str) and "=" not in action_input:
+        return action_input.strip().strip('"')
+    return parse_input_string(action_input)
+
+
+def _is_action(blob):
+    return isinstance(blob, dict) and "action" in blob
+
+
+def _find_json_blobs(text):
+    """
+    Decode the first JSON action object, or list of action objects, in the text.
+
+    Returns:
+        list: The action blobs, or None if there are none.
+    """
+    decoder = json.JSONDecoder()
+    match = _FENCED_JSON.search(text)
+    candidates = [match.group(1)] if match else []
+    starts = sorted(i for i in (text.find("{"), text.find("[")) if i != -1)
+    candidates.extend(text[start:] for start in starts)
+    for candidate in candidates:
+        try:
+            blob, _ = decoder.raw_decode(candidate)
+        except ValueError:
+            continue
+        if _is_action(blob):
+            return [blob]
+        if isinstance(blob, list) and blob and all(_is_action(item) for item in blob):
+            return blob
+    return None
+
+
+class StructuredActionOutputParser(AgentOutputParser):
+    """
+    Parse a single JSON action blob in one pass.
+
+    If the model falls back to the ReAct text format ("Action: ... /
+    Action Input: key=value"), that is still accepted and parsed with
+    parse_input_string, so small models that drift between formats don't
+    cost a retry. An input without key=value pairs (e.g. "index.html") is
+    passed on as a bare string for the tool's single field. A JSON list of action objects is parsed into several
+    actions, which the executor runs in one step.
+    """
+
+    tool_names: list = []
+
+    def _tool_name(self, name):
+        name = str(name).strip().strip("`'\"")
+        if name in self.tool_names:
+            return name
+        # Map legacy names such as "Read File" onto "read_file"
+        normalized = re.sub(r"\W+", "_", name).strip("_").lower()
+        return normalized if normalized in self.tool_names else name
+
+    def parse(self, text):
+        blobs = _find_json_blobs(text)
+        if blobs is not None:
+            actions = []
+            finish = None
+            for blob in blobs:
+                action = blob["action"]
+                action_input = blob.get("action_input", {})
+                if str(action).strip().lower() == "final answer":
+                    if finish is None:
+                        output = action_input if isinstance(action_input, str) else json.dumps(action_input)
+                        finish = AgentFinish({"output": output}, text)
+                    continue
+                if isinstance(action_input, str):
+                    action_input = _tool_input(action_input)
+                # The whole reply goes into the scratchpad once, with the first action
+                log = text if not actions else json.dumps(blob)
+                actions.append(AgentAction(self._tool_name(action), action_input, log))
+            # A final answer next to pending actions was written before seeing their results
+            if not actions:
+                return finish
+            return actions[0] if len(actions) == 1 else actions
+
+        if "Final Answer:" in text:
+            return AgentFinish({"output": text.split("Final Answer:")[-1].strip()}, text)
+
+        match = _LEGACY_ACTION.search(text)
+        if match:
+            action_input = match.group(2).split("\nObservation")[0].strip()
+            return AgentAction(self._tool_name(match.group(1)), _tool_input(action_input), text)
+
+        raise OutputParserException(
+            f"Could not parse LLM output: `{text}`",
+            observation=JSON_FORMAT_ERROR,
+            llm_output=text,
+            send_to_llm=True,
+        )
+
+    @property
+    def _type(self):
+        return "structured_action"
+
+
+class MultiActionOutputParser(MRKLOutputParser):
+    """
+    ReAct parser that accepts several Action/Action Input pairs in one reply.
+
+    Each action's log is its own slice of the reply (the first one includes
+    the leading thought), so the scratchpad reads as a regular
+    Action/Observation sequence. Replies with a single action are parsed
+    exactly as MRKLOutputParser does.
+    """
+
+    def parse(self, text):
+        matches = list(_ACTION_BLOCK.finditer(text))
+        if len(matches) < 2:
+            return super().parse(text)
+        actions = []
+        start = 0
+        for match in matches:
+            tool_input = match.group(2).strip().strip('"')
+            actions.append(AgentAction(match.group(1).strip(), tool_input, text[start:match.end()]))
+            start = match.end()
+        return actions
+
+    @property
+    def _type(self):
+        return "multi_action_mrkl"
+
+
+class ParseStats:
+    """Counts how many agent iterations are spent on malformed tool calls."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tasks = 0
+        self.tasks_with_retries = 0
+        self.parse_failures = 0
+        self.invalid_tool_inputs = 0
+        self.max_retries_in_task = 0
+
+    def record(self, intermediate_steps):
+        """Record one finished task. Returns the number of retries it needed."""
+        parse_failures = 0
+        invalid_inputs = 0
+        for action, observation in intermediate_steps or []:
+            if getattr(action, "tool", None) == PARSE_ERROR_ACTION:
+                parse_failures += 1
+            elif str(observation).startswith(VALIDATION_ERROR_OBSERVATION):
+                invalid_inputs += 1
+        retries = parse_failures + invalid_inputs
+        with self.lock:
+            self.tasks += 1
+            self.parse_failures += parse_failures
+            self.invalid_tool_inputs += invalid_inputs
+            if retries:
+                self.tasks_with_retries += 1
+            self.max_retries_in_task = max(self.max_retries_in_task, retries)
+        return retries
+
+    def snapshot(self):
+        with self.lock:
+            retries = self.parse_failures + self.invalid_tool_inputs
+            return {
+                "tasks": self.tasks,
+                "tasks_with_retries": self.tasks_with_retries,
+                "parse_failures": self.parse_failures,
+                "invalid_tool_inputs": self.invalid_tool_inputs,
+                "retries_per_task": retries / self.tasks if self.tasks else 0.0,
+                "max_retries_in_task": self.max_retries_in_task,
+            }
+
+
+parse_stats = ParseStats()
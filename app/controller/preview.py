@@ -0,0 +1,311 @@
+"""
+Preview of the generated projects: what the /preview/ routes of app.py and
+app/async_server.py serve.
+
+Every file gets a strong ETag from a hash of its content, so a browser
+revalidating an unchanged asset gets a 304 even after the agent rewrote it
+with the same bytes. Compressible files are served from gzip (and brotli,
+if the brotli package is installed) variants cached by content hash; other
+files are left to the server's sendfile path. The file tools report every
+write, rename and delete through the project index, which drops the cached
+entry and, with live reload on, tells subscribed preview pages over
+Socket.IO to reload.
+"""
+import os
+import gzip
+import stat
+import time
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+
+from app.tools import file_tools
+from app.tools.file_tools import add_index_listener
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bytes of compressed and injected variants kept in memory
+PREVIEW_CACHE_BYTES = int(os.environ.get("PREVIEW_CACHE_BYTES", 32 * 1024 * 1024))
+# Inject a script into previewed HTML pages that reloads them when a project file changes
+PREVIEW_LIVE_RELOAD = os.environ.get("PREVIEW_LIVE_RELOAD", "1") == "1"
+# Changes closer together than this are sent as one reload
+PREVIEW_RELOAD_DELAY = float(os.environ.get("PREVIEW_RELOAD_DELAY", 0.2))
+
+# Smaller files aren't worth compressing; larger ones are streamed as they are
+COMPRESS_MIN_BYTES = 512
+COMPRESS_MAX_BYTES = 8 * 1024 * 1024
+COMPRESSIBLE_TYPES = {
+    "application/javascript", "application/json", "application/xml", "application/wasm",
+    "image/svg+xml", "text/javascript",
+}
+# Preferred first
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# Socket.IO room of the preview pages that asked for reloads
+PREVIEW_ROOM = "preview"
+RELOAD_EVENT = "preview_reload"
+RELOAD_SCRIPT = (
+    b'<script src="https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.0.1/socket.io.js"></script>\n'
+    b"<script>(function () {\n"
+    b"  var socket = io();\n"
+    b"  socket.on('connect', function () { socket.emit('preview_subscribe'); });\n"
+    b"  socket.on('" + RELOAD_EVENT.encode() + b"', function () { location.reload(); });\n"
+    b"})();</script>\n"
+)
+
+_HASH_CHUNK = 1 << 20
+
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _inject_reload(html):
+    """Insert RELOAD_SCRIPT before the last </body>, or at the end."""
+    cut = html.lower().rfind(b"</body>")
+    if cut == -1:
+        return html + RELOAD_SCRIPT
+    return html[:cut] + RELOAD_SCRIPT + html[cut:]
+
+
+def accepted_encodings(accept_encoding):
+    """The content codings an Accept-Encoding header allows (q > 0), lower-cased."""
+    accepted = set()
+    for part in (accept_encoding or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding)
+    return accepted
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header matches etag (weak comparison, as RFC 9110 asks for it)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class PreviewFile:
+    """What to send for one request: either `body` or the file at `path` as it is."""
+
+    def __init__(self, path, content_type, etag, size, body=None, encoding=None):
+        self.path = path
+        self.content_type = content_type
+        self.etag = etag
+        self.size = size
+        self.body = body
+        self.encoding = encoding
+
+    def headers(self):
+        headers = {
+            "ETag": self.etag,
+            # Browsers may keep everything but must revalidate, which costs a 304 when nothing changed
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if self.encoding:
+            headers["Content-Encoding"] = self.encoding
+        return headers
+
+
+class PreviewCache:
+    """
+    Content hashes by path and encoded variants by content hash.
+
+    An entry is trusted while the file's (size, mtime, inode) is unchanged,
+    so files changed behind the tools' back are hashed again on the next
+    request; the variants are kept in LRU order under PREVIEW_CACHE_BYTES.
+    """
+
+    def __init__(self, max_bytes=PREVIEW_CACHE_BYTES, live_reload=PREVIEW_LIVE_RELOAD):
+        self.max_bytes = max_bytes
+        self.live_reload = live_reload
+        self.entries = {}  # relpath -> ((size, mtime_ns, inode), content hash, content type)
+        self.variants = OrderedDict()  # (content hash, variant) -> bytes
+        self.cached_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, path):
+        """Map a preview URL path to (relpath, absolute file path), or None if it is outside PROJECTS_DIR."""
+        projects_dir = file_tools.PROJECTS_DIR
+        target = os.path.abspath(os.path.join(projects_dir, path.lstrip("/")))
+        if os.path.commonpath([target, projects_dir]) != projects_dir:
+            return None
+        if os.path.isdir(target):
+            target = os.path.join(target, "index.html")
+        return os.path.relpath(target, projects_dir).replace(os.sep, "/"), target
+
+    def needs_slash(self, path):
+        """Whether path names a directory without its trailing slash; relative links on its index page need one."""
+        if path.endswith("/") or not path:
+            return False
+        resolved = os.path.abspath(os.path.join(file_tools.PROJECTS_DIR, path.lstrip("/")))
+        return os.path.isdir(resolved)
+
+    def invalidate(self, rel):
+        """Index listener: forget a changed file, or everything when rel is None."""
+        with self.lock:
+            if rel is None:
+                self.entries.clear()
+                self.variants.clear()
+                self.cached_bytes = 0
+                return
+            entry = self.entries.pop(rel, None)
+            if entry is None:
+                return
+            content_hash = entry[1]
+            # Copies of the file share its variants
+            if any(other[1] == content_hash for other in self.entries.values()):
+                return
+            for key in [key for key in self.variants if key[0] == content_hash]:
+                self.cached_bytes -= len(self.variants.pop(key))
+
+    def _hash(self, target, signature, rel):
+        with self.lock:
+            entry = self.entries.get(rel)
+            if entry is not None and entry[0] == signature:
+                return entry[1], entry[2]
+        digest = hashlib.blake2b(digest_size=16)
+        with open(target, "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+                digest.update(chunk)
+        content_type = mimetypes.guess_type(target)[0] or "application/octet-stream"
+        with self.lock:
+            self.entries[rel] = (signature, digest.hexdigest(), content_type)
+        return digest.hexdigest(), content_type
+
+    def _variant(self, content_hash, variant, build):
+        key = (content_hash, variant)
+        with self.lock:
+            data = self.variants.get(key)
+            if data is not None:
+                self.variants.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+        data = build()
+        if len(data) > self.max_bytes:
+            return data
+        with self.lock:
+            if key not in self.variants:
+                self.variants[key] = data
+                self.cached_bytes += len(data)
+            while self.cached_bytes > self.max_bytes:
+                _, evicted = self.variants.popitem(last=False)
+                self.cached_bytes -= len(evicted)
+        return data
+
+    def lookup(self, path, accept_encoding=""):
+        """
+        Work out the response for a preview path.
+
+        Returns:
+            PreviewFile or None: None when there is no such file.
+        """
+        resolved = self.resolve(path)
+        if resolved is None:
+            return None
+        rel, target = resolved
+        try:
+            st = os.stat(target)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        content_hash, content_type = self._hash(target, (st.st_size, st.st_mtime_ns, st.st_ino), rel)
+
+        inject = self.live_reload and content_type == "text/html"
+        compressible = (content_type.startswith("text/") or content_type in COMPRESSIBLE_TYPES) \
+            and COMPRESS_MIN_BYTES <= st.st_size <= COMPRESS_MAX_BYTES
+        encoding = next((coding for coding in ENCODINGS if coding in accepted_encodings(accept_encoding)), None) \
+            if compressible else None
+        if not inject and encoding is None:
+            return PreviewFile(target, content_type, f'"{content_hash}"', st.st_size)
+
+        def source():
+            with open(target, "rb") as f:
+                data = f.read()
+            return _inject_reload(data) if inject else data
+
+        suffix = "-lr" if inject else ""
+        if encoding is None:
+            body = self._variant(content_hash, "identity" + suffix, source)
+            return PreviewFile(target, content_type, f'"{content_hash}{suffix}"', len(body), body)
+        body = self._variant(content_hash, encoding + suffix, lambda: _compress(source(), encoding))
+        return PreviewFile(target, content_type, f'"{content_hash}{suffix}-{encoding}"', len(body), body, encoding)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "files": len(self.entries),
+                "variants": len(self.variants),
+                "cached_bytes": self.cached_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "encodings": list(ENCODINGS),
+                "live_reload": self.live_reload,
+            }
+
+
+class LiveReload:
+    """
+    Collects changed paths from the project index and hands them to `emit`
+    in batches, from a thread of its own so the index lock is never held
+    while sending.
+    """
+
+    def __init__(self, emit, delay=PREVIEW_RELOAD_DELAY):
+        self.emit = emit
+        self.delay = delay
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="preview-reload", daemon=True)
+
+    def start(self):
+        add_index_listener(self.notify)
+        self.thread.start()
+        return self
+
+    def notify(self, rel):
+        if rel is not None and rel.rpartition("/")[2].startswith(".") and rel.endswith(".tmp"):
+            # The file tools' staging files, renamed into place right after
+            return
+        with self.lock:
+            self.pending.add("*" if rel is None else rel)
+        self.event.set()
+
+    def _run(self):
+        while True:
+            self.event.wait()
+            # Let the rest of a multi-file write arrive
+            time.sleep(self.delay)
+            self.event.clear()
+            with self.lock:
+                paths, self.pending = sorted(self.pending), set()
+            if paths:
+                try:
+                    self.emit({"paths": paths})
+                except Exception as e:
+                    print(f"Preview reload failed: {e}")
+
+
+preview_cache = PreviewCache()
+add_index_listener(preview_cache.invalidate)
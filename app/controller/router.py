@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import deque
+
+from langchain_core.agents import AgentFinish
+from langchain_core.messages import SystemMessage, HumanMessage
+
+# How requests are routed between a plain chat completion and the agent:
+#   heuristic - keyword rules only, no extra model call (default)
+#   llm       - rules first; requests they can't place are classified by a
+#               one-word model call
+#   off       - everything goes to the agent
+ROUTER_MODE = os.environ.get("AGENT_ROUTER", "heuristic")
+# Optional JSONL file that gets one line per routing decision, for tuning the rules
+ROUTER_LOG = os.environ.get("AGENT_ROUTER_LOG")
+# Recent decisions kept in memory for /api/router-stats
+RECENT_DECISIONS = 50
+
+DIRECT = "direct"
+AGENT = "agent"
+
+DIRECT_PROMPT = '''You are an AI assistant specialized in building webpages. Answer the user's message directly and concisely.'''
+
+CLASSIFY_PROMPT = '''Decide whether the assistant needs tools (files, terminal commands or web search) to handle the user's message.
+Reply with exactly one word: TOOLS or DIRECT.'''
+
+# Anything that points at the file system, the terminal or fresh information from the web
+_TOOL_PATTERNS = [
+    (name, re.compile(pattern, re.IGNORECASE)) for name, pattern in [
+        ("file", r"\b(files?|folders?|director(y|ies)|paths?|projects? dir\w*)\b"),
+        ("file-op", r"\b(create|write|read|open|save|delete|remove|rename|move|copy|list|edit|update|modify|append)\b.*\b(file|page|folder|html|css|js|script|stylesheet|directory)\b"),
+        ("filename", r"[\w-]+\.(html?|css|js|jsx|ts|tsx|json|md|txt|py|yml|yaml|xml|svg|png|jpg)\b"),
+        ("path", r"(^|\s)\.{0,2}/[\w.-]+|\w+/[\w.-]+\.\w+"),
+        ("command", r"\b(run|execute|install|terminal|command|shell|npm|npx|pip|git|ls|mkdir|python3?)\b"),
+        ("build", r"\b(build|make|generate|scaffold|set up|setup)\b.*\b(site|website|webpage|page|app|project|landing)\b"),
+        ("web", r"\b(search|look up|lookup|google|browse|latest|news|today|current(ly)?|price|weather|release[sd]?)\b"),
+    ]
+]
+# Small talk and questions about concepts, which the model answers from what it knows
+_DIRECT_PATTERNS = [
+    (name, re.compile(pattern, re.IGNORECASE)) for name, pattern in [
+        ("greeting", r"^\s*(hi|hello|hey|thanks|thank you|good (morning|afternoon|evening)|bye)\b"),
+        ("question", r"^\s*(what|why|how|who|when|which|explain|describe|tell me|can you explain|is|are|does|do)\b"),
+    ]
+]
+# Longer inputs are usually task descriptions; leave those to the agent unless the model says otherwise
+MAX_DIRECT_WORDS = 40
+
+
+class RouteDecision:
+    def __init__(self, path, reason, elapsed):
+        self.path = path
+        self.reason = reason
+        self.elapsed = elapsed
+
+
+def classify(input_text):
+    """
+    Apply the keyword rules.
+
+    Returns:
+        tuple: (path, reason), where path is None if the rules can't tell.
+    """
+    for name, pattern in _TOOL_PATTERNS:
+        if pattern.search(input_text):
+            return AGENT, name
+    if len(input_text.split()) > MAX_DIRECT_WORDS:
+        return None, "long"
+    for name, pattern in _DIRECT_PATTERNS:
+        if pattern.search(input_text):
+            return DIRECT, name
+    return None, "no-rule"
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class RouterStats:
+    """Counts routing decisions and keeps the latency of each path."""
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.decisions = {DIRECT: 0, AGENT: 0}
+        self.reasons = {}
+        self.router_ms = deque(maxlen=window)
+        self.total_ms = {DIRECT: deque(maxlen=window), AGENT: deque(maxlen=window)}
+        self.recent = deque(maxlen=RECENT_DECISIONS)
+
+    def record(self, input_text, decision, total_seconds):
+        entry = {
+            "time": time.time(),
+            "input": input_text[:200],
+            "path": decision.path,
+            "reason": decision.reason,
+            "router_ms": round(decision.elapsed * 1000, 2),
+            "total_ms": round(total_seconds * 1000, 1),
+        }
+        with self.lock:
+            self.decisions[decision.path] += 1
+            self.reasons[decision.reason] = self.reasons.get(decision.reason, 0) + 1
+            self.router_ms.append(entry["router_ms"])
+            self.total_ms[decision.path].append(entry["total_ms"])
+            self.recent.append(entry)
+        if ROUTER_LOG:
+            with open(ROUTER_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "mode": ROUTER_MODE,
+                "decisions": dict(self.decisions),
+                "reasons": dict(self.reasons),
+                "router_ms_p50": _percentile(self.router_ms, 0.5),
+                "router_ms_p95": _percentile(self.router_ms, 0.95),
+                "latency_ms": {
+                    path: {
+                        "p50": _percentile(values, 0.5),
+                        "p95": _percentile(values, 0.95),
+                        "count": len(values),
+                    }
+                    for path, values in self.total_ms.items()
+                },
+                "recent": list(self.recent),
+            }
+
+
+router_stats = RouterStats()
+
+
+class Router:
+    """
+    Decides per request whether the agent is needed.
+
+    Conversational requests skip the agent prompt (every tool description
+    plus the ReAct scaffolding) and get a streamed chat completion with a
+    short system prompt instead. Anything that looks like it needs tools,
+    or that the router can't place, goes to the agent.
+    """
+
+    def __init__(self, llm, mode=ROUTER_MODE):
+        self.llm = llm
+        self.mode = mode
+
+    def _classify_messages(self, input_text):
+        return [SystemMessage(content=CLASSIFY_PROMPT), HumanMessage(content=input_text)]
+
+    def _from_reply(self, reply):
+        return DIRECT if "DIRECT" in str(reply.content).upper() else AGENT
+
+    def decide(self, input_text):
+        start = time.perf_counter()
+        if self.mode == "off":
+            return RouteDecision(AGENT, "off", time.perf_counter() - start)
+        path, reason = classify(input_text)
+        if path is None and self.mode == "llm":
+            try:
+                path, reason = self._from_reply(self.llm.invoke(self._classify_messages(input_text), max_tokens=3)), "llm"
+            except Exception:
+                path = AGENT
+        return RouteDecision(path or AGENT, reason, time.perf_counter() - start)
+
+    async def adecide(self, input_text):
+        start = time.perf_counter()
+        if self.mode == "off":
+            return RouteDecision(AGENT, "off", time.perf_counter() - start)
+        path, reason = classify(input_text)
+        if path is None and self.mode == "llm":
+            try:
+                reply = await self.llm.ainvoke(self._classify_messages(input_text), max_tokens=3)
+                path, reason = self._from_reply(reply), "llm"
+            except Exception:
+                path = AGENT
+        return RouteDecision(path or AGENT, reason, time.perf_counter() - start)
+
+    def _answer_messages(self, input_text, memory):
+        history = memory.load_memory_variables({}).get(memory.memory_key, []) if memory else []
+        return [SystemMessage(content=DIRECT_PROMPT), *history, HumanMessage(content=input_text)]
+
+    def _finish(self, input_text, text, memory, callback_handler):
+        if memory:
+            memory.save_context({"input": input_text}, {"output": text})
+        if callback_handler:
+            # Sends the same 'final' event the agent would
+            callback_handler.on_agent_finish(AgentFinish({"output": text}, text))
+        return {"input": input_text, "output": text, "intermediate_steps": []}
+
+    @staticmethod
+    def _config(callback_handler, callbacks):
+        handlers = [handler for handler in (callback_handler, *(callbacks or ())) if handler]
+        return {"callbacks": handlers} if handlers else None
+
+    def answer(self, input_text, memory=None, callback_handler=None, callbacks=None):
+        """Answer with a single streamed chat completion, keeping the session's memory up to date."""
+        config = self._config(callback_handler, callbacks)
+        reply = self.llm.invoke(self._answer_messages(input_text, memory), config=config)
+        return self._finish(input_text, str(reply.content), memory, callback_handler)
+
+    async def aanswer(self, input_text, memory=None, callback_handler=None, callbacks=None):
+        config = self._config(callback_handler, callbacks)
+        reply = await self.llm.ainvoke(self._answer_messages(input_text, memory), config=config)
+        return self._finish(input_text, str(reply.content), memory, callback_handler)
@@ -0,0 +1,208 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from app.controller.agent import (
+    StreamingCallbackHandler, build_agent, create_executor, create_memory, build_router
+)
+from app.controller.router import router_stats, DIRECT, AGENT
+from app.controller.metrics import MetricsCallbackHandler
+from app.controller.streaming import StreamHub
+from app.controller.parsing import parse_stats
+from app.tools.command_runner import output_sink
+
+# Maximum number of agent runs in flight at once. Defaults to the core count;
+# raise it if the model server has more parallel slots than we have cores.
+MAX_CONCURRENCY = int(os.environ.get("AGENT_MAX_CONCURRENCY", os.cpu_count() or 4))
+# Sessions with no activity for this many seconds are dropped
+SESSION_IDLE_TIMEOUT = int(os.environ.get("AGENT_SESSION_IDLE_TIMEOUT", 15 * 60))
+# Inputs a single session may have waiting behind its running request
+MAX_QUEUED_PER_SESSION = int(os.environ.get("AGENT_MAX_QUEUED_PER_SESSION", 8))
+# How often the reaper looks for idle sessions
+REAP_INTERVAL = 60
+
+
+class AgentSession:
+    """Per-connection state: its own executor, memory, callback handler and input queue."""
+
+    def __init__(self, sid, agent, socketio, stream=None, conversation_id=None):
+        self.sid = sid
+        # The stored conversation this session continues; a new one per connection by default
+        self.conversation_id = conversation_id or sid
+        self.memory = create_memory(self.conversation_id)
+        self.stream = stream
+        self.callback_handler = StreamingCallbackHandler(socketio, sid, stream) if socketio else None
+        self.metrics = MetricsCallbackHandler(sid)
+        self.executor = create_executor(agent, self.memory)
+        self.queue = deque()
+        self.running = False
+        self.closed = False
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+
+class SessionManager:
+    """
+    Hands every Socket.IO session its own agent executor on top of the shared
+    agent (LLM client, tools and prompt).
+
+    Requests from one session run in order; different sessions run in
+    parallel on a bounded worker pool of MAX_CONCURRENCY threads.
+    """
+
+    def __init__(self, socketio=None, max_concurrency=MAX_CONCURRENCY,
+                 idle_timeout=SESSION_IDLE_TIMEOUT, max_queued=MAX_QUEUED_PER_SESSION):
+        self.socketio = socketio
+        self.idle_timeout = idle_timeout
+        self.max_queued = max_queued
+        self.agent = build_agent()
+        self.router = build_router()
+        self.streams = StreamHub(socketio) if socketio else None
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="agent")
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self._reaper_started = False
+
+    def start(self):
+        """Start the background task that evicts idle sessions."""
+        if self._reaper_started:
+            return
+        self._reaper_started = True
+        if self.socketio:
+            self.socketio.start_background_task(self._reap_loop)
+        else:
+            threading.Thread(target=self._reap_loop, daemon=True).start()
+
+    def get_session(self, sid, conversation_id=None):
+        with self.lock:
+            session = self.sessions.get(sid)
+            if session is None:
+                stream = self.streams.open(sid) if self.streams else None
+                session = AgentSession(sid, self.agent, self.socketio, stream, conversation_id)
+                self.sessions[sid] = session
+            return session
+
+    def submit(self, sid, input_text, conversation_id=None):
+        """
+        Queue an input for a session and schedule it on the worker pool.
+
+        conversation_id, if given with the session's first input, continues a
+        stored conversation instead of starting a new one.
+
+        Returns:
+            bool: False if the session already has too many pending inputs.
+        """
+        session = self.get_session(sid, conversation_id)
+        with self.lock:
+            if len(session.queue) >= self.max_queued:
+                return False
+            session.queue.append(input_text)
+            session.touch()
+            if session.running:
+                # The running worker drains the queue, keeping per-session order
+                return True
+            session.running = True
+        self.pool.submit(self._drain, session)
+        return True
+
+    def _drain(self, session):
+        while True:
+            with self.lock:
+                if not session.queue:
+                    session.running = False
+                    session.touch()
+                    if session.closed:
+                        self.sessions.pop(session.sid, None)
+                    return
+                input_text = session.queue.popleft()
+            self._run(session, input_text)
+
+    def _run(self, session, input_text):
+        callbacks = [handler for handler in (session.callback_handler, session.metrics) if handler]
+        config = {"callbacks": callbacks}
+        # Stream terminal command output to this session while the command runs
+        sink_token = output_sink.set(
+            lambda stream, text: session.stream.send({
+                'type': 'command_output',
+                'data': {
+                    'stream': stream,
+                    'text': text
+                }
+            })
+        ) if session.stream else None
+        path, status = AGENT, "error"
+        session.metrics.start_request(input_text)
+        try:
+            start = time.perf_counter()
+            # Conversational requests skip the agent and its tool-laden prompt
+            decision = self.router.decide(input_text)
+            path = decision.path
+            if decision.path == DIRECT:
+                result = self.router.answer(
+                    input_text, session.memory, session.callback_handler, [session.metrics]
+                )
+            else:
+                result = session.executor.invoke({"input": input_text}, config=config)
+            router_stats.record(input_text, decision, time.perf_counter() - start)
+            parse_stats.record(result.get("intermediate_steps"))
+            status = "ok"
+        except Exception as e:
+            self.emit_error(session.sid, str(e))
+        finally:
+            session.metrics.end_request(path, status)
+            if sink_token is not None:
+                output_sink.reset(sink_token)
+            session.touch()
+
+    def emit_error(self, sid, error):
+        payload = {
+            'type': 'error',
+            'data': {
+                'error': error
+            }
+        }
+        session = self.sessions.get(sid)
+        if session and session.stream:
+            # Keep the error ordered after any tokens still buffered
+            session.stream.send(payload)
+        elif self.socketio:
+            self.socketio.emit('agent_update', payload, to=sid)
+
+    def end_session(self, sid):
+        """Drop a session; if it is mid-request it is removed once the request finishes."""
+        with self.lock:
+            session = self.sessions.get(sid)
+            if session is None:
+                return
+            session.closed = True
+            session.queue.clear()
+            if not session.running:
+                self.sessions.pop(sid, None)
+        if self.streams:
+            self.streams.close(sid)
+
+    def evict_idle(self):
+        """Remove sessions that have been idle for longer than idle_timeout."""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self.lock:
+            idle = [sid for sid, session in self.sessions.items()
+                    if not session.running and session.last_active < cutoff]
+            for sid in idle:
+                del self.sessions[sid]
+        if self.streams:
+            for sid in idle:
+                self.streams.close(sid)
+        return len(idle)
+
+    def _reap_loop(self):
+        sleep = self.socketio.sleep if self.socketio else time.sleep
+        while True:
+            sleep(REAP_INTERVAL)
+            self.evict_idle()
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
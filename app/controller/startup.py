@@ -0,0 +1,88 @@
+import os
+import time
+import socket
+import threading
+
+# Start listening before the agent stack (LangChain, the model client, the
+# session manager) is imported and built; it is built on the first request
+LAZY_START = os.environ.get("AGENT_LAZY_START", "0") == "1"
+# Once the server is listening, build everything in the background, ping the
+# model server and send it the agent's prompt so its prompt cache is primed
+WARMUP = os.environ.get("AGENT_WARMUP", "0") == "1"
+
+
+class Deferred:
+    """A value built by `factory` on first use, at most once, from any thread."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.value = None
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.loaded:
+            return self.value
+        with self.lock:
+            if not self.loaded:
+                self.value = self.factory()
+                self.loaded = True
+        return self.value
+
+
+def wait_for_port(host, port, timeout=30):
+    """Block until something accepts connections on host:port."""
+    host = "127.0.0.1" if host in ("0.0.0.0", "") else host
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return True
+        except OSError:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+
+
+def _priming_prompt(agent):
+    """The agent's prompt with an empty input, i.e. the prefix every request shares."""
+    from app.controller.agent import SYSTEM_PROMPT
+
+    llm_chain = getattr(agent, "llm_chain", None)
+    if llm_chain is not None:
+        try:
+            return llm_chain.prompt.format(input="", agent_scratchpad="", chat_history=[])
+        except (KeyError, ValueError):
+            pass
+    return SYSTEM_PROMPT
+
+
+def warm_up(session_manager):
+    """
+    Ping the model server(s) and prime their prompt cache.
+
+    Returns a dict with how long each part took and any error; a failed warm-up
+    is not fatal, the first request just pays for it.
+    """
+    from langchain_core.messages import HumanMessage
+    from app.controller.agent import get_llm
+    from app.controller.backends import PooledChatModel
+
+    result = {}
+    start = time.perf_counter()
+    llm = get_llm()
+    clients = [backend.client for backend in llm.pool.backends] if isinstance(llm, PooledChatModel) else [llm]
+    try:
+        if isinstance(llm, PooledChatModel):
+            llm.pool.probe()
+        else:
+            llm.root_client.models.list()
+        result["ping_s"] = round(time.perf_counter() - start, 3)
+        prompt = _priming_prompt(session_manager.agent)
+        start = time.perf_counter()
+        for client in clients:
+            client.invoke([HumanMessage(content=prompt)], max_tokens=1)
+        result["prime_s"] = round(time.perf_counter() - start, 3)
+    except Exception as e:
+        result["error"] = str(e)
+    return result
@@ -0,0 +1,297 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Buffered tokens are flushed as one frame after this many seconds...
+FLUSH_INTERVAL = float(os.environ.get("STREAM_FLUSH_INTERVAL", 0.03))
+# ...or as soon as this many bytes are waiting, whichever comes first
+FLUSH_BYTES = int(os.environ.get("STREAM_FLUSH_BYTES", 512))
+# While a client is still receiving the previous frame, tokens keep coalescing
+# up to this many bytes; beyond that the oldest tokens are dropped
+MAX_BUFFER_BYTES = int(os.environ.get("STREAM_MAX_BUFFER_BYTES", 64 * 1024))
+# Bytes of token and command output frames queued behind a slow client;
+# beyond this the oldest of them are dropped (steps and answers never are)
+MAX_QUEUED_BYTES = int(os.environ.get("STREAM_MAX_QUEUED_BYTES", 1024 * 1024))
+# Threads doing the actual socket writes, so a slow client never blocks the agent
+SENDER_THREADS = int(os.environ.get("STREAM_SENDER_THREADS", 4))
+
+
+class TokenStream:
+    """
+    Outgoing 'agent_update' channel for a single session.
+
+    Tokens are buffered and sent as batched 'tokens' frames. Other events
+    (steps, final answers, errors) are queued behind any buffered tokens so
+    the client sees everything in order, and are never dropped. Tokens and
+    command output are dropped, oldest first, when a client falls too far
+    behind; the next 'tokens' frame (an empty one if need be) carries the
+    number of dropped tokens, and a command_output note says how much
+    output was lost.
+    """
+
+    def __init__(self, hub, sid):
+        self.hub = hub
+        self.sid = sid
+        self.lock = threading.Lock()
+        self.tokens = deque()
+        self.buffered_bytes = 0
+        self.first_token_at = None
+        self.dropped = 0
+        self.dropped_output = 0
+        self.frames = deque()  # (frame, bytes counted against MAX_QUEUED_BYTES)
+        self.queued_bytes = 0
+        self.in_flight = False
+        self.closed = False
+
+    def push(self, token):
+        """Buffer a token. Called on the agent thread, never writes to the socket."""
+        size = len(token.encode("utf-8"))
+        with self.lock:
+            if self.first_token_at is None:
+                self.first_token_at = time.monotonic()
+            self.tokens.append(token)
+            self.buffered_bytes += size
+            while self.buffered_bytes > MAX_BUFFER_BYTES and len(self.tokens) > 1:
+                # The client is not keeping up, drop the oldest tokens
+                self.buffered_bytes -= len(self.tokens.popleft().encode("utf-8"))
+                self.dropped += 1
+            full = self.buffered_bytes >= FLUSH_BYTES
+        if full:
+            self.hub.wake()
+
+    def send(self, payload):
+        """Queue a non-token event behind the tokens buffered so far."""
+        size = 0
+        if payload.get('type') == 'command_output':
+            size = len(str(payload['data'].get('text', '')).encode("utf-8"))
+        with self.lock:
+            self._seal_tokens()
+            self._append(payload, size)
+        self.hub.wake()
+
+    def _append(self, frame, size=0):
+        # Caller holds self.lock
+        self.frames.append((frame, size))
+        self.queued_bytes += size
+        if self.queued_bytes <= MAX_QUEUED_BYTES:
+            return
+        # The client is not keeping up, drop the oldest droppable frames
+        kept = deque()
+        while self.frames and self.queued_bytes > MAX_QUEUED_BYTES:
+            frame, size = self.frames.popleft()
+            if not size:
+                kept.append((frame, size))
+                continue
+            self.queued_bytes -= size
+            if frame['type'] == 'tokens':
+                self.dropped += frame['data']['count'] + frame['data']['dropped']
+            else:
+                self.dropped_output += size
+        kept.extend(self.frames)
+        self.frames = kept
+
+    def _note_dropped_output(self):
+        # Caller holds self.lock; one note per batch handed out
+        if self.dropped_output:
+            # The oldest output went, so the note leads the batch
+            self.frames.appendleft(({
+                'type': 'command_output',
+                'data': {
+                    'stream': 'stderr',
+                    'text': f"\n[{self.dropped_output} bytes of output dropped]\n"
+                }
+            }, 0))
+            self.dropped_output = 0
+
+    def _seal_tokens(self):
+        # Caller holds self.lock
+        if not self.tokens and not self.dropped:
+            return
+        text = ''.join(self.tokens)
+        frame = {
+            'type': 'tokens',
+            'data': {
+                'tokens': text,
+                'count': len(self.tokens),
+                'dropped': self.dropped
+            }
+        }
+        self.tokens = deque()
+        self.buffered_bytes = 0
+        self.first_token_at = None
+        self.dropped = 0
+        self._append(frame, max(len(text.encode("utf-8")), 1))
+
+    def take_ready(self, now):
+        """
+        Return the frames that are due, or None if nothing should be sent yet.
+
+        Nothing is handed out while a previous batch is still being written to
+        this client; tokens keep coalescing in the meantime.
+        """
+        with self.lock:
+            if self.in_flight:
+                return None
+            if self.tokens and (self.buffered_bytes >= FLUSH_BYTES
+                                or now - self.first_token_at >= FLUSH_INTERVAL):
+                self._seal_tokens()
+            elif self.dropped and not self.tokens:
+                # Tell the client its stream was cut even if nothing follows
+                self._seal_tokens()
+            self._note_dropped_output()
+            if not self.frames:
+                return None
+            frames = [frame for frame, _ in self.frames]
+            self.frames.clear()
+            self.queued_bytes = 0
+            self.in_flight = True
+            return frames
+
+    def done_sending(self):
+        with self.lock:
+            self.in_flight = False
+
+    def flush(self):
+        """Seal any buffered tokens so the next flusher tick sends them."""
+        with self.lock:
+            self._seal_tokens()
+        self.hub.wake()
+
+
+class StreamHub:
+    """
+    Owns the TokenStream of every session and a single flusher thread that
+    turns buffered tokens into frames, emitted only to the session's room.
+    """
+
+    def __init__(self, socketio, interval=FLUSH_INTERVAL, sender_threads=SENDER_THREADS):
+        self.socketio = socketio
+        self.interval = interval
+        self.streams = {}
+        self.lock = threading.Lock()
+        self.pending = threading.Event()
+        self.senders = ThreadPoolExecutor(max_workers=sender_threads, thread_name_prefix="stream")
+        self.emits = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def open(self, sid):
+        with self.lock:
+            stream = self.streams.get(sid)
+            if stream is None:
+                stream = TokenStream(self, sid)
+                self.streams[sid] = stream
+            return stream
+
+    def close(self, sid):
+        with self.lock:
+            stream = self.streams.pop(sid, None)
+        if stream:
+            stream.closed = True
+
+    def wake(self):
+        self.pending.set()
+
+    def _run(self):
+        while True:
+            self.pending.wait(self.interval)
+            self.pending.clear()
+            self.flush_ready()
+
+    def flush_ready(self):
+        now = time.monotonic()
+        with self.lock:
+            streams = list(self.streams.values())
+        for stream in streams:
+            frames = stream.take_ready(now)
+            if frames:
+                self.senders.submit(self._send, stream, frames)
+
+    def _send(self, stream, frames):
+        try:
+            for frame in frames:
+                if stream.closed:
+                    break
+                self.socketio.emit('agent_update', frame, to=stream.sid)
+                self.emits += 1
+        finally:
+            stream.done_sending()
+        # Anything that arrived while we were writing is due right away
+        self.wake()
+
+
+class AsyncStreamHub:
+    """
+    StreamHub for the asyncio server: the same per-session TokenStreams,
+    flushed by a task on the event loop and written with AsyncServer.emit.
+
+    wake() may be called from any thread (e.g. a tool running in the default
+    executor), so it always goes through call_soon_threadsafe.
+    """
+
+    def __init__(self, sio, interval=FLUSH_INTERVAL):
+        self.sio = sio
+        self.interval = interval
+        self.streams = {}
+        self.lock = threading.Lock()
+        self.emits = 0
+        self._loop = None
+        self._pending = None
+        self._task = None
+
+    def start(self):
+        """Start the flusher task; must be called from the running event loop."""
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._pending = asyncio.Event()
+            self._task = self._loop.create_task(self._run())
+
+    def open(self, sid):
+        with self.lock:
+            stream = self.streams.get(sid)
+            if stream is None:
+                stream = TokenStream(self, sid)
+                self.streams[sid] = stream
+            return stream
+
+    def close(self, sid):
+        with self.lock:
+            stream = self.streams.pop(sid, None)
+        if stream:
+            stream.closed = True
+
+    def wake(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._pending.set)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._pending.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._pending.clear()
+            self.flush_ready()
+
+    def flush_ready(self):
+        now = time.monotonic()
+        with self.lock:
+            streams = list(self.streams.values())
+        for stream in streams:
+            frames = stream.take_ready(now)
+            if frames:
+                self._loop.create_task(self._send(stream, frames))
+
+    async def _send(self, stream, frames):
+        try:
+            for frame in frames:
+                if stream.closed:
+                    break
+                await self.sio.emit('agent_update', frame, to=stream.sid)
+                self.emits += 1
+        finally:
+            stream.done_sending()
+        self.wake()
@@ -0,0 +1,38 @@
+import os
+import threading
+
+# tiktoken has no encoding for the local models we run, cl100k_base is close enough for budgeting
+TOKEN_ENCODING = os.environ.get("TOKEN_ENCODING", "cl100k_base")
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """
+    Load the tiktoken encoding once.
+
+    Returns None if tiktoken or its encoding file is unavailable (e.g. offline
+    machines), in which case count_tokens falls back to an estimate.
+    """
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+                except Exception:
+                    _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text):
+    """Count the tokens in a string."""
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        # Roughly four characters per token for English text and code
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
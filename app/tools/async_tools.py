@@ -0,0 +1,100 @@
+import os
+import asyncio
+import tempfile
+
+import aiofiles
+
+from app.tools import file_tools
+from app.tools.file_tools import (
+    read_file, clean_content, parse_input_string, get_project_index, MAX_READ_BYTES
+)
+from app.tools.kernel import _without_none
+from app.tools.web_tool import asearchOnline
+
+# Arguments that make read_file page through a file instead of returning all of it
+_PAGING_ARGS = ("offset", "length", "start_line", "end_line", "mode")
+
+
+def _resolve(filepath):
+    """Return the absolute path inside PROJECTS_DIR, or None if it escapes it."""
+    projects_dir = file_tools.PROJECTS_DIR
+    target = os.path.abspath(os.path.join(projects_dir, filepath))
+    if os.path.commonpath([target, projects_dir]) != projects_dir:
+        return None
+    return target
+
+
+async def aread_file(**kwargs):
+    """
+    Async Read File. Whole small files are read with aiofiles; paged and large
+    reads go through read_file's mmap path on a worker thread.
+    """
+    filepath = kwargs.get("filepath")
+    if not filepath:
+        return "Error: Filepath required."
+    target_file = _resolve(filepath)
+    if target_file is None:
+        return f"Error: File not found or access denied. Files must be inside {file_tools.PROJECTS_DIR}"
+    if any(kwargs.get(arg) not in (None, "") for arg in _PAGING_ARGS):
+        return await asyncio.to_thread(read_file, **kwargs)
+    try:
+        if os.path.getsize(target_file) > MAX_READ_BYTES:
+            return await asyncio.to_thread(read_file, **kwargs)
+        async with aiofiles.open(target_file, "r", encoding="utf-8", errors="replace") as file:
+            return await file.read()
+    except Exception as e:
+        return f"Error reading file: {str(e)}"
+
+
+async def awrite_file(**kwargs):
+    """Async Write File: writes a temp file with aiofiles and renames it into place."""
+    filepath = kwargs.get("filepath")
+    content = kwargs.get("content", "")
+    if not filepath:
+        return "Error: Filepath required."
+    target_file = _resolve(filepath)
+    if target_file is None:
+        return f"Access denied: You can only write files inside {file_tools.PROJECTS_DIR}"
+
+    content = content if kwargs.get("raw") else clean_content(content)
+    temp_path = None
+    try:
+        os.makedirs(os.path.dirname(target_file), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(target_file),
+            prefix=f".{os.path.basename(target_file)}.",
+            suffix=".tmp"
+        )
+        os.close(fd)
+        async with aiofiles.open(temp_path, "w", encoding="utf-8") as file:
+            await file.write(content)
+        os.chmod(temp_path, 0o666 & ~file_tools._UMASK)
+        os.replace(temp_path, target_file)
+        get_project_index().notify_rename(temp_path, target_file)
+        return f"Successfully wrote content to '{filepath}'"
+    except Exception as e:
+        if temp_path and os.path.exists(temp_path):
+            os.unlink(temp_path)
+        return f"Error writing to file: {str(e)}"
+
+
+# Native coroutines by tool name, for both the key=value and the structured
+# tool sets. Tools not listed here run their sync function on LangChain's
+# default thread pool when called asynchronously.
+ASYNC_IMPLEMENTATIONS = {
+    "Read File": lambda input: aread_file(**parse_input_string(input)),
+    "Write File": lambda input: awrite_file(**parse_input_string(input)),
+    "Search Online": lambda input: asearchOnline(parse_input_string(input).get("query") or input),
+    "read_file": lambda **kwargs: aread_file(**_without_none(kwargs)),
+    "write_file": lambda **kwargs: awrite_file(raw=True, **kwargs),
+    "search_online": lambda query: asearchOnline(query),
+}
+
+
+def with_async_implementations(tools):
+    """Return copies of the tools with native coroutines attached where we have them."""
+    return [
+        tool.model_copy(update={"coroutine": ASYNC_IMPLEMENTATIONS[tool.name]})
+        if tool.name in ASYNC_IMPLEMENTATIONS else tool
+        for tool in tools
+    ]
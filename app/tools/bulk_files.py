@@ -0,0 +1,412 @@
+import os
+import re
+import time
+import errno
+import fnmatch
+import posixpath
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from app.tools import file_tools
+from app.tools.file_tools import get_project_index
+
+# Most files a single bulk operation may touch
+MAX_BULK_FILES = int(os.environ.get("MAX_BULK_FILES", 5000))
+# Threads copying files in parallel, and the batch size from which they are used
+BULK_COPY_WORKERS = int(os.environ.get("BULK_COPY_WORKERS", 8))
+PARALLEL_COPY_MIN = 16
+# Operations listed one per line in the report; the rest are counted
+REPORT_LINES = 20
+
+OPERATIONS = ("copy", "move", "rename", "delete")
+TEMPLATE_FIELDS = "{path}, {dir}, {name}, {stem}, {ext}, {n}, or regex groups {1}, {2}"
+
+# Bytes asked of the kernel per copy call
+_COPY_CHUNK = 1 << 30
+# copy_file_range/sendfile can't handle this pair of files; try the next method
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM, errno.EBADF}
+
+
+class BulkError(Exception):
+    """A problem with the plan; nothing has been changed."""
+
+
+class CommitError(Exception):
+    """Renaming staged copies into place failed after `done` of them landed."""
+
+    def __init__(self, done, error):
+        super().__init__(str(error))
+        self.done = done
+
+
+def _flag(kwargs, name, default):
+    value = kwargs.get(name)
+    if value is None or value == "":
+        return default
+    return str(value).strip().lower() in ("true", "1", "yes")
+
+
+def _copy_file_range(src_fd, dst_fd):
+    return os.copy_file_range(src_fd, dst_fd, _COPY_CHUNK)
+
+
+def _sendfile(src_fd, dst_fd):
+    return os.sendfile(dst_fd, src_fd, None, _COPY_CHUNK)
+
+
+def _read_write(src_fd, dst_fd):
+    data = os.read(src_fd, 1 << 20)
+    view = memoryview(data)
+    while view:
+        view = view[os.write(dst_fd, view):]
+    return len(data)
+
+
+# Fastest first: copy_file_range lets the filesystem share or copy extents
+# without the data entering user space, sendfile still copies in the kernel
+_COPY_METHODS = [method for method, available in (
+    (_copy_file_range, hasattr(os, "copy_file_range")),
+    (_sendfile, hasattr(os, "sendfile")),
+    (_read_write, True),
+) if available]
+
+
+def copy_data(src_fd, dst_fd):
+    """Copy from src_fd's position to EOF into dst_fd, in the kernel where possible; returns bytes copied."""
+    copied = 0
+    for method in _COPY_METHODS:
+        try:
+            while True:
+                n = method(src_fd, dst_fd)
+                if n == 0:
+                    return copied
+                copied += n
+        except OSError as e:
+            # The fd positions have moved past what was copied, so the next method carries on from there
+            if e.errno not in _FALLBACK_ERRNOS or method is _read_write:
+                raise
+    return copied
+
+
+def _copy_to_temp(src, dst):
+    """Copy src to a temp file beside dst, with src's mode; returns the temp path."""
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(dst), prefix=f".{os.path.basename(dst)}.", suffix=".tmp"
+    )
+    try:
+        src_fd = os.open(src, os.O_RDONLY)
+        try:
+            os.fchmod(fd, os.fstat(src_fd).st_mode & 0o777)
+            copy_data(src_fd, fd)
+        finally:
+            os.close(src_fd)
+    except BaseException:
+        os.close(fd)
+        os.unlink(temp_path)
+        raise
+    os.close(fd)
+    return temp_path
+
+
+def scan(base, pattern=None, regex=None, recursive=True):
+    """
+    Walk `base` once with scandir and return the matching files.
+
+    `pattern` is a glob matched against the path relative to base or the
+    file name; `regex` must match the whole relative path. Symlinks are
+    skipped, so every result is a regular file inside base.
+
+    Returns:
+        list: (relpath, size, match) tuples sorted by path; match is the
+        regex match object or None.
+    """
+    found = []
+    stack = [""]
+    while stack:
+        reldir = stack.pop()
+        with os.scandir(os.path.join(base, reldir) if reldir else base) as entries:
+            for entry in entries:
+                rel = f"{reldir}/{entry.name}" if reldir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        stack.append(rel)
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                match = None
+                if regex is not None:
+                    match = regex.fullmatch(rel)
+                    if match is None:
+                        continue
+                elif pattern and not (fnmatch.fnmatch(rel, pattern) or fnmatch.fnmatch(entry.name, pattern)):
+                    continue
+                found.append((rel, entry.stat(follow_symlinks=False).st_size, match))
+                if len(found) > MAX_BULK_FILES:
+                    raise BulkError(
+                        f"More than {MAX_BULK_FILES} files match; use a narrower pattern or path."
+                    )
+    found.sort(key=lambda item: item[0])
+    return found
+
+
+def render_target(template, rel, n, match):
+    """Fill in the target template for one matched file (rel is relative to the scanned directory)."""
+    directory, _, name = rel.rpartition("/")
+    stem, ext = os.path.splitext(name)
+    groups = [match.group(0), *match.groups(default="")] if match else [rel]
+    fields = dict(match.groupdict(default="")) if match else {}
+    fields.update(path=rel, dir=directory, name=name, stem=stem, ext=ext, n=n)
+    if template.endswith("/"):
+        template += "{path}"
+    try:
+        target = template.format(*groups, **fields)
+    except (KeyError, IndexError, ValueError) as e:
+        raise BulkError(f"Bad target template '{template}' ({e}). Use {TEMPLATE_FIELDS}.")
+    return posixpath.normpath(target.replace("\\", "/")).lstrip("/")
+
+
+def _blocking_file(directory, projects_dir, checked):
+    """The first existing non-directory among directory and its parents below projects_dir, if any."""
+    while directory != projects_dir and directory not in checked:
+        if os.path.lexists(directory) and not os.path.isdir(directory):
+            return directory
+        checked.add(directory)
+        directory = os.path.dirname(directory)
+    return None
+
+
+def plan(operation, path="", pattern=None, regex=None, target=None, recursive=True, overwrite=False):
+    """
+    Work out every (source, destination) pair and validate the whole batch.
+
+    copy and move resolve the target against the projects directory, rename
+    against each file's own directory; delete takes no target. Raises
+    BulkError before anything is touched if a path leaves the projects
+    directory, two files would land on the same destination, a destination
+    exists (without overwrite) or sits under a file, or a move would
+    overwrite another source.
+
+    Returns:
+        tuple: (base directory, list of (src, dst, rel, size)); dst is None for deletes.
+    """
+    projects_dir = file_tools.PROJECTS_DIR
+    base = os.path.abspath(os.path.join(projects_dir, path or ""))
+    if os.path.commonpath([base, projects_dir]) != projects_dir:
+        raise BulkError(f"Access denied: '{path}' is outside {projects_dir}.")
+    if not os.path.isdir(base):
+        raise BulkError(f"Directory '{path or '.'}' does not exist.")
+    if operation != "delete" and not target:
+        raise BulkError(f"A target template is required for {operation}, e.g. target=archive/{{path}}.")
+    if operation == "delete" and not (pattern or regex):
+        raise BulkError("A pattern or regex is required for delete.")
+
+    compiled = None
+    if regex:
+        try:
+            compiled = re.compile(regex)
+        except re.error as e:
+            raise BulkError(f"Invalid regex '{regex}': {e}")
+    matches = scan(base, pattern or "*", compiled, recursive)
+
+    ops = []
+    sources = {os.path.join(base, rel) for rel, _, _ in matches}
+    destinations = set()
+    checked_dirs = set()
+    for n, (rel, size, match) in enumerate(matches, 1):
+        src = os.path.join(base, rel)
+        if operation == "delete":
+            ops.append((src, None, rel, size))
+            continue
+        rendered = render_target(target, rel, n, match)
+        anchor = os.path.dirname(src) if operation == "rename" else projects_dir
+        dst = os.path.abspath(os.path.join(anchor, rendered))
+        if os.path.commonpath([dst, projects_dir]) != projects_dir or dst == projects_dir:
+            raise BulkError(f"Access denied: '{rel}' would go to '{rendered}', outside {projects_dir}.")
+        if dst == src:
+            continue
+        if dst in destinations:
+            raise BulkError(f"More than one file would be written to '{os.path.relpath(dst, projects_dir)}'.")
+        if dst in sources and operation != "copy":
+            raise BulkError(
+                f"'{rel}' would replace '{os.path.relpath(dst, projects_dir)}', which is also being moved."
+            )
+        blocking = _blocking_file(os.path.dirname(dst), projects_dir, checked_dirs)
+        if blocking is not None:
+            raise BulkError(
+                f"'{os.path.relpath(dst, projects_dir)}' can't be created, "
+                f"'{os.path.relpath(blocking, projects_dir)}' is a file."
+            )
+        if os.path.isdir(dst):
+            raise BulkError(f"'{os.path.relpath(dst, projects_dir)}' is a directory.")
+        if not overwrite and os.path.lexists(dst):
+            raise BulkError(f"'{os.path.relpath(dst, projects_dir)}' already exists; pass overwrite=true to replace it.")
+        destinations.add(dst)
+        ops.append((src, dst, rel, size))
+    return base, ops
+
+
+def _copy_all(ops):
+    """Stage every copy beside its destination, then rename them all into place."""
+    staged = []
+    try:
+        if len(ops) >= PARALLEL_COPY_MIN and BULK_COPY_WORKERS > 1:
+            with ThreadPoolExecutor(max_workers=BULK_COPY_WORKERS, thread_name_prefix="bulk-copy") as pool:
+                futures = [(pool.submit(_copy_to_temp, src, dst), dst) for src, dst, _, _ in ops]
+                errors = []
+                for future, dst in futures:
+                    try:
+                        staged.append((future.result(), dst))
+                    except Exception as e:
+                        errors.append(e)
+                if errors:
+                    raise errors[0]
+        else:
+            for src, dst, _, _ in ops:
+                staged.append((_copy_to_temp(src, dst), dst))
+    except BaseException:
+        for temp_path, _ in staged:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+        raise
+    index = get_project_index()
+    done = 0
+    try:
+        for temp_path, dst in staged:
+            os.replace(temp_path, dst)
+            index.notify_rename(temp_path, dst)
+            done += 1
+    except OSError as e:
+        for temp_path, _ in staged[done:]:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+        raise CommitError(done, e)
+
+
+def _move(src, dst):
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        os.replace(_copy_to_temp(src, dst), dst)
+        os.unlink(src)
+
+
+def _prune_empty_dirs(base, sources):
+    """Remove directories under base that the operation left empty, deepest first."""
+    directories = {os.path.dirname(src) for src in sources}
+    for directory in sorted(directories, key=len, reverse=True):
+        while directory != base and directory.startswith(base + os.sep):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            get_project_index().notify_delete(directory)
+            directory = os.path.dirname(directory)
+
+
+def _report(verb, ops, elapsed=None):
+    """One summary line, then the first REPORT_LINES operations; elapsed is None for a dry run."""
+    projects_dir = file_tools.PROJECTS_DIR
+    total = sum(size for _, _, _, size in ops)
+    if elapsed is None:
+        lines = [f"Dry run, nothing changed. Would have {verb} {len(ops)} files ({total} bytes):"]
+    else:
+        lines = [f"{verb.capitalize()} {len(ops)} files ({total} bytes) in {elapsed:.2f}s:"]
+    for src, dst, _, _ in ops[:REPORT_LINES]:
+        src_rel = os.path.relpath(src, projects_dir)
+        lines.append(f"- {src_rel}" if dst is None else f"- {src_rel} -> {os.path.relpath(dst, projects_dir)}")
+    if len(ops) > REPORT_LINES:
+        lines.append(f"[{len(ops) - REPORT_LINES} more]")
+    return "\n".join(lines)
+
+
+_VERBS = {"copy": "copied", "move": "moved", "rename": "renamed", "delete": "deleted"}
+
+
+def bulk_files(**kwargs):
+    """
+    Copy, move, rename or delete every file matching a pattern in one step.
+
+    The tree under `path` is scanned once, every source and destination is
+    validated before anything changes, and the result is one short report.
+    Copies go through copy_file_range (or sendfile), in parallel for large
+    batches, and are staged so a failed copy leaves no partial files behind.
+
+    Args:
+        operation (str): 'copy', 'move', 'rename' or 'delete'.
+        pattern (str, optional): Glob matched against the relative path or file name, e.g. '*.html'.
+        regex (str, optional): Regex matched against the whole relative path, instead of pattern;
+            its groups can be used in the target as {1}, {2}... or by name.
+        target (str): Destination template using {path}, {dir}, {name}, {stem}, {ext} and {n}.
+            copy/move targets are relative to the projects directory (a trailing '/' means
+            '{path}' under that folder); rename targets are relative to each file's folder.
+        path (str, optional): Subdirectory to scan, defaults to the whole project.
+        recursive (str, optional): 'false' to only match files directly in path.
+        overwrite (str, optional): 'true' to replace existing destinations.
+        dry_run (str, optional): 'true' to only report what would happen.
+
+    Returns:
+        str: A summary line followed by the first REPORT_LINES operations.
+    """
+    operation = str(kwargs.get("operation") or "").strip().lower()
+    if operation not in OPERATIONS:
+        return f"Error: operation must be one of {', '.join(OPERATIONS)}."
+    dry_run = _flag(kwargs, "dry_run", False)
+    try:
+        base, ops = plan(
+            operation,
+            path=kwargs.get("path") or "",
+            pattern=kwargs.get("pattern") or None,
+            regex=kwargs.get("regex") or None,
+            target=kwargs.get("target") or None,
+            recursive=_flag(kwargs, "recursive", True),
+            overwrite=_flag(kwargs, "overwrite", False),
+        )
+    except BulkError as e:
+        return f"Error: {e} No files were changed."
+    except OSError as e:
+        return f"Error scanning files: {e}. No files were changed."
+    if not ops:
+        return "No files matched."
+    verb = _VERBS[operation]
+    if dry_run:
+        return _report(verb, ops)
+
+    start = time.perf_counter()
+    index = get_project_index()
+    try:
+        for directory in sorted({os.path.dirname(dst) for _, dst, _, _ in ops if dst}):
+            os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        return f"Error creating destination folders: {e}. No files were {verb}."
+    if operation == "copy":
+        try:
+            _copy_all(ops)
+        except CommitError as e:
+            return f"Error after {e.done} of {len(ops)} files were copied: {e}\n" \
+                + _report(verb, ops[:e.done], time.perf_counter() - start)
+        except Exception as e:
+            return f"Error copying files: {e}. No files were copied."
+        return _report(verb, ops, time.perf_counter() - start)
+
+    done = 0
+    try:
+        for src, dst, _, _ in ops:
+            if dst is None:
+                os.remove(src)
+                index.notify_delete(src)
+            else:
+                _move(src, dst)
+                index.notify_rename(src, dst)
+            done += 1
+    except Exception as e:
+        return f"Error after {done} of {len(ops)} files were {verb}: {e}\n" + _report(verb, ops[:done], time.perf_counter() - start)
+    finally:
+        if operation != "rename" and done:
+            _prune_empty_dirs(base, [src for src, _, _, _ in ops[:done]])
+    return _report(verb, ops, time.perf_counter() - start)
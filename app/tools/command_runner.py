@@ -0,0 +1,271 @@
+import os
+import sys
+import glob
+import time
+import shlex
+import queue
+import signal
+import socket
+import selectors
+import threading
+import contextvars
+import subprocess
+from multiprocessing.connection import Connection
+
+# Resource limits applied to every command
+COMMAND_CPU_SECONDS = int(os.environ.get("COMMAND_CPU_SECONDS", 10))
+COMMAND_MEMORY_BYTES = int(os.environ.get("COMMAND_MEMORY_BYTES", 512 * 1024 * 1024))
+# Bytes of output kept for the observation: the first HEAD and the last TAIL
+OUTPUT_HEAD_BYTES = int(os.environ.get("COMMAND_OUTPUT_HEAD_BYTES", 4 * 1024))
+OUTPUT_TAIL_BYTES = int(os.environ.get("COMMAND_OUTPUT_TAIL_BYTES", 4 * 1024))
+# Bytes of output streamed live to the client before streaming stops
+MAX_STREAMED_BYTES = int(os.environ.get("COMMAND_MAX_STREAMED_BYTES", 256 * 1024))
+# Pre-started worker processes that spawn commands; 0 spawns from the server process
+COMMAND_WORKERS = int(os.environ.get("COMMAND_WORKERS", 2))
+READ_CHUNK = 4096
+
+# Set by the caller (e.g. the session running the agent) to receive output as it
+# is produced. Called as sink(stream_name, text).
+output_sink = contextvars.ContextVar("command_output_sink", default=None)
+
+
+class HeadTailBuffer:
+    """Keeps the first head_bytes and last tail_bytes written, counting what was dropped in between."""
+
+    def __init__(self, head_bytes=OUTPUT_HEAD_BYTES, tail_bytes=OUTPUT_TAIL_BYTES):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def write(self, data):
+        self.total += len(data)
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            if len(self.tail) > self.tail_bytes:
+                del self.tail[:len(self.tail) - self.tail_bytes]
+
+    def getvalue(self):
+        omitted = self.total - len(self.head) - len(self.tail)
+        head = self.head.decode("utf-8", errors="replace")
+        if not self.tail:
+            return head
+        tail = self.tail.decode("utf-8", errors="replace")
+        if omitted:
+            return f"{head}\n... [{omitted} bytes omitted] ...\n{tail}"
+        return head + tail
+
+
+def build_argv(command, cwd):
+    """
+    Split a command into argv without a shell.
+
+    is_command_safe already rejects pipes, redirections and chaining, so the
+    only shell feature left to emulate is glob expansion.
+    """
+    argv = []
+    for arg in shlex.split(command):
+        if any(ch in arg for ch in "*?["):
+            matches = sorted(glob.glob(arg, root_dir=cwd))
+            argv.extend(matches or [arg])
+        else:
+            argv.append(arg)
+    return argv
+
+
+def _set_limits(cpu_seconds, memory_bytes):
+    import resource
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+    resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+
+def run_process(argv, cwd, timeout, on_output, cpu_seconds, memory_bytes, in_worker=False):
+    """
+    Run argv, passing each chunk of output to on_output(stream_name, bytes).
+
+    The command gets its own process group so a timeout kills everything it
+    started. preexec_fn is not safe in a multi-threaded process, so limits are
+    set that way only inside single-threaded workers; otherwise they are
+    applied with prlimit right after the process starts.
+
+    Returns:
+        tuple: (returncode, timed_out)
+    """
+    process = subprocess.Popen(
+        argv,
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+        preexec_fn=(lambda: _set_limits(cpu_seconds, memory_bytes)) if in_worker else None,
+    )
+    if not in_worker:
+        try:
+            import resource
+            resource.prlimit(process.pid, resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+            resource.prlimit(process.pid, resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+        except (ImportError, AttributeError, OSError):
+            pass
+
+    deadline = time.monotonic() + timeout
+    timed_out = False
+    with selectors.DefaultSelector() as selector:
+        selector.register(process.stdout, selectors.EVENT_READ, "stdout")
+        selector.register(process.stderr, selectors.EVENT_READ, "stderr")
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            for key, _ in selector.select(timeout=min(remaining, 0.5)):
+                data = os.read(key.fd, READ_CHUNK)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    continue
+                on_output(key.data, data)
+    if timed_out:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    try:
+        returncode = process.wait(timeout=max(deadline - time.monotonic(), 1))
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        os.killpg(process.pid, signal.SIGKILL)
+        returncode = process.wait()
+    process.stdout.close()
+    process.stderr.close()
+    return returncode, timed_out
+
+
+def _worker_main(fd):
+    """Loop in a worker process: run each requested command and stream its output back."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    conn = Connection(fd)
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        argv, cwd, timeout, cpu_seconds, memory_bytes = request
+        try:
+            returncode, timed_out = run_process(
+                argv, cwd, timeout, lambda stream, data: conn.send(("output", stream, data)),
+                cpu_seconds, memory_bytes, in_worker=True
+            )
+            conn.send(("exit", returncode, timed_out))
+        except Exception as e:
+            conn.send(("error", str(e), None))
+
+
+class CommandWorkerPool:
+    """
+    Small pool of pre-started, single-threaded worker processes that spawn commands.
+
+    Forking from a tiny worker is much cheaper than forking the server, whose
+    address space holds the model client, indexes and every session. Workers
+    run this file as a standalone script, so they import nothing but the
+    standard library, and talk to the server over a socketpair.
+    """
+
+    def __init__(self, size=COMMAND_WORKERS):
+        self.size = size
+        self.idle = queue.Queue()
+        self.started = False
+        self.lock = threading.Lock()
+
+    def _start_worker(self):
+        parent_sock, child_sock = socket.socketpair()
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), str(child_sock.fileno())],
+            pass_fds=[child_sock.fileno()],
+            stdin=subprocess.DEVNULL,
+        )
+        child_sock.close()
+        return process, Connection(parent_sock.detach())
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            for _ in range(self.size):
+                self.idle.put(self._start_worker())
+
+    def run(self, argv, cwd, timeout, on_output, cpu_seconds, memory_bytes):
+        self.start()
+        try:
+            worker = self.idle.get_nowait()
+        except queue.Empty:
+            # Every worker is busy; don't make the agent wait for one
+            return run_process(argv, cwd, timeout, on_output, cpu_seconds, memory_bytes)
+        process, conn = worker
+        healthy = False
+        try:
+            conn.send((argv, cwd, timeout, cpu_seconds, memory_bytes))
+            # The worker enforces the timeout; allow it a little slack to report back
+            deadline = time.monotonic() + timeout + 5
+            while True:
+                if not conn.poll(max(deadline - time.monotonic(), 0)):
+                    raise TimeoutError("Command worker stopped responding")
+                message = conn.recv()
+                if message[0] == "output":
+                    on_output(message[1], message[2])
+                elif message[0] == "exit":
+                    healthy = True
+                    return message[1], message[2]
+                else:
+                    healthy = True
+                    raise OSError(message[1])
+        finally:
+            if healthy:
+                self.idle.put(worker)
+            else:
+                process.kill()
+                conn.close()
+                self.idle.put(self._start_worker())
+
+
+_pool = CommandWorkerPool() if COMMAND_WORKERS > 0 else None
+
+
+def start_command_workers():
+    """Start the worker pool ahead of the first command instead of on it."""
+    if _pool is not None:
+        _pool.start()
+
+
+def run_command(command, cwd, timeout=30, cpu_seconds=COMMAND_CPU_SECONDS, memory_bytes=COMMAND_MEMORY_BYTES):
+    """
+    Run a command and return (returncode, stdout, stderr, timed_out).
+
+    Output is streamed to output_sink as it arrives, while only the head and
+    tail of each stream are kept for the return value.
+    """
+    argv = build_argv(command, cwd)
+    buffers = {"stdout": HeadTailBuffer(), "stderr": HeadTailBuffer()}
+    sink = output_sink.get()
+    streamed = [0]
+
+    def on_output(stream, data):
+        buffers[stream].write(data)
+        if sink is not None and streamed[0] < MAX_STREAMED_BYTES:
+            streamed[0] += len(data)
+            sink(stream, data.decode("utf-8", errors="replace"))
+
+    if _pool is not None:
+        returncode, timed_out = _pool.run(argv, cwd, timeout, on_output, cpu_seconds, memory_bytes)
+    else:
+        returncode, timed_out = run_process(argv, cwd, timeout, on_output, cpu_seconds, memory_bytes)
+    return returncode, buffers["stdout"].getvalue(), buffers["stderr"].getvalue(), timed_out
+
+
+if __name__ == "__main__":
+    _worker_main(int(sys.argv[1]))
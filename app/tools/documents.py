@@ -0,0 +1,599 @@
+"""
+Reference documents (PDF, DOCX, Markdown, ...) in the projects directory,
+parsed into chunks the agent can query.
+
+File types are detected from content (python-magic if installed, otherwise
+by sniffing the header and extension). Documents are parsed by a pool of
+worker processes and cut into chunks of at most DOCUMENT_CHUNK_TOKENS
+tokens that never cross a page. Chunks are cached on disk by content hash,
+so a document is parsed once however often it is renamed, copied or the
+server restarted. Queries rank the chunks with BM25.
+"""
+import os
+import re
+import sys
+import html
+import json
+import math
+import heapq
+import queue
+import atexit
+import fnmatch
+import hashlib
+import zipfile
+import importlib.util
+import mimetypes
+import threading
+import subprocess
+from collections import defaultdict
+
+from app.controller.tokens import count_tokens, get_encoding
+from app.tools import file_tools
+from app.tools.file_index import FILE
+from app.tools.search_index import tokenize
+
+try:
+    import magic
+except ImportError:
+    magic = None
+
+# unstructured is heavy, so only look it up here; it is imported on first use
+_HAS_UNSTRUCTURED = importlib.util.find_spec("unstructured") is not None
+
+# Worker processes parsing documents; 0 parses on the calling thread
+DOCUMENT_WORKERS = int(os.environ.get("DOCUMENT_WORKERS", min(os.cpu_count() or 1, 4)))
+# Most tokens in one chunk
+DOCUMENT_CHUNK_TOKENS = int(os.environ.get("DOCUMENT_CHUNK_TOKENS", 400))
+# Larger files are not ingested
+MAX_DOCUMENT_BYTES = int(os.environ.get("MAX_DOCUMENT_BYTES", 64 * 1024 * 1024))
+DOCUMENT_CACHE_DIR = os.environ.get(
+    "DOCUMENT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "agentic-system", "documents")
+)
+DOCUMENT_CACHE_SIZE_LIMIT = int(os.environ.get("DOCUMENT_CACHE_SIZE_LIMIT", 512 * 1024 * 1024))
+# Seconds a worker may spend on one document before it is killed
+PARSE_TIMEOUT = 120
+
+# Bump when parsing or chunking changes, so cached chunks are rebuilt
+PARSER_VERSION = 1
+# Default number of chunks returned by query_documents
+DOCUMENT_RESULTS_LIMIT = 5
+MAX_RESULT_CHARS = 1200
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Extensions worth detecting; everything else in the projects directory is the agent's own output
+DOCUMENT_EXTENSIONS = {
+    ".pdf", ".docx", ".doc", ".odt", ".rtf", ".pptx", ".ppt", ".xlsx", ".epub", ".eml", ".msg",
+    ".md", ".markdown", ".txt", ".rst",
+}
+PDF = "application/pdf"
+DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TEXT_TYPES = {"text/plain", "text/markdown", "text/x-rst", "text/x-markdown"}
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_DOCX_PAGE_BREAK = re.compile(r'<w:br [^>]*w:type="page"[^>]*/>|<w:lastRenderedPageBreak/>')
+_DOCX_PARAGRAPH_END = re.compile(r"</w:p>")
+_DOCX_TEXT = re.compile(r"<w:t(?: [^>]*)?>([^<]*)</w:t>|<w:tab/>")
+
+
+def detect_type(path):
+    """MIME type of the file at path, from its content where possible."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(8192)
+    except OSError:
+        return None
+    ext = os.path.splitext(path)[1].lower()
+    if magic is not None:
+        try:
+            mime = magic.from_buffer(head, mime=True)
+        except Exception:
+            mime = None
+        # libmagic reports Office files as plain zip archives when their first entry isn't the usual one
+        if mime and mime not in ("application/zip", "application/octet-stream"):
+            if mime == "text/plain" and ext in (".md", ".markdown"):
+                return "text/markdown"
+            return mime
+    if head.startswith(b"%PDF-"):
+        return PDF
+    if head.startswith(b"PK\x03\x04") and ext == ".docx":
+        return DOCX
+    guessed = mimetypes.guess_type(path)[0]
+    if ext in (".md", ".markdown"):
+        return "text/markdown"
+    return guessed or "application/octet-stream"
+
+
+# Parsing, run by the workers. Each parser returns [(page number, text)].
+
+def _parse_pdf(path):
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    return [(number, page.extract_text() or "") for number, page in enumerate(reader.pages, 1)]
+
+
+def _parse_docx(path):
+    """Paragraph text of a .docx, split at the page breaks Word recorded."""
+    with zipfile.ZipFile(path) as archive:
+        xml = archive.read("word/document.xml").decode("utf-8", errors="ignore")
+    pages = []
+    for page_xml in _DOCX_PAGE_BREAK.split(xml):
+        paragraphs = []
+        for paragraph in _DOCX_PARAGRAPH_END.split(page_xml):
+            text = "".join(match.group(1) if match.group(1) is not None else "\t"
+                           for match in _DOCX_TEXT.finditer(paragraph))
+            if text.strip():
+                paragraphs.append(html.unescape(text))
+        pages.append((len(pages) + 1, "\n\n".join(paragraphs)))
+    return pages
+
+
+def _parse_unstructured(path):
+    from unstructured.partition.auto import partition
+
+    pages = defaultdict(list)
+    for element in partition(filename=path):
+        pages[getattr(element.metadata, "page_number", None) or 1].append(str(element))
+    return [(number, "\n\n".join(texts)) for number, texts in sorted(pages.items())]
+
+
+def _parse_text(path):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return [(1, f.read())]
+
+
+def _parser(mime):
+    if mime == PDF:
+        return _parse_pdf
+    if mime in TEXT_TYPES:
+        return _parse_text
+    if _HAS_UNSTRUCTURED:
+        return _parse_unstructured
+    if mime == DOCX:
+        return _parse_docx
+    return None
+
+
+def _split_tokens(text, max_tokens):
+    """Cut one over-long paragraph into pieces of at most max_tokens."""
+    encoding = get_encoding()
+    if encoding is None:
+        width = max_tokens * 4
+        return [text[i:i + width] for i in range(0, len(text), width)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+
+def chunk_pages(pages, max_tokens=DOCUMENT_CHUNK_TOKENS):
+    """
+    Pack each page's paragraphs into chunks of at most max_tokens.
+
+    Yields:
+        (page number, text) tuples, in document order.
+    """
+    for number, text in pages:
+        current, current_tokens = [], 0
+        for paragraph in _PARAGRAPH_BREAK.split(text):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            tokens = count_tokens(paragraph)
+            if current and current_tokens + tokens > max_tokens:
+                yield number, "\n\n".join(current)
+                current, current_tokens = [], 0
+            if tokens > max_tokens:
+                pieces = _split_tokens(paragraph, max_tokens)
+                yield from ((number, piece) for piece in pieces[:-1])
+                paragraph, tokens = pieces[-1], count_tokens(pieces[-1])
+            current.append(paragraph)
+            current_tokens += tokens
+        if current:
+            yield number, "\n\n".join(current)
+
+
+def parse_document(path, mime, max_tokens=DOCUMENT_CHUNK_TOKENS):
+    """
+    Parse and chunk one document.
+
+    Returns:
+        dict: pages (count) and chunks ([page number, text] lists), or error.
+    """
+    parser = _parser(mime)
+    if parser is None:
+        return {"error": f"No parser for {mime} (install unstructured for more formats)"}
+    try:
+        pages = parser(path)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    return {"pages": len(pages), "chunks": [list(chunk) for chunk in chunk_pages(pages, max_tokens)]}
+
+
+class DocumentWorkerPool:
+    """
+    Worker processes that parse documents, each fed by a thread of its own.
+
+    Workers run this module as a script (python -m app.tools.documents
+    --worker) rather than as multiprocessing children, which would re-run
+    the server's main module on start. Requests and results are JSON lines
+    over the worker's stdin and stdout.
+    """
+
+    def __init__(self, size=DOCUMENT_WORKERS):
+        self.size = size
+        self.tasks = queue.Queue()
+        self.threads = []
+        self.processes = set()
+        self.lock = threading.Lock()
+        self.parsed = 0
+
+    def _start_worker(self):
+        process = subprocess.Popen(
+            [sys.executable, "-m", "app.tools.documents", "--worker"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+            text=True, encoding="utf-8",
+        )
+        with self.lock:
+            self.processes.add(process)
+        return process
+
+    def _stop_worker(self, process):
+        with self.lock:
+            self.processes.discard(process)
+        process.kill()
+        process.wait()
+
+    def _serve(self):
+        process = None
+        while True:
+            path, mime, max_tokens, done = self.tasks.get()
+            result = {"error": "Parser worker failed"}
+            # done() must run whatever happens, parse_many waits for every result
+            try:
+                if process is None or process.poll() is not None:
+                    process = self._start_worker()
+                # A document that hangs the parser mustn't hold its worker forever
+                timer = threading.Timer(PARSE_TIMEOUT, process.kill)
+                timer.start()
+                try:
+                    process.stdin.write(json.dumps([path, mime, max_tokens]) + "\n")
+                    process.stdin.flush()
+                    line = process.stdout.readline()
+                    result = json.loads(line) if line else {"error": "Parser worker exited"}
+                finally:
+                    timer.cancel()
+            except Exception as e:
+                result = {"error": f"Parser worker failed: {e}"}
+            finally:
+                if "error" in result and process is not None and process.poll() is not None:
+                    self._stop_worker(process)
+                    process = None
+                self.parsed += 1
+                done(result)
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.size):
+                thread = threading.Thread(target=self._serve, name=f"document-parser-{i}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+        atexit.register(self.stop)
+
+    def stop(self):
+        with self.lock:
+            processes, self.processes = list(self.processes), set()
+        for process in processes:
+            process.kill()
+
+    def parse_many(self, documents, max_tokens=DOCUMENT_CHUNK_TOKENS):
+        """Parse [(path, mime)] in parallel; returns their results in the same order."""
+        if not self.size:
+            return [parse_document(path, mime, max_tokens) for path, mime in documents]
+        self.start()
+        results = [None] * len(documents)
+        remaining = threading.Semaphore(0)
+
+        def done_at(i):
+            def done(result):
+                results[i] = result
+                remaining.release()
+            return done
+
+        for i, (path, mime) in enumerate(documents):
+            self.tasks.put((path, mime, max_tokens, done_at(i)))
+        for _ in documents:
+            remaining.acquire()
+        return results
+
+
+def _worker_main():
+    # Keep stray prints from parser libraries out of the result stream
+    out = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    sys.stdout = sys.stderr
+    for line in sys.stdin:
+        path, mime, max_tokens = json.loads(line)
+        out.write(json.dumps(parse_document(path, mime, max_tokens)) + "\n")
+        out.flush()
+
+
+class ChunkCache:
+    """Parsed chunks by content hash, on disk under DOCUMENT_CACHE_DIR."""
+
+    def __init__(self, directory=DOCUMENT_CACHE_DIR, size_limit=DOCUMENT_CACHE_SIZE_LIMIT):
+        import diskcache
+
+        self.cache = diskcache.Cache(directory, size_limit=size_limit, eviction_policy="least-recently-used")
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(content_hash, max_tokens):
+        return f"{content_hash}:{max_tokens}:{PARSER_VERSION}"
+
+    def get(self, key):
+        value = self.cache.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.cache.set(key, value)
+
+
+def _content_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DocumentIndex:
+    """
+    BM25 index over the chunks of every document in a FileIndex.
+
+    Like TextSearchIndex, it listens to the FileIndex and brings changed
+    files up to date on the next query; documents that need parsing are
+    parsed together, in parallel.
+    """
+
+    def __init__(self, file_index, pool=None, cache=None, max_tokens=DOCUMENT_CHUNK_TOKENS):
+        self.file_index = file_index
+        self.pool = pool or DocumentWorkerPool()
+        self.cache = cache or ChunkCache()
+        self.max_tokens = max_tokens
+        self.documents = {}  # relpath -> ((size, mtime_ns), chunk ids, pages)
+        self.chunks = {}  # chunk id -> (relpath, page number, text, length in tokens, distinct tokens)
+        self.postings = defaultdict(dict)  # token -> {chunk id: term frequency}
+        self.total_length = 0
+        self.errors = {}  # relpath -> why it couldn't be parsed
+        self.lock = threading.Lock()
+        self._next_id = 0
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._full_sync = True
+        file_index.add_listener(self._on_file_change)
+
+    def _on_file_change(self, rel):
+        if rel is not None and os.path.splitext(rel)[1].lower() not in DOCUMENT_EXTENSIONS:
+            return
+        with self._dirty_lock:
+            if rel is None:
+                self._full_sync = True
+            else:
+                self._dirty.add(rel)
+
+    # Maintenance
+
+    def sync(self):
+        """Ingest new and changed documents and drop removed ones. Returns the number of paths looked at."""
+        self.file_index.refresh()
+        with self._dirty_lock:
+            full_sync, self._full_sync = self._full_sync, False
+            dirty, self._dirty = self._dirty, set()
+        with self.file_index.lock:
+            if full_sync:
+                wanted = {
+                    rel: entry for rel, entry in self.file_index.entries.items()
+                    if entry[2] == FILE and os.path.splitext(rel)[1].lower() in DOCUMENT_EXTENSIONS
+                }
+                dirty = set(wanted) | set(self.documents)
+            else:
+                wanted = {rel: self.file_index.entries.get(rel) for rel in dirty}
+        if not dirty:
+            return 0
+        with self.lock:
+            to_parse = []
+            for rel in dirty:
+                entry = wanted.get(rel)
+                if entry is None or entry[2] != FILE or entry[0] > MAX_DOCUMENT_BYTES:
+                    self._remove(rel)
+                    self.errors.pop(rel, None)
+                elif rel not in self.documents or self.documents[rel][0] != entry[:2]:
+                    to_parse.append((rel, entry))
+            self._ingest(to_parse)
+        return len(dirty)
+
+    def _ingest(self, to_parse):
+        # Caller holds self.lock
+        ready, missing = [], []
+        for rel, entry in to_parse:
+            path = os.path.join(self.file_index.root, rel)
+            mime = detect_type(path)
+            if mime is None:
+                self._remove(rel)
+                continue
+            try:
+                key = self.cache.make_key(_content_hash(path), self.max_tokens)
+            except OSError:
+                self._remove(rel)
+                continue
+            cached = self.cache.get(key)
+            if cached is not None:
+                ready.append((rel, entry, cached))
+            else:
+                missing.append((rel, entry, path, mime, key))
+        if missing:
+            results = self.pool.parse_many([(path, mime) for _, _, path, mime, _ in missing], self.max_tokens)
+            for (rel, entry, _, _, key), result in zip(missing, results):
+                if "error" not in result:
+                    self.cache.set(key, result)
+                ready.append((rel, entry, result))
+        for rel, entry, result in ready:
+            self._remove(rel)
+            if "error" in result:
+                self.errors[rel] = result["error"]
+                continue
+            self.errors.pop(rel, None)
+            self._add(rel, entry, result)
+
+    def _add(self, rel, entry, result):
+        # Caller holds self.lock
+        ids = []
+        for page, text in result["chunks"]:
+            terms = defaultdict(int)
+            words = tokenize(text)
+            for term in words:
+                terms[term] += 1
+            chunk_id = self._next_id
+            self._next_id += 1
+            for term, frequency in terms.items():
+                self.postings[term][chunk_id] = frequency
+            self.chunks[chunk_id] = (rel, page, text, len(words), tuple(terms))
+            self.total_length += len(words)
+            ids.append(chunk_id)
+        self.documents[rel] = (entry[:2], tuple(ids), result["pages"])
+
+    def _remove(self, rel):
+        # Caller holds self.lock
+        document = self.documents.pop(rel, None)
+        if document is None:
+            return
+        for chunk_id in document[1]:
+            _, _, _, length, terms = self.chunks.pop(chunk_id)
+            self.total_length -= length
+            for term in terms:
+                chunks = self.postings.get(term)
+                if chunks is not None:
+                    chunks.pop(chunk_id, None)
+                    if not chunks:
+                        del self.postings[term]
+
+    # Queries
+
+    def query(self, text, pattern=None, limit=DOCUMENT_RESULTS_LIMIT):
+        """
+        Rank chunks against a query with BM25.
+
+        Returns:
+            list: (relpath, page number, score, chunk text) tuples, best first.
+        """
+        self.sync()
+        terms = list(dict.fromkeys(tokenize(text)))
+        if not terms:
+            return []
+        with self.lock:
+            n_chunks = len(self.chunks)
+            if not n_chunks:
+                return []
+            average_length = self.total_length / n_chunks or 1
+            scores = defaultdict(float)
+            for term in terms:
+                chunks = self.postings.get(term)
+                if not chunks:
+                    continue
+                idf = math.log(1 + (n_chunks - len(chunks) + 0.5) / (len(chunks) + 0.5))
+                for chunk_id, frequency in chunks.items():
+                    length = self.chunks[chunk_id][3]
+                    scores[chunk_id] += idf * frequency * (BM25_K1 + 1) / (
+                        frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    )
+            if pattern:
+                scores = {
+                    chunk_id: score for chunk_id, score in scores.items()
+                    if fnmatch.fnmatch(self.chunks[chunk_id][0], pattern)
+                    or fnmatch.fnmatch(self.chunks[chunk_id][0].rpartition("/")[2], pattern)
+                }
+            ranked = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [(self.chunks[chunk_id][0], self.chunks[chunk_id][1], score, self.chunks[chunk_id][2])
+                    for chunk_id, score in ranked]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "documents": len(self.documents),
+                "pages": sum(document[2] for document in self.documents.values()),
+                "chunks": len(self.chunks),
+                "terms": len(self.postings),
+                "errors": len(self.errors),
+                "parsed": self.pool.parsed,
+                "cache_hits": self.cache.hits,
+                "cache_misses": self.cache.misses,
+            }
+
+
+_document_index = None
+_document_index_lock = threading.Lock()
+
+
+def get_document_index():
+    """Return the DocumentIndex over PROJECTS_DIR, rebuilt if the project index was replaced."""
+    global _document_index
+    file_index = file_tools.get_project_index()
+    with _document_index_lock:
+        if _document_index is None or _document_index.file_index is not file_index:
+            previous = _document_index
+            _document_index = DocumentIndex(
+                file_index,
+                pool=previous.pool if previous else None,
+                cache=previous.cache if previous else None,
+            )
+        return _document_index
+
+
+def query_documents(**kwargs):
+    """
+    Search the reference documents (PDF, DOCX, Markdown, ...) in the projects directory.
+
+    Args:
+        query (str): What to look for.
+        pattern (str, optional): Glob restricting which documents are searched, e.g. '*.pdf'.
+        limit (int, optional): Maximum passages to return, defaults to DOCUMENT_RESULTS_LIMIT.
+
+    Returns:
+        str: The best matching passages with their document and page, best first.
+    """
+    query = kwargs.get("query") or kwargs.get("input")
+    if not query:
+        return "Error: Query required."
+    try:
+        limit = int(kwargs.get("limit") or DOCUMENT_RESULTS_LIMIT)
+    except (TypeError, ValueError):
+        return "Error: limit must be an integer."
+    if limit < 1:
+        return "Error: limit must be at least 1."
+
+    index = get_document_index()
+    results = index.query(query, pattern=kwargs.get("pattern") or None, limit=limit)
+    if not results:
+        if not index.documents:
+            return "No documents found in the projects directory."
+        return f"No passages found for '{query}'."
+    passages = []
+    for rel, page, score, text in results:
+        if len(text) > MAX_RESULT_CHARS:
+            text = text[:MAX_RESULT_CHARS].rstrip() + " ..."
+        passages.append(f"--- {rel} (page {page}, score {score:.2f})\n{text}")
+    return "\n\n".join(passages)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--worker"]:
+        _worker_main()
+    else:
+        print("Usage: python -m app.tools.documents --worker")
@@ -0,0 +1,301 @@
+import os
+import time
+import fnmatch
+import threading
+
+# Minimum seconds between mtime sweeps looking for changes made outside our tools
+REFRESH_INTERVAL = float(os.environ.get("FILE_INDEX_REFRESH_INTERVAL", 2.0))
+
+FILE = "f"
+DIRECTORY = "d"
+
+
+class FileIndex:
+    """
+    In-memory index of a directory tree.
+
+    Every entry is keyed by its path relative to the root (with '/' separators)
+    and stored as a (size, mtime_ns, kind) tuple. The file tools report their own
+    writes, renames and deletes so the index stays current without rescanning.
+    Changes made by other means (e.g. terminal commands) are picked up by a
+    periodic sweep that stats each known directory, rescans only those whose
+    mtime changed and stats the files of the others, since overwriting a file
+    in place leaves its directory's mtime alone.
+
+    Listeners registered with add_listener are called with the relpath of
+    every file that is added, modified or removed, or with None after a full
+    rebuild.
+    """
+
+    def __init__(self, root, refresh_interval=REFRESH_INTERVAL):
+        self.root = root
+        self.refresh_interval = refresh_interval
+        self.entries = {}  # relpath -> (size, mtime_ns, kind)
+        self.children = {}  # reldir -> set of child names
+        self.lock = threading.RLock()
+        self._sorted = None
+        self._built = False
+        self._last_refresh = 0.0
+        self.listeners = []
+
+    # Paths
+
+    def relpath(self, path):
+        """Return the index key for an absolute or root-relative path, or None if it is outside the root."""
+        abs_path = os.path.abspath(os.path.join(self.root, path))
+        if abs_path == self.root:
+            return ""
+        if os.path.commonpath([abs_path, self.root]) != self.root:
+            return None
+        return os.path.relpath(abs_path, self.root).replace(os.sep, "/")
+
+    @staticmethod
+    def _join(reldir, name):
+        return f"{reldir}/{name}" if reldir else name
+
+    @staticmethod
+    def _parent(relpath):
+        return relpath.rpartition("/")[0]
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def _changed(self, rel):
+        # Caller holds self.lock; listeners must be cheap and must not call back into the index
+        for callback in self.listeners:
+            callback(rel)
+
+    # Building and refreshing
+
+    def build(self):
+        with self.lock:
+            self._built = False
+            self.entries = {}
+            self.children = {}
+            self._sorted = None
+            if os.path.isdir(self.root):
+                self.entries[""] = (0, os.stat(self.root).st_mtime_ns, DIRECTORY)
+                self._scan_tree("")
+            self._built = True
+            self._last_refresh = time.monotonic()
+            self._changed(None)
+
+    def _scan_tree(self, reldir):
+        # Caller holds self.lock
+        stack = [reldir]
+        while stack:
+            current = stack.pop()
+            for subdir in self._scan_dir(current):
+                stack.append(subdir)
+
+    def _scan_dir(self, reldir):
+        """Index the direct children of reldir and return the relpaths of its subdirectories."""
+        # Caller holds self.lock
+        abs_dir = os.path.join(self.root, reldir) if reldir else self.root
+        names = set()
+        subdirs = []
+        try:
+            with os.scandir(abs_dir) as it:
+                for entry in it:
+                    rel = self._join(reldir, entry.name)
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    names.add(entry.name)
+                    if is_dir:
+                        self.entries[rel] = (0, st.st_mtime_ns, DIRECTORY)
+                        subdirs.append(rel)
+                    else:
+                        entry = (st.st_size, st.st_mtime_ns, FILE)
+                        if self.entries.get(rel) != entry:
+                            self.entries[rel] = entry
+                            if self._built:
+                                self._changed(rel)
+        except OSError:
+            pass
+        for gone in self.children.get(reldir, set()) - names:
+            self._remove(self._join(reldir, gone))
+        self.children[reldir] = names
+        self._sorted = None
+        return subdirs
+
+    def refresh(self, force=False):
+        """Pick up changes made outside the file tools: rescan directories whose mtime changed, stat every other file."""
+        with self.lock:
+            if not self._built or "" not in self.entries:
+                self.build()
+                return
+            now = time.monotonic()
+            if not force and now - self._last_refresh < self.refresh_interval:
+                return
+            self._last_refresh = now
+            # Compared against the mtimes from before the sweep: rescanning a parent
+            # records its subdirectories' current mtimes, which would hide their changes
+            recorded = {rel: entry[1] for rel, entry in self.entries.items() if entry[2] == DIRECTORY}
+            rescanned = set()
+            for reldir, recorded_mtime in recorded.items():
+                if reldir not in self.entries:
+                    continue  # removed while rescanning its parent
+                abs_dir = os.path.join(self.root, reldir) if reldir else self.root
+                try:
+                    mtime = os.stat(abs_dir).st_mtime_ns
+                except OSError:
+                    self._remove(reldir)
+                    continue
+                if mtime != recorded_mtime:
+                    self.entries[reldir] = (0, mtime, DIRECTORY)
+                    rescanned.add(reldir)
+                    for subdir in self._scan_dir(reldir):
+                        if subdir not in self.children:
+                            rescanned.add(subdir)
+                            self._scan_tree(subdir)
+            # Files overwritten in place, e.g. by `cp b.html a.html`
+            for rel, entry in list(self.entries.items()):
+                if entry[2] != FILE or self._parent(rel) in rescanned:
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.root, rel))
+                except OSError:
+                    self._remove(rel)
+                    continue
+                if (st.st_size, st.st_mtime_ns) != entry[:2]:
+                    self.entries[rel] = (st.st_size, st.st_mtime_ns, FILE)
+                    self._changed(rel)
+
+    # Updates reported by the file tools
+
+    def notify_write(self, path):
+        """Record that a file (or directory) was created or modified."""
+        rel = self.relpath(path)
+        if not rel:
+            return
+        with self.lock:
+            if not self._built:
+                return
+            abs_path = os.path.join(self.root, rel)
+            try:
+                st = os.stat(abs_path)
+            except OSError:
+                self._remove(rel)
+                return
+            self._ensure_parents(rel)
+            if os.path.isdir(abs_path):
+                self.entries[rel] = (0, st.st_mtime_ns, DIRECTORY)
+                self._scan_tree(rel)
+            else:
+                self.entries[rel] = (st.st_size, st.st_mtime_ns, FILE)
+                self._changed(rel)
+            self._add_child(rel)
+            self._sorted = None
+
+    def notify_delete(self, path):
+        rel = self.relpath(path)
+        if not rel:
+            return
+        with self.lock:
+            if self._built:
+                self._remove(rel)
+
+    def notify_rename(self, old_path, new_path):
+        with self.lock:
+            self.notify_delete(old_path)
+            self.notify_write(new_path)
+
+    def _ensure_parents(self, rel):
+        # Caller holds self.lock
+        parent = self._parent(rel)
+        missing = []
+        while parent and parent not in self.entries:
+            missing.append(parent)
+            parent = self._parent(parent)
+        for reldir in reversed(missing):
+            try:
+                mtime = os.stat(os.path.join(self.root, reldir)).st_mtime_ns
+            except OSError:
+                mtime = 0
+            self.entries[reldir] = (0, mtime, DIRECTORY)
+            self.children.setdefault(reldir, set())
+            self._add_child(reldir)
+
+    def _add_child(self, rel):
+        # Caller holds self.lock
+        parent = self._parent(rel)
+        self.children.setdefault(parent, set()).add(rel.rpartition("/")[2])
+        # Our own change bumped the parent's mtime; record it so refresh doesn't rescan
+        try:
+            mtime = os.stat(os.path.join(self.root, parent) if parent else self.root).st_mtime_ns
+            self.entries[parent] = (0, mtime, DIRECTORY)
+        except OSError:
+            pass
+
+    def _remove(self, rel):
+        # Caller holds self.lock
+        entry = self.entries.pop(rel, None)
+        if entry is None:
+            return
+        if entry[2] == FILE:
+            self._changed(rel)
+        else:
+            prefix = rel + "/"
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                if self.entries.pop(key)[2] == FILE:
+                    self._changed(key)
+            for key in [key for key in self.children if key == rel or key.startswith(prefix)]:
+                del self.children[key]
+        siblings = self.children.get(self._parent(rel))
+        if siblings is not None:
+            siblings.discard(rel.rpartition("/")[2])
+        self._sorted = None
+
+    # Queries
+
+    def exists(self, path):
+        rel = self.relpath(path)
+        if rel is None:
+            return False
+        self.refresh()
+        return rel in self.entries
+
+    def get(self, path):
+        rel = self.relpath(path)
+        if rel is None:
+            return None
+        self.refresh()
+        return self.entries.get(rel)
+
+    def _sorted_paths(self):
+        # Caller holds self.lock
+        if self._sorted is None:
+            self._sorted = sorted(key for key in self.entries if key)
+        return self._sorted
+
+    def list(self, path="", pattern=None, recursive=True, offset=0, limit=200):
+        """
+        List indexed entries under `path`.
+
+        Returns:
+            tuple: (page, total) where page is a list of (relpath, size, kind).
+        """
+        base = self.relpath(path or "")
+        if base is None:
+            return [], 0
+        self.refresh()
+        prefix = base + "/" if base else ""
+        with self.lock:
+            matches = []
+            for rel in self._sorted_paths():
+                if not rel.startswith(prefix):
+                    continue
+                rest = rel[len(prefix):]
+                if not recursive and "/" in rest:
+                    continue
+                if pattern and not (fnmatch.fnmatch(rest, pattern) or fnmatch.fnmatch(rest.rpartition("/")[2], pattern)):
+                    continue
+                size, _, kind = self.entries[rel]
+                matches.append((rel, size, kind))
+        return matches[offset:offset + limit], len(matches)
+
+    def __len__(self):
+        return len(self.entries)
@@ -1,9 +1,62 @@
 import os
-import subprocess
+import re
+import json
+import mmap
+import tempfile
+import threading
 from typing import Optional
 
+from app.tools.file_index import FileIndex, DIRECTORY
+from app.tools.search_index import TextSearchIndex
+from app.tools.command_runner import run_command
+
 PROJECTS_DIR = os.path.join(os.path.expanduser("~"), "Desktop", "Ai Stuff", "AgenticSystem", "Projects")
 
+# Largest chunk read_file returns in one observation
+MAX_READ_BYTES = int(os.environ.get("MAX_READ_BYTES", 16 * 1024))
+# Default page size for list_files
+LIST_PAGE_SIZE = 200
+
+# Most files a single write_files call may create
+MAX_BATCH_FILES = 50
+
+# Read once at import; os.umask can only be queried by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# Default number of matches returned by search_files
+SEARCH_RESULTS_LIMIT = 20
+
+_project_index = None
+_search_index = None
+_project_index_lock = threading.Lock()
+# Callbacks added to every project index, including ones built after PROJECTS_DIR changes
+_index_listeners = []
+
+def get_project_index():
+    """Return the FileIndex for PROJECTS_DIR, building it on first use."""
+    global _project_index, _search_index
+    with _project_index_lock:
+        if _project_index is None or _project_index.root != PROJECTS_DIR:
+            _project_index = FileIndex(PROJECTS_DIR)
+            _search_index = TextSearchIndex(_project_index)
+            for callback in _index_listeners:
+                _project_index.add_listener(callback)
+            _project_index.build()
+        return _project_index
+
+def add_index_listener(callback):
+    """Call `callback(relpath)` for every file the tools (or an index refresh) find changed; see FileIndex."""
+    with _project_index_lock:
+        _index_listeners.append(callback)
+        if _project_index is not None:
+            _project_index.add_listener(callback)
+
+def get_search_index():
+    """Return the full-text index over PROJECTS_DIR, kept in step with the project index."""
+    get_project_index()
+    return _search_index
+
 def clean_content(content):
     """Clean and format content before writing to file."""
     if not isinstance(content, str):
@@ -26,7 +79,6 @@ def clean_content(content):
     return content
 
 def create_file(**kwargs):  
-    print("Received kwargs:", kwargs)  # Debugging output
     try:
         filename = kwargs.get("filename", "new_file.txt")
         target_path = os.path.abspath(os.path.join(PROJECTS_DIR, filename))
@@ -38,6 +90,7 @@ def create_file(**kwargs):
         try:
             with open(target_path, "w") as f:
                 f.write("")  
+            get_project_index().notify_write(target_path)
             return f"File '{filename}' created successfully in {PROJECTS_DIR}"
         except Exception as e:
             return f"Error: {str(e)}"
@@ -45,17 +98,110 @@ def create_file(**kwargs):
         return f"Error: {str(e)}"
 
 def list_files(**kwargs):
-    try:
-        return "\n".join(os.listdir(PROJECTS_DIR)) or "No files found."
-    except FileNotFoundError:
+    """
+    List files in the projects directory from the project index.
+
+    Args:
+        path (str, optional): Subdirectory to list, defaults to the whole project tree.
+        pattern (str, optional): Glob matched against the path or file name, e.g. '*.html'.
+        recursive (str, optional): 'false' to list only direct children.
+        offset (int, optional): Number of entries to skip.
+        limit (int, optional): Maximum entries to return, defaults to LIST_PAGE_SIZE.
+
+    Returns:
+        str: One entry per line (directories end with '/'), followed by a
+        continuation hint when more entries remain.
+    """
+    if not os.path.isdir(PROJECTS_DIR):
         return "Error: Projects directory not found."
+    try:
+        offset = _int_arg(kwargs, "offset", 0)
+        limit = _int_arg(kwargs, "limit", LIST_PAGE_SIZE)
+    except ValueError:
+        return "Error: offset and limit must be integers."
+    path = kwargs.get("path", "")
+    pattern = kwargs.get("pattern") or None
+    recursive = str(kwargs.get("recursive", "true")).strip().lower() not in ("false", "0", "no")
+
+    index = get_project_index()
+    if index.relpath(path) is None:
+        return f"Error: Can only list files inside {PROJECTS_DIR}"
+    page, total = index.list(path, pattern, recursive, offset, limit)
+    if not page:
+        return "No files found."
+    lines = [f"{rel}/" if kind == DIRECTORY else f"{rel} ({size} bytes)" for rel, size, kind in page]
+    if offset + len(page) < total:
+        lines.append(f"[{total - offset - len(page)} more entries. Continue with: offset={offset + len(page)}]")
+    return "\n".join(lines)
+
+def _int_arg(kwargs, name, default=None):
+    value = kwargs.get(name)
+    if value is None or value == "":
+        return default
+    return int(str(value).strip())
+
+def _skip_lines(mm, pos, count):
+    """Return the byte position after skipping `count` lines from `pos`, or -1 at EOF."""
+    for _ in range(count):
+        pos = mm.find(b"\n", pos)
+        if pos == -1:
+            return -1
+        pos += 1
+    return pos
+
+def _tail_start(mm, size, lines):
+    """Return the byte position where the last `lines` lines begin."""
+    end = size - 1 if size and mm[size - 1:size] == b"\n" else size
+    pos = end
+    for _ in range(lines):
+        pos = mm.rfind(b"\n", 0, pos)
+        if pos == -1:
+            return 0
+    return pos + 1
+
+def search_files(**kwargs):
+    """
+    Search the text of every file in the projects directory.
+
+    Args:
+        query (str): Words to look for. Close misspellings also match.
+        pattern (str, optional): Glob restricting which files are searched, e.g. '*.css'.
+        limit (int, optional): Maximum matches to return, defaults to SEARCH_RESULTS_LIMIT.
+
+    Returns:
+        str: Ranked 'path:line: text' matches, best first.
+    """
+    query = kwargs.get("query") or kwargs.get("input")
+    if not query:
+        return "Error: Query required."
+    try:
+        limit = _int_arg(kwargs, "limit", SEARCH_RESULTS_LIMIT)
+    except ValueError:
+        return "Error: limit must be an integer."
+    fuzzy = str(kwargs.get("fuzzy", "true")).strip().lower() not in ("false", "0", "no")
+
+    index = get_search_index()
+    results = index.search(query, pattern=kwargs.get("pattern") or None, limit=limit, fuzzy=fuzzy)
+    if not results:
+        return f"No matches found for '{query}'."
+    return "\n".join(f"{rel}:{lineno}: {text}" for rel, lineno, _, text in index.snippets(results))
 
 def read_file(**kwargs):
     """
     Read the content of a file specified by the 'filepath' argument.
 
+    Reads go through mmap, so only the requested bytes are touched. Results
+    are capped at MAX_READ_BYTES; larger reads come back with a header giving
+    the byte range served and the offset to continue from.
+
     Args:
         filepath (str): The relative path to the file within the projects directory.
+        offset (int, optional): Byte offset to start reading at.
+        length (int, optional): Number of bytes to read (capped at MAX_READ_BYTES).
+        start_line (int, optional): First line to read, 1-based.
+        end_line (int, optional): Last line to read, inclusive.
+        mode (str, optional): 'head' or 'tail' to read the first or last `lines` lines.
+        lines (int, optional): Line count for head/tail mode, defaults to 50.
 
     Returns:
         str: The content of the file, or an error message if the file cannot be read.
@@ -68,10 +214,58 @@ def read_file(**kwargs):
     
     if not target_file.startswith(PROJECTS_DIR):
         return f"Error: File not found or access denied. Files must be inside {PROJECTS_DIR}"
-        
+
+    try:
+        offset = _int_arg(kwargs, "offset")
+        length = _int_arg(kwargs, "length")
+        start_line = _int_arg(kwargs, "start_line")
+        end_line = _int_arg(kwargs, "end_line")
+        lines = _int_arg(kwargs, "lines", 50)
+    except ValueError:
+        return "Error: offset, length, start_line, end_line and lines must be integers."
+    mode = str(kwargs.get("mode", "")).strip().lower()
+
     try:
-        with open(target_file, "r", encoding="utf-8") as file:
-            return file.read()
+        size = os.path.getsize(target_file)
+        if size == 0:
+            return ""
+        with open(target_file, "rb") as file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mode == "tail":
+                start, stop = _tail_start(mm, size, max(lines, 0)), size
+            elif mode == "head":
+                stop = _skip_lines(mm, 0, max(lines, 0))
+                start, stop = 0, size if stop == -1 else stop
+            elif start_line is not None or end_line is not None:
+                start = _skip_lines(mm, 0, max((start_line or 1) - 1, 0))
+                if start == -1:
+                    return f"Error: '{filepath}' has fewer than {start_line} lines."
+                if end_line is None:
+                    stop = size
+                else:
+                    stop = _skip_lines(mm, start, max(end_line - (start_line or 1) + 1, 0))
+                    stop = size if stop == -1 else stop
+            else:
+                start = min(max(offset or 0, 0), size)
+                stop = size if length is None else min(start + max(length, 0), size)
+
+            explicit = any(arg is not None for arg in (offset, length, start_line, end_line)) or mode
+            truncated = stop - start > MAX_READ_BYTES
+            if truncated:
+                stop = start + MAX_READ_BYTES
+                # End the page on a line boundary when there is one
+                cut = mm.rfind(b"\n", start, stop)
+                if cut > start:
+                    stop = cut + 1
+            content = mm[start:stop].decode("utf-8", errors="replace")
+
+        if not explicit and not truncated:
+            return content
+        header = f"[{filepath}: bytes {start}-{stop} of {size}]"
+        if truncated or stop < size:
+            footer = f"[{size - stop} more bytes. Continue with: filepath={filepath}, offset={stop}, length={MAX_READ_BYTES}]"
+            return f"{header}\n{content}\n{footer}"
+        return f"{header}\n{content}"
     except Exception as e:
         return f"Error reading file: {str(e)}"
 
@@ -98,14 +292,174 @@ def write_file(**kwargs):
 
     try:
         os.makedirs(os.path.dirname(target_file), exist_ok=True)
-        cleaned_content = clean_content(content)
+        # Structured tool calls pass content verbatim; key=value input needs unescaping
+        cleaned_content = content if kwargs.get("raw") else clean_content(content)
         
-        with open(target_file, "w", encoding="utf-8") as file:
-            file.write(cleaned_content)
+        _write_temp_and_replace(target_file, cleaned_content)
+        get_project_index().notify_write(target_file)
         return f"Successfully wrote content to '{filepath}'"
     except Exception as e:
         return f"Error writing to file: {str(e)}"
 
+def _write_temp(target_file, content):
+    """Write content to a temp file next to target_file and return its path."""
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(target_file),
+        prefix=f".{os.path.basename(target_file)}.",
+        suffix=".tmp"
+    )
+    try:
+        # mkstemp creates files as 0600; give them the mode a plain open() would
+        try:
+            mode = os.stat(target_file).st_mode & 0o777
+        except OSError:
+            mode = 0o666 & ~_UMASK
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return temp_path
+
+def _write_temp_and_replace(target_file, content):
+    """Replace target_file atomically, so readers never see a half-written file."""
+    os.replace(_write_temp(target_file, content), target_file)
+
+# "=== path/to/file" starts a file block in the plain-text manifest format
+_MANIFEST_HEADER = re.compile(r"^===\s*(.+?)\s*$", re.MULTILINE)
+
+def parse_manifest(manifest):
+    """
+    Parse a batch write manifest into a list of (path, content) pairs.
+
+    Two formats are accepted. JSON, either a list of {"path", "content"}
+    objects, a {"files": [...]} object or a {path: content} mapping:
+
+        [{"path": "site/index.html", "content": "<html>...</html>"}]
+
+    Or plain text, where each file starts with a '=== path' line and its
+    content runs until the next header:
+
+        === site/index.html
+        <html>...</html>
+        === site/style.css
+        body { margin: 0; }
+    """
+    if isinstance(manifest, (list, dict)):
+        data = manifest
+    else:
+        manifest = str(manifest).strip()
+        if manifest.startswith("manifest="):
+            manifest = manifest[len("manifest="):].strip()
+        if manifest[:1] in ("[", "{"):
+            data = json.loads(manifest)
+        else:
+            headers = list(_MANIFEST_HEADER.finditer(manifest))
+            if not headers:
+                raise ValueError("Manifest must be JSON or use '=== path' headers")
+            files = []
+            for i, header in enumerate(headers):
+                end = headers[i + 1].start() if i + 1 < len(headers) else len(manifest)
+                content = manifest[header.end():end]
+                # Drop the newline after the header and the one before the next header
+                if content.startswith("\n"):
+                    content = content[1:]
+                if i + 1 < len(headers) and content.endswith("\n"):
+                    content = content[:-1]
+                files.append((header.group(1), content))
+            return files
+
+    if isinstance(data, dict):
+        if "files" in data:
+            data = data["files"]
+        else:
+            return [(path, content) for path, content in data.items()]
+    files = []
+    for item in data:
+        if not isinstance(item, dict) or not (item.get("path") or item.get("filepath")):
+            raise ValueError("Each manifest entry needs a 'path' and 'content'")
+        files.append((item.get("path") or item.get("filepath"), item.get("content", "")))
+    return files
+
+def write_files(**kwargs):
+    """
+    Write many files in one call.
+
+    Every path is validated before anything is written. Each file is written
+    to a temp file beside its target first; only once all of them have been
+    written are they renamed into place, so a failure or crash never leaves a
+    half-written file behind. Should a rename fail, the files renamed before it
+    stay and the error names them.
+
+    Args:
+        manifest (str | list | dict): The files to write, see parse_manifest.
+
+    Returns:
+        str: A one-line-per-file summary, or the error that stopped the batch.
+    """
+    manifest = kwargs.get("manifest", kwargs.get("input"))
+    if not manifest:
+        return "Error: Manifest required."
+    try:
+        files = parse_manifest(manifest)
+    except ValueError as e:
+        return f"Error parsing manifest: {str(e)}"
+    if not files:
+        return "Error: Manifest contains no files."
+    if len(files) > MAX_BATCH_FILES:
+        return f"Error: At most {MAX_BATCH_FILES} files can be written at once."
+
+    targets = []
+    seen = set()
+    for filepath, content in files:
+        target_file = os.path.abspath(os.path.join(PROJECTS_DIR, str(filepath)))
+        if os.path.commonpath([target_file, PROJECTS_DIR]) != PROJECTS_DIR or target_file == PROJECTS_DIR:
+            return f"Access denied: '{filepath}' is outside {PROJECTS_DIR}. No files were written."
+        if target_file in seen:
+            return f"Error: '{filepath}' appears more than once in the manifest. No files were written."
+        if os.path.isdir(target_file):
+            return f"Error: '{filepath}' is a directory. No files were written."
+        seen.add(target_file)
+        targets.append((filepath, target_file, content if isinstance(content, str) else str(content)))
+
+    staged = []
+    try:
+        for filepath, target_file, content in targets:
+            os.makedirs(os.path.dirname(target_file), exist_ok=True)
+            staged.append((_write_temp(target_file, content), target_file))
+    except Exception as e:
+        for temp_path, _ in staged:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+        return f"Error writing files: {str(e)}. No files were written."
+
+    index = get_project_index()
+    done = 0
+    try:
+        for temp_path, target_file in staged:
+            os.replace(temp_path, target_file)
+            index.notify_rename(temp_path, target_file)
+            done += 1
+    except OSError as e:
+        for temp_path, _ in staged[done:]:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+        written = ", ".join(str(filepath) for filepath, _, _ in targets[:done]) or "none"
+        return (f"Error writing '{targets[done][0]}': {str(e)}. "
+                f"Written before the error: {written}. The other files were not written.")
+
+    total = sum(len(content.encode("utf-8")) for _, _, content in targets)
+    lines = [f"Wrote {len(targets)} files ({total} bytes):"]
+    lines.extend(f"- {filepath} ({len(content.encode('utf-8'))} bytes)" for filepath, _, content in targets)
+    return "\n".join(lines)
+
 def show_current_directory(**_):
     """
     Return the path to the projects directory.
@@ -171,7 +525,18 @@ def file_exists(**kwargs):
     if not filepath:
         return "Error: Filepath required."
     target_file = os.path.abspath(os.path.join(PROJECTS_DIR, filepath))
-    return str(os.path.exists(target_file))
+    if os.path.commonpath([target_file, PROJECTS_DIR]) != PROJECTS_DIR:
+        return f"Error: Can only check files inside {PROJECTS_DIR}"
+    return str(get_project_index().exists(target_file))
+
+# Commands that never change the tree, so no index refresh is needed after them
+_READ_ONLY_COMMANDS = {'ls', 'pwd', 'echo', 'cat', 'basename', 'dirname'}
+
+def _is_read_only(cmd_parts):
+    if cmd_parts[0] == 'find':
+        return not any(part in ('-delete', '-exec', '-execdir', '-ok', '-okdir', '-fprint', '-fls')
+                       for part in cmd_parts[1:])
+    return cmd_parts[0] in _READ_ONLY_COMMANDS
 
 def execute_terminal_command(**kwargs):
     """Execute a terminal command and return its output."""
@@ -179,12 +544,18 @@ def execute_terminal_command(**kwargs):
     if not command:
         return "Error: Command required."
     
-    cwd = kwargs.get("cwd", PROJECTS_DIR)
-    timeout = kwargs.get("timeout", 30)
+    # Relative working directories are resolved against PROJECTS_DIR
+    cwd = os.path.abspath(os.path.join(PROJECTS_DIR, kwargs.get("cwd") or PROJECTS_DIR))
+    try:
+        timeout = float(kwargs.get("timeout", 30))
+    except (TypeError, ValueError):
+        return "Error: timeout must be a number of seconds."
     
     # Only allow operations within PROJECTS_DIR
-    if not os.path.abspath(cwd).startswith(PROJECTS_DIR):
+    if os.path.commonpath([cwd, PROJECTS_DIR]) != PROJECTS_DIR:
         return "Error: Operations are only allowed within the Projects directory"
+    if not os.path.isdir(cwd):
+        return f"Error: Directory '{kwargs.get('cwd')}' does not exist"
     
     # Parse the command to ensure it only affects files in PROJECTS_DIR
     cmd_parts = command.split()
@@ -198,27 +569,19 @@ def execute_terminal_command(**kwargs):
                 return f"Error: Cannot access paths outside of {PROJECTS_DIR}"
     
     try:
-        # Run the command with working directory set to PROJECTS_DIR
-        process = subprocess.Popen(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            cwd=PROJECTS_DIR  # Force working directory to PROJECTS_DIR
-        )
-        
-        try:
-            stdout, stderr = process.communicate(timeout=timeout)
-            if process.returncode == 0:
-                output = stdout.strip()
-                return f"Command executed successfully:\n{output}" if output else "Command executed successfully (no output)"
-            else:
-                return f"Command failed with error:\n{stderr.strip()}"
-        except subprocess.TimeoutExpired:
-            process.kill()
-            return f"Command timed out after {timeout} seconds"
-            
+        # Output is streamed to the session while it runs; only head and tail are kept here
+        returncode, stdout, stderr, timed_out = run_command(command, cwd, timeout)
+        # mv/cp/rm/touch/mkdir may have changed the tree; ls, cat and the like can't
+        if not _is_read_only(cmd_parts):
+            get_project_index().refresh(force=True)
+        if timed_out:
+            return f"Command timed out after {timeout:g} seconds"
+        if returncode == 0:
+            output = stdout.strip()
+            return f"Command executed successfully:\n{output}" if output else "Command executed successfully (no output)"
+        if returncode < 0:
+            return f"Command was killed by signal {-returncode} (CPU or memory limit exceeded?)\n{stderr.strip()}"
+        return f"Command failed with error:\n{stderr.strip()}"
     except Exception as e:
         return f"Error executing command: {str(e)}"
 
@@ -275,6 +638,7 @@ def safe_rename_file(old_path: str, new_path: str) -> str:
         
     try:
         os.rename(old_abs_path, new_abs_path)
+        get_project_index().notify_rename(old_abs_path, new_abs_path)
         return f"Successfully renamed '{old_path}' to '{new_path}'"
     except Exception as e:
         return f"Error renaming file: {str(e)}"
@@ -295,6 +659,10 @@ def rename_files_in_directory(directory: str, suffix: str = "_one") -> str:
                         os.path.join(directory, filename),
                         os.path.join(directory, new_name)
                     )
+                    get_project_index().notify_rename(
+                        os.path.join(directory, filename),
+                        os.path.join(directory, new_name)
+                    )
                     results.append(f"Renamed '{filename}' to '{new_name}'")
         
         if results:
@@ -326,6 +694,7 @@ def execute_rename_command(**kwargs):
     
     try:
         os.rename(old_path, new_path)
+        get_project_index().notify_rename(old_path, new_path)
         return f"Successfully renamed '{old_name}' to '{new_name}'"
     except Exception as e:
         return f"Error renaming file: {str(e)}"
@@ -352,6 +721,7 @@ def safe_delete_file(**kwargs):
     
     try:
         os.remove(target_file)
+        get_project_index().notify_delete(target_file)
         return f"Successfully deleted file '{filepath}'"
     except Exception as e:
         return f"Error deleting file: {str(e)}"
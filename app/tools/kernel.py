@@ -1,5 +1,8 @@
+from typing import List, Optional
 
 from langchain.tools import Tool
+from langchain_core.tools import StructuredTool
+from pydantic import BaseModel, Field
 
 
 # Update the import to use the correct path
@@ -8,9 +11,20 @@ from app.tools.file_tools import (
     show_current_directory, parse_input_string, 
     PROJECTS_DIR, file_exists, execute_terminal_command,
     is_command_safe, rename_files_in_directory, execute_rename_command,
-    safe_delete_file
+    safe_delete_file, search_files, write_files
 )
+from app.tools import file_tools
+from app.tools.bulk_files import bulk_files
+from app.tools.documents import query_documents
 from app.tools.web_tool import searchOnline
+from app.tools.observation_store import recall_observation
+
+def run_terminal_command(**kwargs):
+    """Run a terminal command if it passes the safety check."""
+    if not is_command_safe(kwargs.get("command") or ""):
+        return "Command rejected for security reasons"
+    return execute_terminal_command(**kwargs)
+
 tools = [
     Tool(
         name="Delete File",
@@ -24,12 +38,19 @@ tools = [
     ),
     Tool(
         name="Rename Files",
-        func=lambda input: rename_files_in_directory(PROJECTS_DIR, parse_input_string(input).get('suffix', '_one')),
+        # Looked up on every call: job workers point file_tools at each job's folder
+        func=lambda input: rename_files_in_directory(file_tools.PROJECTS_DIR, parse_input_string(input).get('suffix', '_one')),
         description="Rename all files in the projects directory by adding a suffix. Usage: suffix=_new"
     ),
+    Tool(
+        name="Bulk Files",
+        func=lambda input: bulk_files(**parse_input_string(input)),
+        # Braces are doubled for the agent prompt, which is a format string
+        description=f"Copy, move, rename or delete every file in {PROJECTS_DIR} matching a glob or regex in one step. The target is a template using {{{{path}}}}, {{{{dir}}}}, {{{{name}}}}, {{{{stem}}}}, {{{{ext}}}}, {{{{n}}}} or regex groups {{{{1}}}}. Usage: operation=copy|move|rename|delete, pattern=*.html or regex='pages/(.*)\\.htm', target=site/pages/{{{{name}}}}, [path=subdir], [overwrite=true], [dry_run=true]"
+    ),
     Tool(
         name="Execute Terminal Command",
-        func=lambda input: execute_terminal_command(**parse_input_string(input)) if is_command_safe(parse_input_string(input).get("command", "")) else "Command rejected for security reasons",
+        func=lambda input: run_terminal_command(**parse_input_string(input)),
         description="Execute a terminal command. Usage: command='ls -l', [cwd=path], [timeout=30]"
     ),
     Tool(
@@ -42,15 +63,30 @@ tools = [
         func=lambda input: write_file(**parse_input_string(input)),
         description=f"Write content to a file in {PROJECTS_DIR}. Usage: filepath=example.txt, content='Hello World'"
     ),
+    Tool(
+        name="Write Files",
+        func=lambda input: write_files(manifest=input),
+        description=f"Write several files in {PROJECTS_DIR} in one step, e.g. a whole webpage. Start each file with a line '=== relative/path' followed by its content. A JSON list of objects with \"path\" and \"content\" keys also works."
+    ),
     Tool(
         name="Read File",
         func=lambda input: read_file(**parse_input_string(input)),
-        description=f"Read a file from {PROJECTS_DIR}. Usage: filepath=example.txt"
+        description=f"Read a file from {PROJECTS_DIR}. Large files are returned in pages. Usage: filepath=example.txt, [offset=0, length=4096] or [start_line=1, end_line=40] or [mode=head|tail, lines=50]"
     ),
     Tool(
         name="List Files",
         func=lambda input: list_files(**parse_input_string(input)),
-        description=f"List files in {PROJECTS_DIR}"
+        description=f"List files in {PROJECTS_DIR}, including subdirectories. Usage: [path=subdir], [pattern=*.html], [recursive=false], [offset=0], [limit=200]"
+    ),
+    Tool(
+        name="Search Files",
+        func=lambda input: search_files(**parse_input_string(input)),
+        description=f"Search the contents of all files in {PROJECTS_DIR} and return matching file:line snippets. Usage: query=navbar color, [pattern=*.css], [limit=20]"
+    ),
+    Tool(
+        name="Query Documents",
+        func=lambda input: query_documents(**parse_input_string(input)),
+        description=f"Find the passages most relevant to a question in the reference documents (PDF, DOCX, Markdown, text) in {PROJECTS_DIR}. Usage: query=brand colors and fonts, [pattern=*.pdf], [limit=5]"
     ),
     Tool(
         name="File Exists",
@@ -64,7 +100,211 @@ tools = [
     ),
     Tool(
         name="Search Online",
-        func=lambda input: searchOnline(input),
+        func=lambda input: searchOnline(parse_input_string(input).get('query') or input),
         description="Search the web for information on a given query. Usage: query='How to create a website'"
+    ),
+    Tool(
+        name="Recall Observation",
+        func=lambda input: recall_observation(**parse_input_string(input)),
+        description="Fetch lines of an earlier tool output that was shortened. Usage: handle=obs-1a2b3c4d5e, [start_line=1], [end_line=80]"
     )
 ]
+
+# Argument schemas for the structured tools below. These are used for
+# function calling and for the JSON action format, where the model sends
+# typed arguments instead of a key=value string.
+
+class FilepathInput(BaseModel):
+    filepath: str = Field(description="Path relative to the projects directory")
+
+class RenameFileInput(BaseModel):
+    old_name: str = Field(description="Current path relative to the projects directory")
+    new_name: str = Field(description="New path relative to the projects directory")
+
+class RenameFilesInput(BaseModel):
+    suffix: str = Field("_one", description="Suffix added before each file's extension")
+
+class BulkFilesInput(BaseModel):
+    operation: str = Field(description="'copy', 'move', 'rename' or 'delete'")
+    pattern: Optional[str] = Field(None, description="Glob matched against the relative path or file name, e.g. '*.html'")
+    regex: Optional[str] = Field(None, description="Regex matched against the whole relative path, instead of pattern")
+    target: Optional[str] = Field(None, description="Destination template using {path}, {dir}, {name}, {stem}, {ext}, {n} or regex groups {1}; rename targets are relative to each file's folder")
+    path: str = Field("", description="Subdirectory to scan")
+    recursive: bool = Field(True, description="Include subdirectories")
+    overwrite: bool = Field(False, description="Replace existing destinations")
+    dry_run: bool = Field(False, description="Only report what would happen")
+
+class TerminalCommandInput(BaseModel):
+    command: str = Field(description="Command to run, e.g. 'ls -l'")
+    cwd: Optional[str] = Field(None, description="Working directory inside the projects directory")
+    timeout: int = Field(30, description="Seconds before the command is killed")
+
+class CreateFileInput(BaseModel):
+    filename: str = Field(description="Path of the new file relative to the projects directory")
+
+class WriteFileInput(BaseModel):
+    filepath: str = Field(description="Path relative to the projects directory")
+    content: str = Field(description="Full content of the file")
+
+class FileSpec(BaseModel):
+    path: str = Field(description="Path relative to the projects directory")
+    content: str = Field(description="Full content of the file")
+
+class WriteFilesInput(BaseModel):
+    files: List[FileSpec] = Field(description="Files to write")
+
+class ReadFileInput(BaseModel):
+    filepath: str = Field(description="Path relative to the projects directory")
+    offset: Optional[int] = Field(None, description="Byte offset to start reading at")
+    length: Optional[int] = Field(None, description="Number of bytes to read")
+    start_line: Optional[int] = Field(None, description="First line to read, 1-based")
+    end_line: Optional[int] = Field(None, description="Last line to read, inclusive")
+    mode: Optional[str] = Field(None, description="'head' or 'tail'")
+    lines: Optional[int] = Field(None, description="Line count for head/tail mode")
+
+class ListFilesInput(BaseModel):
+    path: str = Field("", description="Subdirectory to list")
+    pattern: Optional[str] = Field(None, description="Glob such as '*.html'")
+    recursive: bool = Field(True, description="Include subdirectories")
+    offset: int = Field(0, description="Entries to skip")
+    limit: int = Field(200, description="Maximum entries to return")
+
+class SearchFilesInput(BaseModel):
+    query: str = Field(description="Words to look for")
+    pattern: Optional[str] = Field(None, description="Glob restricting which files are searched")
+    limit: int = Field(20, description="Maximum matches to return")
+
+class QueryDocumentsInput(BaseModel):
+    query: str = Field(description="What to look for")
+    pattern: Optional[str] = Field(None, description="Glob restricting which documents are searched, e.g. '*.pdf'")
+    limit: int = Field(5, description="Maximum passages to return")
+
+class SearchOnlineInput(BaseModel):
+    query: str = Field(description="What to search for")
+
+class RecallObservationInput(BaseModel):
+    handle: str = Field(description="Handle from a shortened output, e.g. obs-1a2b3c4d5e")
+    start_line: Optional[int] = Field(None, description="First line to return, 1-based")
+    end_line: Optional[int] = Field(None, description="Last line to return, inclusive")
+
+class NoInput(BaseModel):
+    pass
+
+def _without_none(kwargs):
+    return {key: value for key, value in kwargs.items() if value is not None}
+
+structured_tools = [
+    StructuredTool.from_function(
+        func=lambda **kwargs: safe_delete_file(**kwargs),
+        name="delete_file",
+        description=f"Delete a file in {PROJECTS_DIR}",
+        args_schema=FilepathInput
+    ),
+    StructuredTool.from_function(
+        func=lambda **kwargs: execute_rename_command(**kwargs),
+        name="rename_file",
+        description="Rename a file in the projects directory",
+        args_schema=RenameFileInput
+    ),
+    StructuredTool.from_function(
+        func=lambda suffix="_one": rename_files_in_directory(file_tools.PROJECTS_DIR, suffix),
+        name="rename_files",
+        description="Rename all files in the projects directory by adding a suffix",
+        args_schema=RenameFilesInput
+    ),
+    StructuredTool.from_function(
+        func=lambda **kwargs: bulk_files(**_without_none(kwargs)),
+        name="bulk_files",
+        description=f"Copy, move, rename or delete every file in {PROJECTS_DIR} matching a glob or regex in one step",
+        args_schema=BulkFilesInput
+    ),
+    StructuredTool.from_function(
+        func=lambda **kwargs: run_terminal_command(**_without_none(kwargs)),
+        name="execute_terminal_command",
+        description="Execute a simple terminal command (ls, cat, find, mv, cp, mkdir, ...) in the projects directory",
+        args_schema=TerminalCommandInput
+    ),
+    StructuredTool.from_function(
+        func=lambda **kwargs: create_file(**kwargs),
+        name="create_file",
+        description=f"Create an empty file in {PROJECTS_DIR}",
+        args_schema=CreateFileInput
+    ),
+    StructuredTool.from_function(
+        # Arguments arrive exactly as the model wrote them, no unescaping needed
+        func=lambda **kwargs: write_file(raw=True, **kwargs),
+        name="write_file",
+        description=f"Write content to a file in {PROJECTS_DIR}",
+        args_schema=WriteFileInput
+    ),
+    StructuredTool.from_function(
+        func=lambda files: write_files(manifest=[dict(file) for file in files]),
+        name="write_files",
+        description=f"Write several files in {PROJECTS_DIR} in one step, e.g. a whole webpage",
+        args_schema=WriteFilesInput
+    ),
+    StructuredTool.from_function(
+        func=lambda **kwargs: read_file(**_without_none(kwargs)),
+        name="read_file",
+        description=f"Read a file from {PROJECTS_DIR}. Large files are returned in pages",
+        args_schema=ReadFileInput
+    ),
+    StructuredTool.from_function(
+        func=lambda **kwargs: list_files(**_without_none(kwargs)),
+        name="list_files",
+        description=f"List files in {PROJECTS_DIR}, including subdirectories",
+        args_schema=ListFilesInput
+    ),
+    StructuredTool.from_function(
+        func=lambda **kwargs: search_files(**_without_none(kwargs)),
+        name="search_files",
+        description=f"Search the contents of all files in {PROJECTS_DIR} and return matching file:line snippets",
+        args_schema=SearchFilesInput
+    ),
+    StructuredTool.from_function(
+        func=lambda **kwargs: query_documents(**_without_none(kwargs)),
+        name="query_documents",
+        description=f"Find the passages most relevant to a question in the reference documents (PDF, DOCX, Markdown, text) in {PROJECTS_DIR}",
+        args_schema=QueryDocumentsInput
+    ),
+    StructuredTool.from_function(
+        func=lambda **kwargs: file_exists(**kwargs),
+        name="file_exists",
+        description=f"Check if a file exists in {PROJECTS_DIR}",
+        args_schema=FilepathInput
+    ),
+    StructuredTool.from_function(
+        func=lambda: show_current_directory(),
+        name="show_current_directory",
+        description="Show the Projects directory path",
+        args_schema=NoInput
+    ),
+    StructuredTool.from_function(
+        func=lambda query: searchOnline(query),
+        name="search_online",
+        description="Search the web for information on a given query",
+        args_schema=SearchOnlineInput
+    ),
+    StructuredTool.from_function(
+        func=lambda **kwargs: recall_observation(**_without_none(kwargs)),
+        name="recall_observation",
+        description="Fetch lines of an earlier tool output that was shortened",
+        args_schema=RecallObservationInput
+    ),
+]
+
+def _accept_bare_input(func, field):
+    # LangChain validates a bare string input as the schema's first field but
+    # then passes it positionally; hand it to the tool under that field's name
+    def run(*args, **kwargs):
+        if args:
+            kwargs[field] = args[0]
+        return func(**kwargs)
+    return run
+
+# Return schema violations to the model as an observation instead of failing the run
+for structured_tool in structured_tools:
+    structured_tool.handle_validation_error = True
+    fields = list(structured_tool.args_schema.model_fields)
+    if fields:
+        structured_tool.func = _accept_bare_input(structured_tool.func, fields[0])
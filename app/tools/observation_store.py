@@ -0,0 +1,90 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Total size of the full tool outputs kept for recall; the oldest are dropped first
+OBSERVATION_STORE_BYTES = int(os.environ.get("OBSERVATION_STORE_BYTES", 64 * 1024 * 1024))
+# Most bytes a single recall returns, so a recall can't flood the scratchpad itself
+RECALL_MAX_BYTES = int(os.environ.get("RECALL_MAX_BYTES", 8 * 1024))
+
+
+class ObservationStore:
+    """
+    Keeps full tool outputs whose compacted form went into the scratchpad.
+
+    Handles are derived from the content, so storing the same output twice
+    returns the same handle and costs nothing extra.
+    """
+
+    def __init__(self, max_bytes=OBSERVATION_STORE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # handle -> text
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def put(self, text):
+        handle = "obs-" + hashlib.sha1(text.encode("utf-8", errors="replace")).hexdigest()[:10]
+        with self.lock:
+            if handle in self.entries:
+                self.entries.move_to_end(handle)
+                return handle
+            self.entries[handle] = text
+            self.size += len(text)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, dropped = self.entries.popitem(last=False)
+                self.size -= len(dropped)
+        return handle
+
+    def get(self, handle):
+        with self.lock:
+            text = self.entries.get(handle)
+            if text is not None:
+                self.entries.move_to_end(handle)
+            return text
+
+
+observation_store = ObservationStore()
+
+
+def recall_observation(**kwargs):
+    """
+    Return lines of a stored tool output.
+
+    Args:
+        handle (str): Handle from a compacted observation, e.g. obs-1a2b3c4d5e.
+        start_line (int): First line to return, 1-based. Defaults to 1.
+        end_line (int): Last line to return. Defaults to as many as fit in RECALL_MAX_BYTES.
+    """
+    handle = str(kwargs.get("handle") or kwargs.get("input") or "").strip()
+    if not handle:
+        return "Error: Handle required."
+    text = observation_store.get(handle)
+    if text is None:
+        return f"Error: No stored output for '{handle}'. It may have expired."
+    try:
+        start_line = max(int(kwargs.get("start_line") or 1), 1)
+        end_line = int(kwargs["end_line"]) if kwargs.get("end_line") not in (None, "") else None
+    except (TypeError, ValueError):
+        return "Error: start_line and end_line must be integers."
+
+    lines = text.splitlines()
+    last = len(lines) if end_line is None else min(end_line, len(lines))
+    selected = []
+    used = 0
+    for lineno in range(start_line, last + 1):
+        line = lines[lineno - 1]
+        used += len(line.encode("utf-8")) + 1
+        if used > RECALL_MAX_BYTES:
+            if not selected:
+                # A single huge line (e.g. minified JS) still gets cut to the limit
+                head = line.encode("utf-8")[:RECALL_MAX_BYTES].decode("utf-8", errors="ignore")
+                selected.append(f"{head}... [{len(line.encode('utf-8')) - len(head.encode('utf-8'))} bytes omitted]")
+            break
+        selected.append(line)
+    if not selected:
+        return f"[{handle}: {len(lines)} lines, nothing at line {start_line}]"
+    shown_to = start_line + len(selected) - 1
+    header = f"[{handle}: lines {start_line}-{shown_to} of {len(lines)}]"
+    footer = f"\n[Continue with handle={handle}, start_line={shown_to + 1}]" if shown_to < len(lines) else ""
+    return header + "\n" + "\n".join(selected) + footer
@@ -0,0 +1,203 @@
+import os
+import re
+import math
+import heapq
+import fnmatch
+import threading
+from collections import defaultdict
+
+from app.tools.file_index import FILE
+
+# Files larger than this are not indexed
+MAX_INDEX_FILE_BYTES = int(os.environ.get("SEARCH_MAX_FILE_BYTES", 512 * 1024))
+# Fuzzy matches below this RapidFuzz ratio are ignored
+FUZZY_SCORE_CUTOFF = 80
+FUZZY_EXPANSIONS = 5
+MAX_SNIPPET_CHARS = 160
+# Files whose lines are scored individually after the file-level ranking
+MIN_CANDIDATE_FILES = 50
+
+_TOKEN = re.compile(r"[a-z0-9_]{2,}")
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+def _read_text(path):
+    """Return the file's text, or None if it is missing, too large or looks binary."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read(MAX_INDEX_FILE_BYTES + 1)
+    except OSError:
+        return None
+    if len(data) > MAX_INDEX_FILE_BYTES or b"\0" in data[:8192]:
+        return None
+    return data.decode("utf-8", errors="ignore")
+
+
+class TextSearchIndex:
+    """
+    Inverted index (token -> file -> line numbers) over the text files in a FileIndex.
+
+    The index listens to the FileIndex for changed paths and reindexes only
+    those files, lazily, on the next query.
+    """
+
+    def __init__(self, file_index):
+        self.file_index = file_index
+        self.postings = defaultdict(dict)  # token -> {relpath: (line numbers)}
+        self.files = {}  # relpath -> ((size, mtime_ns), tokens in the file)
+        self.lock = threading.Lock()
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._full_sync = True
+        self._vocab = None
+        file_index.add_listener(self._on_file_change)
+
+    def _on_file_change(self, rel):
+        with self._dirty_lock:
+            if rel is None:
+                self._full_sync = True
+            else:
+                self._dirty.add(rel)
+
+    # Maintenance
+
+    def sync(self):
+        """Bring the index up to date with the FileIndex."""
+        self.file_index.refresh()
+        with self._dirty_lock:
+            full_sync, self._full_sync = self._full_sync, False
+            dirty, self._dirty = self._dirty, set()
+        with self.file_index.lock:
+            if full_sync:
+                wanted = {rel: entry for rel, entry in self.file_index.entries.items() if entry[2] == FILE}
+                dirty = set(wanted) | set(self.files)
+            else:
+                wanted = {rel: self.file_index.entries.get(rel) for rel in dirty}
+        if not dirty:
+            return 0
+        with self.lock:
+            for rel in dirty:
+                entry = wanted.get(rel)
+                if entry is None or entry[2] != FILE:
+                    self._remove_file(rel)
+                elif rel not in self.files or self.files[rel][0] != entry[:2]:
+                    self._index_file(rel, entry)
+            self._vocab = None
+        return len(dirty)
+
+    def _index_file(self, rel, entry):
+        # Caller holds self.lock
+        self._remove_file(rel)
+        text = _read_text(os.path.join(self.file_index.root, rel)) if entry[0] <= MAX_INDEX_FILE_BYTES else None
+        if text is None:
+            return
+        lines_by_token = defaultdict(list)
+        for lineno, line in enumerate(text.splitlines(), 1):
+            for token in set(tokenize(line)):
+                lines_by_token[token].append(lineno)
+        for token, lines in lines_by_token.items():
+            self.postings[token][rel] = tuple(lines)
+        self.files[rel] = (entry[:2], tuple(lines_by_token))
+
+    def _remove_file(self, rel):
+        # Caller holds self.lock
+        indexed = self.files.pop(rel, None)
+        if indexed is None:
+            return
+        for token in indexed[1]:
+            files = self.postings.get(token)
+            if files is not None:
+                files.pop(rel, None)
+                if not files:
+                    del self.postings[token]
+
+    # Queries
+
+    def _expand(self, term, fuzzy):
+        """Return [(token, weight)] for a query term, adding close spellings when fuzzy."""
+        matches = {term: 1.0} if term in self.postings else {}
+        if fuzzy:
+            try:
+                from rapidfuzz import fuzz, process
+            except ImportError:
+                return list(matches.items())
+            if self._vocab is None:
+                self._vocab = list(self.postings)
+            for token, score, _ in process.extract(
+                term, self._vocab, scorer=fuzz.ratio,
+                score_cutoff=FUZZY_SCORE_CUTOFF, limit=FUZZY_EXPANSIONS
+            ):
+                matches.setdefault(token, score / 100.0)
+        return list(matches.items())
+
+    def search(self, query, pattern=None, limit=20, fuzzy=True):
+        """
+        Rank lines matching the query.
+
+        Returns:
+            list: (relpath, line number, score) tuples, best first.
+        """
+        self.sync()
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self.lock:
+            n_files = max(len(self.files), 1)
+            # (term, weight * idf, {relpath: lines}) for every query term and its expansions
+            matches = []
+            for term in terms:
+                for token, weight in self._expand(term, fuzzy):
+                    files = self.postings.get(token, {})
+                    idf = math.log(1 + n_files / (1 + len(files)))
+                    matches.append((term, weight * idf, files))
+
+            # Rank files first, so line-level scoring only touches the best candidates
+            file_scores = defaultdict(float)
+            file_terms = defaultdict(set)
+            for term, weight, files in matches:
+                for rel, lines in files.items():
+                    file_scores[rel] += weight * (1 + math.log(len(lines)))
+                    file_terms[rel].add(term)
+            if pattern:
+                file_scores = {
+                    rel: score for rel, score in file_scores.items()
+                    if fnmatch.fnmatch(rel, pattern) or fnmatch.fnmatch(rel.rpartition("/")[2], pattern)
+                }
+            candidates = heapq.nlargest(
+                max(limit, MIN_CANDIDATE_FILES), file_scores,
+                key=lambda rel: (len(file_terms[rel]), file_scores[rel])
+            )
+
+            line_scores = defaultdict(float)
+            line_terms = defaultdict(set)
+            for term, weight, files in matches:
+                for rel in candidates:
+                    for lineno in files.get(rel, ()):
+                        line_scores[(rel, lineno)] += weight
+                        line_terms[(rel, lineno)].add(term)
+        # Lines that match every query term go first
+        ranked = heapq.nlargest(
+            limit, line_scores.items(),
+            key=lambda item: (len(line_terms[item[0]]), item[1])
+        )
+        return [(rel, lineno, score) for (rel, lineno), score in ranked]
+
+    def snippets(self, results):
+        """Attach the text of each matched line, reading each file once."""
+        wanted = defaultdict(set)
+        for rel, lineno, _ in results:
+            wanted[rel].add(lineno)
+        text = {}
+        for rel, lines in wanted.items():
+            content = _read_text(os.path.join(self.file_index.root, rel))
+            if content is None:
+                continue
+            # Numbered exactly as _index_file numbers them: splitlines() also breaks
+            # on \f, \x1c-\x1e and \u2028, which iterating the file does not
+            for lineno, line in enumerate(content.splitlines(), 1):
+                if lineno in lines:
+                    text[(rel, lineno)] = line.strip()[:MAX_SNIPPET_CHARS]
+        return [(rel, lineno, score, text.get((rel, lineno), "")) for rel, lineno, score in results]
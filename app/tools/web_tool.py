@@ -1,14 +1,223 @@
 import os
-import subprocess
+import time
+import asyncio
+import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from typing import Optional
-from langchain_community.tools import DuckDuckGoSearchRun
 
 PROJECTS_DIR = os.path.join(os.path.expanduser("~"), "Desktop", "Ai Stuff", "AgenticSystem", "Projects")
 
+# Which backend answers searches: "duckduckgo" or "local" (offline stand-in for tests and benchmarks)
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "duckduckgo")
+# Seconds a result stays fresh in the cache
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", 15 * 60))
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", 1024))
+# Hard deadline for a search before we give up and answer from what we have
+SEARCH_TIMEOUT = float(os.environ.get("SEARCH_TIMEOUT", 8))
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", 8))
+
+
+class DuckDuckGoBackend:
+    """Searches DuckDuckGo through a single reused client."""
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from langchain_community.tools import DuckDuckGoSearchRun
+                    self._client = DuckDuckGoSearchRun()
+        return self._client
+
+    def search(self, query):
+        return self._get_client().run(query)
+
+
+class LocalSearchBackend:
+    """
+    Offline stand-in that answers every query with canned text.
+
+    Args:
+        latency (float): Seconds to wait before answering.
+        jitter (float): Extra random delay of up to this many seconds.
+        failure_rate (float): Probability that a call raises an error.
+    """
+
+    def __init__(self, latency=0.2, jitter=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def search(self, query):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        if random.random() < self.failure_rate:
+            raise RuntimeError("Local search backend failure")
+        return f"Local results for '{query}': result one, result two, result three."
+
+
+def normalize_query(query):
+    """Lowercase, drop surrounding quotes and collapse whitespace so equivalent queries share a cache entry."""
+    query = str(query).strip()
+    if len(query) > 1 and query[0] == query[-1] and query[0] in ('"', "'"):
+        query = query[1:-1]
+    return " ".join(query.lower().split())
+
+
+class SearchService:
+    """
+    Caching, deduplicating front end for a search backend.
+
+    Fresh results are served from an LRU cache. Concurrent searches for the
+    same query share one backend call. A search that misses the deadline
+    returns the last known (stale) result for the query if there is one.
+    """
+
+    def __init__(self, backend, ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_SIZE,
+                 timeout=SEARCH_TIMEOUT, workers=SEARCH_WORKERS):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.cache = OrderedDict()  # normalized query -> (fetched_at, result)
+        self.inflight = {}  # normalized query -> Future
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+        self.stats = {"hits": 0, "misses": 0, "deduplicated": 0, "timeouts": 0, "errors": 0}
+
+    def _lookup(self, key, now, allow_stale=False):
+        # Caller holds self.lock
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        fetched_at, result = entry
+        if not allow_stale and now - fetched_at > self.ttl:
+            return None
+        self.cache.move_to_end(key)
+        return result
+
+    def _store(self, key, future):
+        with self.lock:
+            self.inflight.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                if not future.cancelled():
+                    self.stats["errors"] += 1
+                return
+            self.cache[key] = (time.monotonic(), future.result())
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+
+    def submit(self, query):
+        """Return a Future for the query, joining an identical in-flight search if there is one."""
+        key = normalize_query(query)
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is not None:
+                self.stats["deduplicated"] += 1
+                return key, future
+            future = self.pool.submit(self.backend.search, query)
+            self.inflight[key] = future
+        future.add_done_callback(lambda f: self._store(key, f))
+        return key, future
+
+    def _cached(self, key):
+        with self.lock:
+            cached = self._lookup(key, time.monotonic())
+            if cached is not None:
+                self.stats["hits"] += 1
+            else:
+                self.stats["misses"] += 1
+            return cached
+
+    def _timed_out(self, key, timeout):
+        with self.lock:
+            self.stats["timeouts"] += 1
+            stale = self._lookup(key, time.monotonic(), allow_stale=True)
+        if stale is not None:
+            return f"(Search timed out after {timeout:g}s, showing earlier results)\n{stale}"
+        return f"Search timed out after {timeout:g} seconds. Try again or rephrase the query."
+
+    def search(self, query, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        key = normalize_query(query)
+        if not key:
+            return "Error: Search query required."
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        key, future = self.submit(query)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            return self._timed_out(key, timeout)
+        except Exception as e:
+            return f"Error searching online: {str(e)}"
+
+    async def asearch(self, query, timeout=None):
+        """Async version of search that shares the cache and in-flight searches with it."""
+        timeout = self.timeout if timeout is None else timeout
+        key = normalize_query(query)
+        if not key:
+            return "Error: Search query required."
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        key, future = self.submit(query)
+        try:
+            # Shielded so a timeout here doesn't cancel the search for other waiters
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except asyncio.TimeoutError:
+            return self._timed_out(key, timeout)
+        except Exception as e:
+            return f"Error searching online: {str(e)}"
+
+
+_search_service = None
+_search_service_lock = threading.Lock()
+
+
+def create_search_backend(name=SEARCH_BACKEND):
+    if name == "local":
+        return LocalSearchBackend()
+    return DuckDuckGoBackend()
+
+
+def get_search_service():
+    global _search_service
+    if _search_service is None:
+        with _search_service_lock:
+            if _search_service is None:
+                _search_service = SearchService(create_search_backend())
+    return _search_service
+
+
+def set_search_backend(backend, **kwargs):
+    """Swap the backend used by searchOnline, e.g. for a LocalSearchBackend in benchmarks."""
+    global _search_service
+    with _search_service_lock:
+        _search_service = SearchService(backend, **kwargs)
+    return _search_service
+
+
 def searchOnline(query: str) -> Optional[str]:
     """
     Search the web for information on a given query.
     """
-    search = DuckDuckGoSearchRun()
-    result = search.run(query)
-    return result
\ No newline at end of file
+    return get_search_service().search(query)
+
+async def asearchOnline(query: str) -> Optional[str]:
+    """
+    Search the web without blocking the event loop.
+    """
+    return await get_search_service().asearch(query)
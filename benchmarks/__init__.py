@@ -0,0 +1 @@
+# Benchmark scripts, run with python -m benchmarks.<name>
@@ -0,0 +1,98 @@
+"""
+Exercise the LLM backend pool against local stub servers.
+
+Usage: python -m benchmarks.bench_backends [--clients 16] [--requests 10] [--policy least-outstanding]
+
+Three stub servers are started: a fast one, a slow one and a flaky one that
+fails a share of its requests. Halfway through, the fast server goes down
+and comes back later, so requests have to fail over while conversations
+are running. The output lists client-visible errors, latency percentiles
+and how the requests were spread over the backends.
+"""
+import json
+import time
+import argparse
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage
+
+from app.controller.agent import create_pooled_client
+from app.controller.backends import BackendPool, PooledChatModel
+from benchmarks.stub_openai_server import StubServer
+
+
+def run_client(llm, n_requests, latencies, errors):
+    for i in range(n_requests):
+        start = time.perf_counter()
+        try:
+            llm.invoke([HumanMessage(content=f"turn {i}")])
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(type(e).__name__)
+
+
+def bench(clients, n_requests, policy, max_concurrency):
+    servers = {
+        "fast": StubServer(ttft=0.05, tokens_per_sec=200),
+        "slow": StubServer(ttft=0.4, tokens_per_sec=50),
+        "flaky": StubServer(ttft=0.05, tokens_per_sec=200, failure_rate=0.3),
+    }
+    urls = {name: server.start() for name, server in servers.items()}
+    pool = BackendPool(list(urls.values()), create_pooled_client, max_concurrency=max_concurrency,
+                       policy=policy, health_interval=0.5)
+    llm = PooledChatModel(pool=pool)
+
+    def outage():
+        time.sleep(1.0)
+        servers["fast"].down = True
+        time.sleep(2.0)
+        servers["fast"].down = False
+
+    latencies, errors = [], []
+    threading.Thread(target=outage, daemon=True).start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as workers:
+        for _ in range(clients):
+            workers.submit(run_client, llm, n_requests, latencies, errors)
+    wall = time.perf_counter() - start
+    latencies.sort()
+    stats = pool.stats()
+    names = {url: name for name, url in urls.items()}
+    for server in servers.values():
+        server.stop()
+    return {
+        "policy": policy,
+        "requests": clients * n_requests,
+        "client_errors": len(errors),
+        "requests_per_sec": round(len(latencies) / wall, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1) if latencies else None,
+        "failovers": stats["failovers"],
+        "backends": {
+            names[backend["url"]]: {
+                "requests": backend["requests"],
+                "failures": backend["failures"],
+                "max_in_flight": servers[names[backend["url"]]].max_in_flight,
+            }
+            for backend in stats["backends"]
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--policy", choices=["least-outstanding", "latency", "both"], default="both")
+    args = parser.parse_args()
+
+    policies = ["least-outstanding", "latency"] if args.policy == "both" else [args.policy]
+    for policy in policies:
+        print(json.dumps(bench(args.clients, args.requests, policy, args.max_concurrency)))
+
+
+if __name__ == "__main__":
+    main()
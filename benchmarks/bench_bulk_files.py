@@ -0,0 +1,107 @@
+"""
+Compare restructuring a generated site file by file with doing it in one Bulk Files call.
+
+Usage: python -m benchmarks.bench_bulk_files [--files 500] [--size 65536] [--repeat 3]
+
+Creates --files files of --size bytes under site/ and copies them into a
+backup folder, then renames every .html file to .htm:
+  per-file shell   one `cp`/`mv` terminal command per file, as an agent
+                   without the bulk tool would issue them
+  bulk serial      one bulk_files call, copies on a single thread
+  bulk parallel    one bulk_files call, copies on BULK_COPY_WORKERS threads
+Prints one JSON line per mode with the median seconds of --repeat runs.
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import statistics
+import tempfile
+
+from app.tools import bulk_files as bulk_module
+from app.tools import file_tools
+from app.tools.bulk_files import bulk_files
+from app.tools.file_tools import execute_terminal_command
+
+
+def make_site(root, n_files, size):
+    for i in range(n_files):
+        directory = os.path.join(root, "site", f"section{i % 10}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"page{i}.html"), "wb") as f:
+            f.write(os.urandom(size))
+
+
+def site_files(root):
+    site = os.path.join(root, "site")
+    return sorted(
+        os.path.relpath(os.path.join(directory, name), root)
+        for directory, _, names in os.walk(site) for name in names
+    )
+
+
+def per_file_shell(root):
+    start = time.perf_counter()
+    for rel in site_files(root):
+        directory = os.path.join("backup", os.path.dirname(rel))
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+        execute_terminal_command(command=f"cp {rel} {directory}/")
+    copy_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for rel in site_files(root):
+        execute_terminal_command(command=f"mv {rel} {rel[:-len('.html')]}.htm")
+    return copy_s, time.perf_counter() - start
+
+
+def bulk(root, workers):
+    bulk_module.BULK_COPY_WORKERS = workers
+    start = time.perf_counter()
+    report = bulk_files(operation="copy", path="site", pattern="*.html", target="backup/site/")
+    copy_s = time.perf_counter() - start
+    assert report.startswith("Copied"), report
+    start = time.perf_counter()
+    report = bulk_files(operation="rename", path="site", pattern="*.html", target="{stem}.htm")
+    assert report.startswith("Renamed"), report
+    return copy_s, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--size", type=int, default=64 * 1024)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    workers = bulk_module.BULK_COPY_WORKERS
+    modes = {
+        "per-file shell": per_file_shell,
+        "bulk serial": lambda root: bulk(root, 1),
+        "bulk parallel": lambda root: bulk(root, workers),
+    }
+    for mode, run in modes.items():
+        copies, renames = [], []
+        for _ in range(args.repeat):
+            root = os.path.realpath(tempfile.mkdtemp(prefix="bench_bulk_files_"))
+            try:
+                make_site(root, args.files, args.size)
+                file_tools.PROJECTS_DIR = root
+                copy_s, rename_s = run(root)
+                assert len(site_files(root)) == args.files
+                assert os.path.getsize(os.path.join(root, "backup", site_files(root)[0][:-len(".htm")] + ".html")) == args.size
+                copies.append(copy_s)
+                renames.append(rename_s)
+            finally:
+                shutil.rmtree(root)
+        print(json.dumps({
+            "benchmark": "bulk_files",
+            "mode": mode,
+            "files": args.files,
+            "size_bytes": args.size,
+            "copy_s": round(statistics.median(copies), 3),
+            "rename_s": round(statistics.median(renames), 3),
+        }))
+
+
+if __name__ == "__main__":
+    main()
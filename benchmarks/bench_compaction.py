@@ -0,0 +1,117 @@
+"""
+Measure prompt tokens per agent iteration with and without observation compaction.
+
+Usage: python -m benchmarks.bench_compaction [--html-lines 400] [--log-lines 2000] [--files 300]
+
+A scripted model reads a large HTML page and a long log, lists a big
+directory, searches the web and reads a stylesheet before answering. Every
+prompt it receives is counted, so the output shows how the scratchpad
+grows with each iteration.
+"""
+import os
+import json
+import argparse
+import tempfile
+from typing import Any, List
+
+from langchain.agents import ZeroShotAgent
+from langchain_core.language_models.chat_models import SimpleChatModel
+
+from app.controller import agent as agent_module
+from app.controller.compaction import OBSERVATION_TOKEN_LIMIT, SCRATCHPAD_TOKEN_LIMIT
+from app.controller.parallel import ParallelAgentExecutor
+from app.controller.tokens import count_tokens
+from app.tools import file_tools
+from app.tools.kernel import tools
+from app.tools.web_tool import LocalSearchBackend, set_search_backend
+
+ACTIONS = [
+    ("Read File", "filepath=site/index.html"),
+    ("Read File", "filepath=logs/build.log"),
+    ("List Files", "path=assets"),
+    ("Search Online", "query='hero section spacing'"),
+    ("Read File", "filepath=site/style.css"),
+]
+
+
+class RecordingChatModel(SimpleChatModel):
+    """Replies with a fixed script and records the token count of every prompt."""
+
+    responses: List[str]
+    prompt_tokens: List[int] = []
+
+    @property
+    def _llm_type(self):
+        return "recording"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        self.prompt_tokens.append(sum(count_tokens(str(message.content)) for message in messages))
+        return self.responses[(len(self.prompt_tokens) - 1) % len(self.responses)]
+
+
+def make_project(root, html_lines, log_lines, n_files):
+    def write(path, text):
+        os.makedirs(os.path.join(root, os.path.dirname(path)), exist_ok=True)
+        with open(os.path.join(root, path), "w") as f:
+            f.write(text)
+
+    sections = "\n".join(
+        f'    <section id="s{i}"><h2>Section {i}</h2>\n      <p>Paragraph {i} with some copy about the product.</p>\n    </section>'
+        for i in range(html_lines // 3)
+    )
+    write("site/index.html", f"<!doctype html>\n<html>\n  <head><title>Landing</title>\n"
+                             f'    <link rel="stylesheet" href="style.css">\n  </head>\n  <body>\n'
+                             f"    <header><nav>Home | About</nav></header>\n{sections}\n  </body>\n</html>\n")
+    write("logs/build.log", "\n".join(
+        f"[{i:05d}] compiled module_{i}.js in {i % 97} ms" for i in range(log_lines)
+    ) + "\nERROR: missing asset hero.png\n")
+    for i in range(n_files):
+        write(f"assets/image_{i:04d}.png", "x")
+    write("site/style.css", "body { margin: 0; }\n.hero { padding: 4rem 2rem; }\n")
+
+
+def run(label, observation_limit, scratchpad_limit):
+    llm = RecordingChatModel(responses=[
+        f"Thought: I need to check this next.\nAction: {tool}\nAction Input: {tool_input}"
+        for tool, tool_input in ACTIONS
+    ] + ["Thought: Done.\nFinal Answer: The hero image is missing from assets."], prompt_tokens=[])
+    agent = ZeroShotAgent.from_llm_and_tools(
+        llm=llm,
+        tools=tools,
+        prefix=agent_module.SYSTEM_PROMPT,
+        format_instructions=agent_module.FORMAT_INSTRUCTIONS,
+        input_variables=["input", "agent_scratchpad"],
+    )
+    executor = ParallelAgentExecutor.from_agent_and_tools(
+        agent=agent, tools=tools, max_iterations=10,
+        observation_token_limit=observation_limit, scratchpad_token_limit=scratchpad_limit,
+    )
+    executor.invoke({"input": "Why is the hero section broken?"})
+    return {
+        "mode": label,
+        "prompt_tokens_per_iteration": llm.prompt_tokens,
+        "total_prompt_tokens": sum(llm.prompt_tokens),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--html-lines", type=int, default=400)
+    parser.add_argument("--log-lines", type=int, default=2000)
+    parser.add_argument("--files", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as projects_dir:
+        make_project(projects_dir, args.html_lines, args.log_lines, args.files)
+        file_tools.PROJECTS_DIR = projects_dir
+        set_search_backend(LocalSearchBackend(latency=0))
+
+        before = run("raw observations", None, None)
+        after = run("compacted", OBSERVATION_TOKEN_LIMIT, SCRATCHPAD_TOKEN_LIMIT)
+        after["reduction"] = round(1 - after["total_prompt_tokens"] / before["total_prompt_tokens"], 3)
+        print(json.dumps(before))
+        print(json.dumps(after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Measure what persisting conversations costs a turn and what reopening one costs.
+
+Usage: python -m benchmarks.bench_conversations [--turns 2000] [--steps 3] [--token-limit 1024]
+
+Plays --turns agent turns (a question, an answer and --steps tool steps
+each) into a TokenBudgetMemory backed by a ConversationStore in a temporary
+SQLite file, and reports save_context latency:
+  memory only     no store
+  write-behind    queued, committed by the store's writer thread
+  synchronous     store.flush() after every turn, as a store without the
+                  queue would do
+Then reopens the conversation in a fresh memory, as another process would,
+and reports how long the first load takes and how many messages it keeps
+resident against the full history. Prints one JSON line per mode.
+"""
+import json
+import time
+import argparse
+import tempfile
+
+from langchain_core.agents import AgentAction
+
+from benchmarks.bench_e2e import percentile
+from app.controller.conversations import ConversationStore
+from app.controller.memory import TokenBudgetMemory
+
+
+def play(memory, store, turns, steps, sync):
+    latencies = []
+    for i in range(turns):
+        intermediate_steps = [
+            (AgentAction("Write File", {"filepath": f"site/page{i}_{j}.html"}, f"Thought: write page {i}"),
+             f"File 'site/page{i}_{j}.html' written successfully.")
+            for j in range(steps)
+        ]
+        start = time.perf_counter()
+        memory.save_context(
+            {"input": f"Add a section {i} about pricing with a table of three plans and a signup button"},
+            {"output": f"Section {i} was added to site/page{i}_0.html with the pricing table and button.",
+             "intermediate_steps": intermediate_steps},
+        )
+        if sync:
+            store.flush()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--steps", type=int, default=3)
+    parser.add_argument("--token-limit", type=int, default=1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ConversationStore(url=f"sqlite:///{tmp}/conversations.sqlite3")
+        for mode in ("memory only", "write-behind", "synchronous"):
+            conversation_id = mode.replace(" ", "-")
+            memory = TokenBudgetMemory(
+                store=None if mode == "memory only" else store, conversation_id=conversation_id,
+                max_token_limit=args.token_limit, input_key="input", output_key="output",
+            )
+            latencies = play(memory, store, args.turns, args.steps, mode == "synchronous")
+            result = {
+                "benchmark": "conversations",
+                "mode": mode,
+                "turns": args.turns,
+                "save_p50_ms": round(percentile(latencies, 0.5), 3),
+                "save_p99_ms": round(percentile(latencies, 0.99), 3),
+            }
+            if mode != "memory only":
+                store.flush()
+                reopened = TokenBudgetMemory(
+                    store=store, conversation_id=conversation_id, max_token_limit=args.token_limit,
+                )
+                start = time.perf_counter()
+                reopened.load_memory_variables({})
+                result["reopen_ms"] = round((time.perf_counter() - start) * 1000, 3)
+                result["resident_messages"] = len(reopened.chat_memory.messages)
+                result["stored_messages"] = store.history(conversation_id, limit=1)["message_count"]
+            print(json.dumps(result))
+        print(json.dumps({"benchmark": "conversations", "store": store.stats()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Measure document ingestion throughput and Query Documents latency.
+
+Usage: python -m benchmarks.bench_documents [--pdfs 20] [--pages 20] [--docx 10] [--queries 200]
+                                            [--workers 0,1,4]
+
+Writes a local corpus into a temporary projects directory: --pdfs PDF
+files of --pages pages each, --docx Word files and as many Markdown notes,
+all filled with generated prose. For each worker count it ingests the
+corpus from a cold chunk cache (pages/sec), then again with the cache warm
+(as after a restart), and runs --queries random queries. Prints one JSON
+line per worker count.
+"""
+import os
+import json
+import time
+import random
+import zipfile
+import argparse
+import tempfile
+
+from benchmarks.bench_e2e import percentile
+from app.tools import documents
+from app.tools.file_index import FileIndex
+
+WORDS = (
+    "brand palette typography contrast accessibility navigation layout grid spacing button form input "
+    "checkout pricing subscription invoice customer onboarding analytics dashboard report chart latency "
+    "cache server deployment container region backup retention privacy consent cookie banner footer "
+    "header hero testimonial gallery carousel modal tooltip animation responsive mobile tablet desktop"
+).split()
+
+
+def sentence(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 18))).capitalize() + "."
+
+
+def paragraph(rng):
+    return " ".join(sentence(rng) for _ in range(rng.randint(3, 6)))
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """A plain PDF with one text line per entry of each page's lines; enough for pypdf to extract."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        stream = "BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_docx(path, paragraphs):
+    body = "".join(f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>" for text in paragraphs)
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("[Content_Types].xml", '<?xml version="1.0"?><Types/>')
+        archive.writestr(
+            "word/document.xml",
+            '<?xml version="1.0"?><w:document xmlns:w="http://schemas.openxmlformats.org/'
+            f'wordprocessingml/2006/main"><w:body>{body}</w:body></w:document>',
+        )
+
+
+def make_corpus(root, pdfs, pages, docx, seed=0):
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(root, "reference"))
+    for i in range(pdfs):
+        # About 45 lines of 90 characters per page
+        write_pdf(os.path.join(root, "reference", f"guide{i}.pdf"), [
+            [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(45)] for _ in range(pages)
+        ])
+    for i in range(docx):
+        write_docx(os.path.join(root, "reference", f"brief{i}.docx"), [paragraph(rng) for _ in range(40)])
+        with open(os.path.join(root, "reference", f"notes{i}.md"), "w") as f:
+            f.write("\n\n".join(f"## {sentence(rng)}\n\n{paragraph(rng)}" for _ in range(20)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdfs", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--docx", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--workers", default="0,1,4")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        projects_dir = os.path.join(tmp, "Projects")
+        make_corpus(projects_dir, args.pdfs, args.pages, args.docx)
+        rng = random.Random(1)
+        queries = [" ".join(rng.sample(WORDS, 3)) for _ in range(args.queries)]
+        for workers in [int(n) for n in args.workers.split(",")]:
+            file_index = FileIndex(projects_dir)
+            file_index.build()
+            pool = documents.DocumentWorkerPool(workers)
+            if workers:
+                # Start the interpreters before timing, as a running server would have
+                pool.parse_many([(os.path.join(projects_dir, "reference", "notes0.md"), "text/markdown")] * workers)
+            cache = documents.ChunkCache(os.path.join(tmp, f"cache{workers}"))
+
+            start = time.perf_counter()
+            index = documents.DocumentIndex(file_index, pool=pool, cache=cache)
+            index.sync()
+            cold = time.perf_counter() - start
+            stats = index.stats()
+
+            start = time.perf_counter()
+            warm_index = documents.DocumentIndex(file_index, pool=pool, cache=cache)
+            warm_index.sync()
+            warm = time.perf_counter() - start
+
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                index.query(query)
+                latencies.append((time.perf_counter() - start) * 1000)
+            pool.stop()
+            print(json.dumps({
+                "benchmark": "documents",
+                "workers": workers,
+                "documents": stats["documents"],
+                "pages": stats["pages"],
+                "chunks": stats["chunks"],
+                "errors": stats["errors"],
+                "cold_ingest_s": round(cold, 3),
+                "pages_per_sec": round(stats["pages"] / cold, 1),
+                "warm_ingest_s": round(warm, 3),
+                "warm_pages_per_sec": round(stats["pages"] / warm, 1),
+                "query_p50_ms": round(percentile(latencies, 0.5), 3),
+                "query_p99_ms": round(percentile(latencies, 0.99), 3),
+            }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+End-to-end benchmark of the Flask-SocketIO app against a scripted model server.
+
+Usage: python -m benchmarks.bench_e2e [--clients 8] [--requests 3] [--ttft 0.2] [--tokens-per-sec 80]
+                                      [--script transcript.json] [--files 200] [--output results.jsonl]
+
+A stub OpenAI-compatible server replays a ReAct transcript (by default: list
+the site, read its page, answer). The real app from app.py is served on a
+free port with the stub as its only model backend and a synthetic
+PROJECTS_DIR, and N Socket.IO clients each send their requests one after
+another. The result is one JSON line with throughput, latency and
+time-to-first-token percentiles, emits/sec and memory per session; with
+--output it is also appended to a file so runs can be compared.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import importlib.util
+
+import socketio
+
+from benchmarks.stub_openai_server import StubServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SCRIPT = [
+    "Thought: I should see what the site contains.\nAction: List Files\nAction Input: path=site",
+    "Thought: The page is in site/index.html, let me read it.\nAction: Read File\nAction Input: filepath=site/index.html",
+    "Thought: I have what I need.\nFinal Answer: The page has a header, a hero section, a feature list and a footer.",
+]
+PROMPT = "Read site/index.html and summarize the page"
+
+
+def make_project(root, n_files):
+    def write(path, text):
+        os.makedirs(os.path.join(root, os.path.dirname(path)), exist_ok=True)
+        with open(os.path.join(root, path), "w") as f:
+            f.write(text)
+
+    features = "\n".join(f"      <li>Feature {i}</li>" for i in range(40))
+    write("site/index.html", "<!doctype html>\n<html>\n  <head><title>Landing</title></head>\n  <body>\n"
+                             "    <header><h1>Product</h1></header>\n    <section id=\"hero\">Hero</section>\n"
+                             f"    <ul>\n{features}\n    </ul>\n    <footer>Footer</footer>\n  </body>\n</html>\n")
+    write("site/style.css", "body { margin: 0; }\n")
+    for i in range(n_files):
+        write(f"site/assets/file_{i:04d}.txt", f"asset {i}\n")
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def start_app(projects_dir, backend_url):
+    """Import app.py with the stub as its model backend and serve it on a thread."""
+    os.environ["LLM_BACKENDS"] = backend_url
+    os.environ.setdefault("LLM_HEALTH_INTERVAL", "0")
+    os.environ.setdefault("AGENT_JOB_WORKERS", "0")
+    from app.tools import file_tools, web_tool
+    file_tools.PROJECTS_DIR = projects_dir
+    web_tool.PROJECTS_DIR = projects_dir
+
+    # One access log line per polling request would drown the result
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    spec = importlib.util.spec_from_file_location("app_server", os.path.join(ROOT, "app.py"))
+    server = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(server)
+    port = free_port()
+    threading.Thread(
+        target=server.socketio.run,
+        args=(server.app,),
+        kwargs={"host": "127.0.0.1", "port": port, "allow_unsafe_werkzeug": True, "log_output": False},
+        daemon=True,
+    ).start()
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+class Client:
+    """One simulated user: sends its requests in turn and times the events coming back."""
+
+    def __init__(self, url, n_requests, timeout):
+        self.url = url
+        self.n_requests = n_requests
+        self.timeout = timeout
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on("agent_update", self.on_update)
+        self.done = threading.Event()
+        self.sent_at = None
+        self.first_token_at = None
+        self.events = 0
+        self.latencies = []
+        self.ttfts = []
+        self.errors = []
+
+    def on_update(self, payload):
+        self.events += 1
+        kind = payload.get("type")
+        if kind in ("token", "tokens") and self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        elif kind in ("final", "error"):
+            if kind == "error":
+                self.errors.append(payload["data"].get("error"))
+            self.done.set()
+
+    def connect(self):
+        self.sio.connect(self.url, wait_timeout=10)
+
+    def run(self):
+        for _ in range(self.n_requests):
+            self.done.clear()
+            self.first_token_at = None
+            self.sent_at = time.perf_counter()
+            self.sio.emit("user_input", {"input": PROMPT})
+            if not self.done.wait(self.timeout):
+                self.errors.append("timeout")
+                continue
+            finished = time.perf_counter()
+            self.latencies.append(finished - self.sent_at)
+            if self.first_token_at is not None:
+                self.ttfts.append(self.first_token_at - self.sent_at)
+
+
+def bench(args, script):
+    with tempfile.TemporaryDirectory() as projects_dir:
+        make_project(projects_dir, args.files)
+        stub = StubServer(ttft=args.ttft, tokens_per_sec=args.tokens_per_sec, script=script)
+        backend_url = stub.start()
+        os.environ.setdefault("LLM_BACKEND_MAX_CONCURRENCY", str(max(args.clients, 4)))
+        server, url = start_app(projects_dir, backend_url)
+
+        clients = [Client(url, args.requests, args.timeout) for _ in range(args.clients)]
+        rss_before = rss_bytes()
+        for client in clients:
+            client.connect()
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client.run) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+        # Sessions are still open here, so this is what they hold on to
+        rss_after = rss_bytes()
+        for client in clients:
+            client.sio.disconnect()
+        stub.stop()
+
+    latencies = [latency for client in clients for latency in client.latencies]
+    ttfts = [ttft for client in clients for ttft in client.ttfts]
+    errors = [error for client in clients for error in client.errors]
+    events = sum(client.events for client in clients)
+
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        "benchmark": "e2e",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "clients": args.clients, "requests_per_client": args.requests, "ttft": args.ttft,
+            "tokens_per_sec": args.tokens_per_sec, "script_steps": len(script), "files": args.files,
+            "agent_max_concurrency": server.session_manager.get().pool._max_workers,
+        },
+        "requests": len(latencies),
+        "errors": len(errors),
+        "wall_s": round(wall, 2),
+        "requests_per_sec": round(len(latencies) / wall, 2),
+        "latency_ms": {"p50": ms(percentile(latencies, 0.5)), "p95": ms(percentile(latencies, 0.95)),
+                       "p99": ms(percentile(latencies, 0.99))},
+        "ttft_ms": {"p50": ms(percentile(ttfts, 0.5)), "p95": ms(percentile(ttfts, 0.95)),
+                    "p99": ms(percentile(ttfts, 0.99))},
+        "emits_per_sec": round(events / wall, 1),
+        "model_requests": stub.requests,
+        "memory_per_session_kb": round((rss_after - rss_before) / args.clients / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=3, help="requests per client, sent one after another")
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tokens-per-sec", type=float, default=80)
+    parser.add_argument("--script", help="JSON file with the replies of a ReAct transcript")
+    parser.add_argument("--files", type=int, default=200, help="extra files in the synthetic project")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for one reply")
+    parser.add_argument("--output", help="append the result line to this file")
+    args = parser.parse_args()
+
+    script = DEFAULT_SCRIPT
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+
+    result = bench(args, script)
+    line = json.dumps(result)
+    print(line)
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(line + "\n")
+    sys.stdout.flush()
+    # The server and command worker threads are not meant to be stopped
+    os._exit(1 if result["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
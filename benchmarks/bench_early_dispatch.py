@@ -0,0 +1,175 @@
+"""
+Measure completion tokens and step latency saved by cutting replies at the action.
+
+Usage: python -m benchmarks.bench_early_dispatch [--tokens-per-sec 40] [--tool-latency 0.3]
+
+A scripted streaming model answers every step with one action and then,
+like small local models often do, keeps going: it invents what the tool
+returned and writes the next steps itself, without the "\\nObservation:" the
+stop sequence would catch. Its tokens are counted as they are produced, so
+a reply that is cut off early costs only what was generated before the cut.
+
+Four runs:
+  baseline          the reply is read to the end, then parsed
+  early dispatch    EarlyDispatchChatModel cuts it after the Action Input
+  multi-action      one reply with three searches, no speculation
+  multi + speculate the same, starting each search as soon as its action is complete
+A last line checks that a Write File input whose content has lines starting
+with "Thoughtful", "Observations" or "Final Answers" is not cut short.
+"""
+import os
+import re
+import json
+import time
+import argparse
+import tempfile
+from typing import Any, List
+
+from langchain.agents import ZeroShotAgent
+from langchain_core.language_models.chat_models import BaseChatModel, generate_from_stream
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+
+from app.controller import agent as agent_module
+from app.controller import parallel
+from app.controller.early_dispatch import ActionStreamParser, EarlyDispatchChatModel, action_key
+from app.controller.parallel import ParallelAgentExecutor
+from app.controller.parsing import MultiActionOutputParser
+from app.tools import file_tools
+from app.tools.kernel import tools
+from app.tools.web_tool import LocalSearchBackend, set_search_backend
+
+_PIECE = re.compile(r"\s*\S+|\s+")
+
+FILES = ["site/index.html", "site/style.css", "site/script.js", "site/about.html"]
+# What the model makes up after each action
+HALLUCINATION = (
+    "\nThought: The file defines the page layout with a header, a hero section and a footer, "
+    "and the styles set a dark background with large white headings across the page."
+    "\nAction: Read File\nAction Input: filepath=site/missing.css"
+    "\nThought: That stylesheet also sets the font sizes, so the page should render as expected on "
+    "mobile and desktop. I will check the script next to be sure nothing else overrides it."
+    "\nAction: Read File\nAction Input: filepath=site/missing.js"
+)
+FINAL = "Thought: I have everything I need.\nFinal Answer: The page, its styles and scripts are reviewed."
+# Content lines that start like ReAct keywords but aren't
+NOTES = (
+    "# Notes\nThoughtful design matters on every page.\nObservations from the user interviews:\n"
+    "- the pricing table is hard to read\nFinal Answers to the FAQ go at the bottom."
+)
+SEARCHES = ["landing page hero layout", "css reset best practices", "accessible navigation menus"]
+
+
+class StreamingScriptedModel(BaseChatModel):
+    """Streams a fixed script at `tokens_per_sec`, honouring stop sequences, and counts every token produced."""
+
+    responses: List[str]
+    tokens_per_sec: float = 40.0
+    calls: int = 0
+    generated: int = 0
+
+    @property
+    def _llm_type(self):
+        return "streaming-scripted"
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        text = self.responses[self.calls % len(self.responses)]
+        self.calls += 1
+        for sequence in stop or []:
+            if sequence in text:
+                text = text[:text.index(sequence)]
+        for piece in _PIECE.findall(text):
+            time.sleep(1.0 / self.tokens_per_sec)
+            self.generated += 1
+            if run_manager:
+                run_manager.on_llm_new_token(piece)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        return generate_from_stream(self._stream(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+
+def run(label, script, tokens_per_sec, early, multi_action=False, speculate=False):
+    model = StreamingScriptedModel(responses=script, tokens_per_sec=tokens_per_sec)
+    llm = EarlyDispatchChatModel(llm=model, multi_action=multi_action) if early else model
+    agent = ZeroShotAgent.from_llm_and_tools(
+        llm=llm,
+        tools=tools,
+        prefix=agent_module.SYSTEM_PROMPT,
+        format_instructions=agent_module.FORMAT_INSTRUCTIONS,
+        output_parser=MultiActionOutputParser() if multi_action else None,
+        input_variables=["input", "agent_scratchpad"],
+    )
+    executor = ParallelAgentExecutor.from_agent_and_tools(agent=agent, tools=tools, max_iterations=10)
+    parallel.SPECULATIVE_TOOLS = speculate
+    start = time.perf_counter()
+    result = executor.invoke({"input": "Review the site"})
+    wall = time.perf_counter() - start
+    return {
+        "mode": label,
+        "completion_tokens": model.generated,
+        "model_calls": model.calls,
+        "wall_s": round(wall, 2),
+        "per_step_s": round(wall / model.calls, 3),
+        "answer_ok": "reviewed" in result["output"],
+    }
+
+
+def check_multiline_input():
+    """Stream a Write File action with NOTES as its content and check the whole content is kept."""
+    action_input = f"filepath=notes.md, content='{NOTES}'"
+    reply = f"Thought: Save the notes.\nAction: Write File\nAction Input: {action_input}{HALLUCINATION}"
+    parser = ActionStreamParser()
+    for piece in _PIECE.findall(reply):
+        if parser.feed(piece) is not None:
+            break
+    return {
+        "mode": "multiline input",
+        "input_ok": parser.actions == [action_key("Write File", action_input)],
+        "cut_reason": parser.reason,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens-per-sec", type=float, default=40)
+    parser.add_argument("--tool-latency", type=float, default=0.3, help="seconds per web search")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as projects_dir:
+        for path in FILES:
+            os.makedirs(os.path.join(projects_dir, os.path.dirname(path)), exist_ok=True)
+            with open(os.path.join(projects_dir, path), "w") as f:
+                f.write(f"<!-- {path} -->\n")
+        file_tools.PROJECTS_DIR = projects_dir
+        set_search_backend(LocalSearchBackend(latency=args.tool_latency))
+
+        single = [
+            f"Thought: I need to look at {path}.\nAction: Read File\nAction Input: filepath={path}{HALLUCINATION}"
+            for path in FILES
+        ] + [FINAL]
+        actions = "\n".join(f"Action: Search Online\nAction Input: query='{query}'" for query in SEARCHES)
+        multi = [
+            f"Thought: These searches are independent, run them together.\n{actions}"
+            f"\nObservation : the searches found three useful articles.{HALLUCINATION}",
+            FINAL,
+        ]
+
+        results = [
+            run("baseline", single, args.tokens_per_sec, early=False),
+            run("early dispatch", single, args.tokens_per_sec, early=True),
+            run("multi-action", multi, args.tokens_per_sec, early=True, multi_action=True),
+            run("multi-action + speculation", multi, args.tokens_per_sec, early=True, multi_action=True,
+                speculate=True),
+        ]
+        baseline = results[0]
+        results[1]["tokens_saved"] = round(1 - results[1]["completion_tokens"] / baseline["completion_tokens"], 3)
+        results[1]["per_step_saved_s"] = round(baseline["per_step_s"] - results[1]["per_step_s"], 3)
+        results[3]["wall_saved_s"] = round(results[2]["wall_s"] - results[3]["wall_s"], 2)
+        for result in results:
+            print(json.dumps(result))
+        print(json.dumps(check_multiline_input()))
+
+
+if __name__ == "__main__":
+    main()
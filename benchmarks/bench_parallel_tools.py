@@ -0,0 +1,149 @@
+"""
+Measure how multi-action steps cut the wall-clock time of a tool-heavy task.
+
+Usage: python -m benchmarks.bench_parallel_tools [--llm-latency 0.5] [--tool-latency 0.3] [--repeat 3]
+
+A scripted model asks to read three files and run two web searches, either
+one action per reply (the classic ReAct loop) or all five in one reply.
+The multi-action reply is run with a plain AgentExecutor, which performs
+the actions one after another, and with ParallelAgentExecutor. Every model
+call costs --llm-latency seconds and every search --tool-latency seconds.
+A last line checks that a JSON action whose input is a bare string, such as
+{"action": "read_file", "action_input": "site/index.html"}, runs the tool
+instead of failing schema validation.
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+from typing import Any, List
+
+from langchain.agents import AgentExecutor, ZeroShotAgent
+from langchain_core.language_models.chat_models import SimpleChatModel
+
+from app.controller import agent as agent_module
+from app.controller.parallel import ParallelAgentExecutor
+from app.controller.parsing import MultiActionOutputParser, StructuredActionOutputParser
+from app.tools import file_tools
+from app.tools.kernel import tools, structured_tools
+from app.tools.web_tool import LocalSearchBackend, set_search_backend
+
+FILES = {
+    "site/index.html": "<html><body><h1>Landing</h1></body></html>\n",
+    "site/style.css": "body { margin: 0; }\n",
+    "site/script.js": "console.log('ready');\n",
+}
+
+ACTIONS = [
+    ("Read File", "filepath=site/index.html"),
+    ("Read File", "filepath=site/style.css"),
+    ("Read File", "filepath=site/script.js"),
+    ("Search Online", "query='landing page hero layout'"),
+    ("Search Online", "query='css reset best practices'"),
+]
+
+FINAL = "Thought: I have everything I need.\nFinal Answer: The page, its styles and script are reviewed."
+
+
+class ScriptedChatModel(SimpleChatModel):
+    """Replies with a fixed script, taking `latency` seconds per call like a real model round trip."""
+
+    responses: List[str]
+    latency: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        time.sleep(self.latency)
+        response = self.responses[self.calls % len(self.responses)]
+        self.calls += 1
+        return response
+
+
+def single_action_script():
+    return [
+        f"Thought: I need to check this next.\nAction: {tool}\nAction Input: {tool_input}"
+        for tool, tool_input in ACTIONS
+    ] + [FINAL]
+
+
+def multi_action_script():
+    actions = "\n".join(f"Action: {tool}\nAction Input: {tool_input}" for tool, tool_input in ACTIONS)
+    return [f"Thought: These steps are independent, run them together.\n{actions}", FINAL]
+
+
+def run(label, script, executor_cls, llm_latency, repeat):
+    llm = ScriptedChatModel(responses=script, latency=llm_latency)
+    agent = ZeroShotAgent.from_llm_and_tools(
+        llm=llm,
+        tools=tools,
+        prefix=agent_module.SYSTEM_PROMPT,
+        format_instructions=agent_module.FORMAT_INSTRUCTIONS + agent_module.MULTI_ACTION_INSTRUCTIONS,
+        output_parser=MultiActionOutputParser(),
+        input_variables=["input", "agent_scratchpad"],
+    )
+    executor = executor_cls.from_agent_and_tools(
+        agent=agent, tools=tools, max_iterations=10, return_intermediate_steps=True
+    )
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = executor.invoke({"input": "Review site/ and research the layout"})
+        timings.append(time.perf_counter() - start)
+    return {
+        "mode": label,
+        "llm_calls_per_task": llm.calls // repeat,
+        "tool_calls_per_task": len(result["intermediate_steps"]),
+        "wall_s": round(min(timings), 3),
+    }
+
+
+def check_bare_string_input():
+    """Parse JSON actions with bare string inputs and run them on the structured tools."""
+    by_name = {tool.name: tool for tool in structured_tools}
+    parser = StructuredActionOutputParser(tool_names=list(by_name))
+    observations = []
+    for path in FILES:
+        action = parser.parse(json.dumps({"action": "read_file", "action_input": path}))
+        observations.append(by_name[action.tool].run(action.tool_input))
+    return {
+        "mode": "json bare string input",
+        "input_ok": observations == list(FILES.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--tool-latency", type=float, default=0.3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as projects_dir:
+        for path, content in FILES.items():
+            os.makedirs(os.path.join(projects_dir, os.path.dirname(path)), exist_ok=True)
+            with open(os.path.join(projects_dir, path), "w") as f:
+                f.write(content)
+        file_tools.PROJECTS_DIR = projects_dir
+        # ttl=0 so every search pays the backend latency
+        set_search_backend(LocalSearchBackend(latency=args.tool_latency), ttl=0)
+
+        baseline = None
+        for label, script, executor_cls in (
+            ("one action per step", single_action_script(), ParallelAgentExecutor),
+            ("multi-action, serial", multi_action_script(), AgentExecutor),
+            ("multi-action, parallel", multi_action_script(), ParallelAgentExecutor),
+        ):
+            result = run(label, script, executor_cls, args.llm_latency, args.repeat)
+            baseline = baseline or result["wall_s"]
+            result["speedup"] = round(baseline / result["wall_s"], 2)
+            print(json.dumps(result))
+        print(json.dumps(check_bare_string_input()))
+
+
+if __name__ == "__main__":
+    main()
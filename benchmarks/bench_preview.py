@@ -0,0 +1,117 @@
+"""
+Measure what reloading a previewed page costs after the agent edits one file.
+
+Usage: python -m benchmarks.bench_preview [--assets 30] [--asset-size 20000] [--iterations 20]
+
+Writes a page with --assets stylesheets and scripts into a temporary
+projects directory and loads it through the /preview/ route of app.py (in
+process, via Flask's test client), the way a browser with a warm cache
+does: every asset is revalidated with If-None-Match. Between loads one
+asset is rewritten with Write File. Prints one JSON line with the bytes
+sent on the first load and per reload, the share of 304s and request
+latency for cached and uncached responses.
+"""
+import os
+import json
+import time
+import random
+import argparse
+import statistics
+import tempfile
+import importlib.util
+
+from benchmarks.bench_e2e import ROOT, percentile
+from app.tools import file_tools
+
+
+def make_site(root, assets, size, seed=0):
+    rng = random.Random(seed)
+    words = "header footer navbar button grid flex card hero banner gallery pricing contact".split()
+    names = [f"assets/style{i}.css" if i % 2 else f"assets/script{i}.js" for i in range(assets)]
+    for name in names:
+        os.makedirs(os.path.join(root, "site", os.path.dirname(name)), exist_ok=True)
+        with open(os.path.join(root, "site", name), "w") as f:
+            f.write(" ".join(rng.choice(words) for _ in range(size // 6)))
+    links = "\n".join(
+        f'<link rel="stylesheet" href="{name}">' if name.endswith(".css") else f'<script src="{name}"></script>'
+        for name in names
+    )
+    with open(os.path.join(root, "site", "index.html"), "w") as f:
+        f.write(f"<html><head>{links}</head><body><h1>Preview</h1></body></html>\n")
+    return ["index.html"] + names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=30)
+    parser.add_argument("--asset-size", type=int, default=20000)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AGENT_LAZY_START", "1")
+    os.environ.setdefault("AGENT_JOB_WORKERS", "0")
+    with tempfile.TemporaryDirectory() as tmp:
+        projects_dir = os.path.join(os.path.realpath(tmp), "Projects")
+        os.makedirs(projects_dir)
+        os.environ.setdefault("AGENT_JOBS_DB", f"sqlite:///{tmp}/jobs.sqlite3")
+        file_tools.PROJECTS_DIR = projects_dir
+        files = make_site(projects_dir, args.assets, args.asset_size)
+        spec = importlib.util.spec_from_file_location("app_server", os.path.join(ROOT, "app.py"))
+        server = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(server)
+        client = server.app.test_client()
+
+        etags = {}
+        raw_bytes = sum(os.path.getsize(os.path.join(projects_dir, "site", name)) for name in files)
+
+        def load():
+            sent, not_modified, cold, warm = 0, 0, [], []
+            for name in files:
+                headers = {"Accept-Encoding": "gzip, br"}
+                if name in etags:
+                    headers["If-None-Match"] = etags[name]
+                start = time.perf_counter()
+                response = client.get(f"/preview/site/{name}", headers=headers)
+                body = response.get_data()
+                elapsed = (time.perf_counter() - start) * 1000
+                sent += len(body)
+                if response.status_code == 304:
+                    not_modified += 1
+                    warm.append(elapsed)
+                else:
+                    etags[name] = response.headers["ETag"]
+                    cold.append(elapsed)
+            return sent, not_modified, cold, warm
+
+        first_sent, _, first_latencies, _ = load()
+        rng = random.Random(1)
+        reload_sent, reload_304, changed_latencies, revalidate_latencies = [], 0, [], []
+        for i in range(args.iterations):
+            name = rng.choice(files[1:])
+            file_tools.write_file(filepath=f"site/{name}", content=f"/* edit {i} */ body {{ margin: {i}px; }}", raw=True)
+            sent, not_modified, cold, warm = load()
+            reload_sent.append(sent)
+            reload_304 += not_modified
+            changed_latencies += cold
+            revalidate_latencies += warm
+        # A second pass over unchanged files reuses the compressed variants
+        etags.clear()
+        _, _, cached_latencies, _ = load()
+
+        print(json.dumps({
+            "benchmark": "preview",
+            "files": len(files),
+            "raw_bytes": raw_bytes,
+            "first_load_bytes": first_sent,
+            "reload_bytes_avg": round(statistics.mean(reload_sent)),
+            "reload_304_ratio": round(reload_304 / (args.iterations * len(files)), 3),
+            "first_load_p50_ms": round(percentile(first_latencies, 0.5), 3),
+            "cached_variant_p50_ms": round(percentile(cached_latencies, 0.5), 3),
+            "revalidate_p50_ms": round(percentile(revalidate_latencies, 0.5), 3),
+            "changed_p50_ms": round(percentile(changed_latencies, 0.5), 3),
+            "cache": server.preview_cache.stats(),
+        }))
+
+
+if __name__ == "__main__":
+    main()
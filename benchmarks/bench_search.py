@@ -0,0 +1,69 @@
+"""
+Measure the search cache and in-flight deduplication against a local backend.
+
+Usage: python -m benchmarks.bench_search [--clients 32] [--requests 20] [--queries 10] [--latency 0.3]
+
+Each simulated client issues --requests searches drawn from a pool of
+--queries distinct queries. This matches multi-user sessions, where the same
+query comes up many times.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.tools.web_tool import LocalSearchBackend, SearchService
+
+
+def run_client(service, queries, n_requests, seed):
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(n_requests):
+        query = rng.choice(queries)
+        # Vary case and spacing, which normalization should fold together
+        if rng.random() < 0.5:
+            query = "  " + query.upper()
+        start = time.perf_counter()
+        service.search(query)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench(clients, n_requests, n_queries, latency, cached):
+    backend = LocalSearchBackend(latency=latency)
+    service = SearchService(backend, ttl=3600 if cached else 0, workers=clients)
+    queries = [f"how to build a landing page part {i}" for i in range(n_queries)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda i: run_client(service, queries, n_requests, i), range(clients)))
+    wall = time.perf_counter() - start
+    latencies = sorted(l for client in results for l in client)
+
+    return {
+        'mode': 'cached' if cached else 'dedup-only',
+        'searches': len(latencies),
+        'backend_calls': backend.calls,
+        'searches_per_sec': round(len(latencies) / wall, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+        **service.stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.3)
+    args = parser.parse_args()
+
+    for cached in (False, True):
+        print(json.dumps(bench(args.clients, args.requests, args.queries, args.latency, cached)))
+
+
+if __name__ == '__main__':
+    main()
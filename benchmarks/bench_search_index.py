@@ -0,0 +1,118 @@
+"""
+Build and query the full-text index over a synthetic project tree.
+
+Usage: python -m benchmarks.bench_search_index [--files 10000] [--queries 200]
+
+Generates --files small HTML/CSS/JS files across nested directories in a
+temporary directory, then reports index build time, exact and fuzzy query
+latency, the cost of reindexing a single edited file and of a forced
+refresh, and checks that a file overwritten in place (as by `cp b.html
+a.html`, which leaves the directory's mtime alone) is picked up.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from app.tools.file_index import FileIndex
+from app.tools.search_index import TextSearchIndex
+
+WORDS = (
+    "header footer navbar button container grid flex column row card modal hero "
+    "banner gallery carousel pricing feature testimonial contact form input submit "
+    "section article aside layout theme color background border margin padding font"
+).split()
+
+
+def make_tree(root, n_files, seed=0):
+    rng = random.Random(seed)
+    templates = {
+        ".html": "<div class=\"{a}-{b}\">\n  <h1>{c} {d}</h1>\n  <p>{e} {f} {a}</p>\n</div>\n",
+        ".css": ".{a}-{b} {{\n  {c}: 1px;\n  {d}-{e}: 0;\n}}\n",
+        ".js": "function {a}{b}() {{\n  return '{c} {d} {e}';\n}}\n",
+    }
+    for i in range(n_files):
+        directory = os.path.join(root, f"project{i % 50}", f"part{i % 7}")
+        os.makedirs(directory, exist_ok=True)
+        ext = rng.choice(list(templates))
+        body = "".join(
+            templates[ext].format(**{k: rng.choice(WORDS) for k in "abcdef"})
+            for _ in range(rng.randint(3, 20))
+        )
+        with open(os.path.join(directory, f"file{i}{ext}"), "w") as f:
+            f.write(body)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def query_latencies(index, queries, fuzzy):
+    latencies = []
+    for query in queries:
+        _, elapsed = timed(index.search, query, fuzzy=fuzzy)
+        latencies.append(elapsed * 1000)
+    latencies.sort()
+    return {
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_search_index_")
+    try:
+        make_tree(root, args.files)
+        rng = random.Random(1)
+
+        file_index = FileIndex(root)
+        search_index = TextSearchIndex(file_index)
+        _, scan_time = timed(file_index.build)
+        _, index_time = timed(search_index.sync)
+
+        exact = [" ".join(rng.sample(WORDS, 2)) for _ in range(args.queries)]
+        # Drop a letter to exercise fuzzy matching
+        typos = [" ".join(w[:-1] for w in rng.sample(WORDS, 2)) for _ in range(args.queries)]
+
+        edited = os.path.join(root, "project0", "part0", "file0.html")
+        with open(edited, "a") as f:
+            f.write("<p>freshly added landing copy</p>\n")
+        file_index.notify_write(edited)
+        _, reindex_time = timed(search_index.sync)
+
+        overwritten = os.path.join(root, "project1", "part1", "file1.css")
+        with open(overwritten, "w") as f:
+            f.write(".overwritten-in-place { color: red; }\n")
+        _, refresh_time = timed(file_index.refresh, force=True)
+        search_index.sync()
+        overwrite_ok = (file_index.get(overwritten)[0] == os.path.getsize(overwritten)
+                        and any(hit[0] == "project1/part1/file1.css" for hit in search_index.search("overwritten")))
+
+        print(json.dumps({
+            'files': args.files,
+            'tokens': len(search_index.postings),
+            'scan_s': round(scan_time, 3),
+            'index_build_s': round(index_time, 3),
+            'reindex_one_file_ms': round(reindex_time * 1000, 3),
+            'forced_refresh_ms': round(refresh_time * 1000, 3),
+            'overwrite_detected': overwrite_ok,
+            'exact_query': query_latencies(search_index, exact, fuzzy=False),
+            'fuzzy_query': query_latencies(search_index, typos, fuzzy=True),
+        }))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
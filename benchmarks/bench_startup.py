@@ -0,0 +1,118 @@
+"""
+Measure cold start of the Flask-SocketIO app: eager, lazy and lazy with warm-up.
+
+Usage: python -m benchmarks.bench_startup [--runs 3] [--request-delay 3] [--ttft 0.2]
+
+Every run starts app.py in a fresh process against a scripted stub model
+server and records:
+  import_s          time to import app.py inside the process
+  listen_s          process start until the port accepts connections
+  first_request_s   time to answer the first request, sent --request-delay
+                    seconds after the port opened
+  first_response_s  process start until that answer arrived
+Prints one JSON line per mode with the median of --runs runs.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import importlib.util
+import tempfile
+import logging
+
+from benchmarks.bench_e2e import DEFAULT_SCRIPT, ROOT, Client, free_port, make_project
+from benchmarks.stub_openai_server import StubServer
+
+MODES = {
+    "eager": {},
+    "lazy": {"AGENT_LAZY_START": "1"},
+    "lazy+warmup": {"AGENT_LAZY_START": "1", "AGENT_WARMUP": "1"},
+}
+
+
+def serve(port, projects_dir):
+    """Child process: import app.py, report how long that took, then serve it."""
+    start = time.perf_counter()
+    from app.tools import file_tools, web_tool
+    file_tools.PROJECTS_DIR = projects_dir
+    web_tool.PROJECTS_DIR = projects_dir
+    spec = importlib.util.spec_from_file_location("app_server", os.path.join(ROOT, "app.py"))
+    server = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(server)
+    print(json.dumps({"import_s": round(time.perf_counter() - start, 3)}), flush=True)
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    if server.WARMUP:
+        server.socketio.start_background_task(server.warm_up_when_listening, "127.0.0.1", port)
+    server.socketio.run(server.app, host="127.0.0.1", port=port, allow_unsafe_werkzeug=True, log_output=False)
+
+
+def run_once(mode, backend_url, projects_dir, request_delay):
+    from app.controller.startup import wait_for_port
+
+    port = free_port()
+    env = dict(os.environ, LLM_BACKENDS=backend_url, LLM_HEALTH_INTERVAL="0", AGENT_JOB_WORKERS="0",
+               PYTHONPATH=ROOT, **MODES[mode])
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--serve", str(port), "--projects", projects_dir],
+        env=env, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    try:
+        import_s = json.loads(process.stdout.readline())["import_s"]
+        if not wait_for_port("127.0.0.1", port, timeout=60):
+            raise RuntimeError(f"{mode}: server did not start")
+        listen_s = time.perf_counter() - started
+        time.sleep(request_delay)
+        client = Client(f"http://127.0.0.1:{port}", 1, timeout=60)
+        client.connect()
+        client.run()
+        client.sio.disconnect()
+        if client.errors or not client.latencies:
+            raise RuntimeError(f"{mode}: {client.errors}")
+        return {
+            "import_s": import_s,
+            "listen_s": listen_s,
+            "first_request_s": client.latencies[0],
+            "first_response_s": time.perf_counter() - started,
+        }
+    finally:
+        process.kill()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--request-delay", type=float, default=3.0)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--projects", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.projects)
+        return
+
+    stub = StubServer(ttft=args.ttft, tokens_per_sec=0, script=DEFAULT_SCRIPT)
+    backend_url = stub.start()
+    with tempfile.TemporaryDirectory() as projects_dir:
+        make_project(projects_dir, 50)
+        for mode in args.modes.split(","):
+            runs = [run_once(mode, backend_url, projects_dir, args.request_delay) for _ in range(args.runs)]
+            print(json.dumps({
+                "benchmark": "startup",
+                "mode": mode,
+                "runs": args.runs,
+                "request_delay_s": args.request_delay,
+                **{key: round(statistics.median(run[key] for run in runs), 3) for key in runs[0]},
+            }))
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Compare per-token emits with batched TokenStream frames.
+
+Usage: python -m benchmarks.bench_streaming [--tokens 20000] [--rate 2000]
+
+A fake Socket.IO server JSON-encodes every payload, which is the dominant
+per-emit cost in the real server. Tokens are produced at --rate tokens/sec to
+mimic a model generating output.
+"""
+import argparse
+import json
+import time
+
+from app.controller.streaming import StreamHub
+
+
+class FakeSocketIO:
+    def __init__(self):
+        self.emits = 0
+        self.bytes = 0
+
+    def emit(self, event, payload, to=None):
+        self.emits += 1
+        self.bytes += len(json.dumps([event, payload]))
+
+
+def produce(push, n_tokens, rate):
+    interval = 1.0 / rate if rate else 0
+    start = time.perf_counter()
+    for i in range(n_tokens):
+        push(f"tok{i % 97} ")
+        if interval:
+            delay = start + (i + 1) * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def bench_per_token(n_tokens, rate):
+    socketio = FakeSocketIO()
+
+    def push(token):
+        socketio.emit('agent_update', {'type': 'token', 'data': {'token': token}}, to='sid')
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    produce(push, n_tokens, rate)
+    return socketio, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def bench_batched(n_tokens, rate):
+    socketio = FakeSocketIO()
+    hub = StreamHub(socketio)
+    stream = hub.open('sid')
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    produce(stream.push, n_tokens, rate)
+    stream.send({'type': 'final', 'data': {'output': ''}})
+    while stream.frames or stream.tokens or stream.in_flight:
+        time.sleep(0.001)
+    return socketio, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def report(name, socketio, wall, cpu, n_tokens):
+    return {
+        'mode': name,
+        'tokens': n_tokens,
+        'emits': socketio.emits,
+        'emits_per_sec': round(socketio.emits / wall, 1),
+        'bytes_sent': socketio.bytes,
+        'cpu_us_per_token': round(cpu / n_tokens * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tokens', type=int, default=20000)
+    parser.add_argument('--rate', type=int, default=2000, help='tokens/sec, 0 for unthrottled')
+    args = parser.parse_args()
+
+    results = [
+        report('per-token', *bench_per_token(args.tokens, args.rate), args.tokens),
+        report('batched', *bench_batched(args.tokens, args.rate), args.tokens),
+    ]
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
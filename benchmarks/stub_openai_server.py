@@ -0,0 +1,191 @@
+"""
+OpenAI-compatible stub model server with injectable latency and failures.
+
+Usage: python -m benchmarks.stub_openai_server [--port 1234] [--ttft 0.2] [--tokens-per-sec 50] [--failure-rate 0]
+                                               [--script transcript.json]
+
+Serves /v1/models and /v1/chat/completions (streaming and not). Every reply
+is --reply, sent word by word, or the next turn of a scripted transcript
+(--script, a JSON list of replies). StubServer runs the same thing on a
+background thread, so benchmarks can start several and change their
+behaviour (latency, failure rate, down) while they run.
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+
+from aiohttp import web
+
+# Replies are streamed one word (with its leading whitespace) per chunk
+_PIECE = re.compile(r"\s*\S+|\s+")
+
+DEFAULT_REPLY = "Thought: This can be answered directly.\nFinal Answer: Hello from the stub server."
+
+
+class StubServer:
+    """
+    One stub endpoint.
+
+    Args:
+        port (int): Port to listen on; 0 picks a free one.
+        ttft (float): Seconds before the first token (or the whole reply when not streaming).
+        tokens_per_sec (float): Streaming speed after the first token; 0 sends everything at once.
+        failure_rate (float): Probability that a completion request fails with a 500.
+        reply (str): Text every completion returns.
+        script (list): Replies of a ReAct transcript. A request gets the first
+            reply that does not yet appear in its messages, so each agent run
+            walks through the script once; the last reply is the final answer.
+    """
+
+    def __init__(self, port=0, ttft=0.2, tokens_per_sec=50.0, failure_rate=0.0, reply=DEFAULT_REPLY,
+                 model="stub-model", script=None):
+        self.port = port
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.failure_rate = failure_rate
+        self.reply = reply
+        self.model = model
+        self.script = list(script or [])
+        # When down, every request (including health probes) gets a 503
+        self.down = False
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._loop = None
+        self._runner = None
+        self._started = threading.Event()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get("/v1/models", self.models)
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        return app
+
+    async def models(self, request):
+        if self.down:
+            return web.json_response({"error": {"message": "down"}}, status=503)
+        return web.json_response({"object": "list", "data": [{"id": self.model, "object": "model"}]})
+
+    def pick_reply(self, body):
+        if not self.script:
+            return self.reply
+        conversation = "\n".join(str(message.get("content") or "") for message in body.get("messages", []))
+        step = 0
+        while step < len(self.script) - 1 and self.script[step].strip() in conversation:
+            step += 1
+        return self.script[step]
+
+    @staticmethod
+    def _apply_stop(text, stop):
+        if isinstance(stop, str):
+            stop = [stop]
+        for sequence in stop or []:
+            index = text.find(sequence)
+            if index != -1:
+                text = text[:index]
+        return text
+
+    def _chunk(self, completion_id, delta, finish_reason=None):
+        return {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": self.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    async def chat_completions(self, request):
+        body = await request.json()
+        self.requests += 1
+        if self.down or random.random() < self.failure_rate:
+            self.failures += 1
+            return web.json_response({"error": {"message": "injected failure"}}, status=503 if self.down else 500)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            completion_id = f"chatcmpl-{self.requests}"
+            reply = self._apply_stop(self.pick_reply(body), body.get("stop"))
+            pieces = _PIECE.findall(reply)
+            await asyncio.sleep(self.ttft)
+            if not body.get("stream"):
+                return web.json_response({
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": self.model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": reply},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(pieces), "total_tokens": len(pieces)},
+                })
+
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            await response.write(f"data: {json.dumps(self._chunk(completion_id, {'role': 'assistant', 'content': ''}))}\n\n".encode())
+            delay = 1.0 / self.tokens_per_sec if self.tokens_per_sec else 0
+            for piece in pieces:
+                await response.write(f"data: {json.dumps(self._chunk(completion_id, {'content': piece}))}\n\n".encode())
+                if delay:
+                    await asyncio.sleep(delay)
+            await response.write(f"data: {json.dumps(self._chunk(completion_id, {}, 'stop'))}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+            return response
+        finally:
+            self.in_flight -= 1
+
+    async def _serve(self):
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._started.set()
+
+    def start(self):
+        """Serve on a background thread; returns the base URL."""
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self._serve())
+            self._loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        self._started.wait()
+        return self.base_url
+
+    def stop(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tokens-per-sec", type=float, default=50)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    parser.add_argument("--script", help="JSON file with a list of replies")
+    args = parser.parse_args()
+    script = None
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+    server = StubServer(args.port, args.ttft, args.tokens_per_sec, args.failure_rate, args.reply, script=script)
+    web.run_app(server.make_app(), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()